@@ -1,9 +1,9 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser
-from django_resized import ResizedImageField
 from phonenumber_field.modelfields import PhoneNumberField
 
 from account.manages import UserManager
+from utils.choices import ImageStatus
 
 
 class User(AbstractUser):
@@ -23,9 +23,9 @@ class User(AbstractUser):
         ordering = ('-date_joined',)
 
     username = None
-    avatar = ResizedImageField( 'аватарка', size=[500, 500], crop=['middle', 'center'],
-                               upload_to='avatars/', force_format='WEBP', quality=90,
-                               null=True, blank=True)
+    avatar = models.ImageField('аватарка', upload_to='avatars/', null=True, blank=True)
+    avatar_status = models.CharField('статус обработки аватарки', choices=ImageStatus.choices,
+                                     default=ImageStatus.DONE, max_length=15, editable=False)
     phone = PhoneNumberField('номер телефона', unique=True)
     email = models.EmailField('электронная почта', blank=True, unique=True)
     role = models.CharField('роль', choices=ROLE, default=CLIENT, max_length=15)
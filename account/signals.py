@@ -0,0 +1,20 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from account.models import User
+from utils.tokens import forget_tokens
+
+
+@receiver(post_delete, sender=Token)
+def forget_deleted_token(sender, instance, **kwargs):
+    forget_tokens([instance.key])
+
+
+@receiver(post_save, sender=User)
+def forget_user_tokens(sender, instance, update_fields=None, **kwargs):
+    # last_login is updated on every login and is not used by authenticated requests
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+
+    forget_tokens(Token.objects.filter(user=instance).values_list('key', flat=True))
@@ -1,3 +1,158 @@
-from django.test import TestCase
+import pickle
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from account.models import User
+from api.auth.authentication import CachedTokenAuthentication
+from api.auth.serializers import RegisterSerializer
+from utils.cache import get_process_caches
+from utils.tokens import get_cached_token, get_token_cache_key
+
+# caches of the test process, so runs do not share state with each other and the site
+TEST_CACHES = get_process_caches('test')
+
+
+@override_settings(CACHES=TEST_CACHES)
+class TokenAuthenticationCacheTest(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(email='buyer@example.com', password='password', phone='+996555000111')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def get_token_queries(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/v1/categories/')
+        self.assertEqual(response.status_code, 200)
+        return [query for query in context.captured_queries if 'authtoken_token' in query['sql']]
+
+    def test_cached_token_does_not_query_database(self):
+        self.assertEqual(len(self.get_token_queries()), 1)
+        self.assertEqual(self.get_token_queries(), [])
+
+    def test_deleted_token_is_rejected(self):
+        self.get_token_queries()
+        self.token.delete()
+
+        self.assertEqual(self.client.get('/api/v1/categories/').status_code, 401)
+
+    def test_token_deleted_while_loaded_is_not_cached(self):
+        authentication = CachedTokenAuthentication()
+        load = TokenAuthentication.authenticate_credentials
+
+        def load_and_delete(self, key):
+            loaded = load(self, key)
+            Token.objects.filter(key=key).delete()
+            return loaded
+
+        with mock.patch.object(TokenAuthentication, 'authenticate_credentials', load_and_delete):
+            authentication.authenticate_credentials(self.token.key)
+
+        self.assertIsNone(get_cached_token(self.token.key))
+        self.assertEqual(self.client.get('/api/v1/categories/').status_code, 401)
+
+    def test_changed_user_is_reloaded(self):
+        self.get_token_queries()
+        self.user.is_active = False
+        self.user.save()
+
+        self.assertEqual(self.client.get('/api/v1/categories/').status_code, 401)
+
+    def test_password_is_not_cached(self):
+        self.get_token_queries()
+
+        self.assertNotIn(self.user.password.encode(), pickle.dumps(cache.get(get_token_cache_key(self.token.key))))
+
+        with mock.patch('rest_framework.authtoken.models.Token.objects') as objects:
+            user, token = CachedTokenAuthentication().authenticate_credentials(self.token.key)
+        objects.select_related.assert_not_called()
+
+        self.assertEqual((user.pk, user.email, token.key), (self.user.pk, self.user.email, self.token.key))
+        # deferred and loaded from the database when needed
+        self.assertTrue(user.check_password('password'))
+
+
+# passwords are checked by threads of the hashing pool, which see committed rows only
+@override_settings(CACHES=TEST_CACHES)
+class AsyncAuthViewTest(TransactionTestCase):
+
+    def setUp(self):
+        # throttled requests are counted in the cache
+        cache.clear()
+        self.user = User.objects.create_user(email='buyer@example.com', password='Secret-password-1',
+                                             phone='+996555000222')
+
+    def test_login(self):
+        response = self.client.post('/api/v1/auth/async/login/',
+                                    {'email': 'buyer@example.com', 'password': 'Secret-password-1'},
+                                    content_type='application/json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['token'], Token.objects.get(user=self.user).key)
+        self.assertEqual(response.json()['email'], 'buyer@example.com')
+
+    def test_login_with_incorrect_password(self):
+        for email, password in [('buyer@example.com', 'incorrect'), ('nobody@example.com', 'Secret-password-1')]:
+            response = self.client.post('/api/v1/auth/async/login/', {'email': email, 'password': password},
+                                        content_type='application/json')
+            self.assertEqual(response.status_code, 401)
+
+    @override_settings(AUTH_THROTTLE_RATE='2/min')
+    def test_login_is_throttled(self):
+        statuses = [
+            self.client.post('/api/v1/auth/async/login/', {'email': 'buyer@example.com', 'password': 'incorrect'},
+                             content_type='application/json').status_code
+            for _ in range(3)
+        ]
+
+        self.assertEqual(statuses, [401, 401, 429])
+
+    def test_login_with_invalid_json(self):
+        response = self.client.post('/api/v1/auth/async/login/', '{', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_register(self):
+        response = self.client.post('/api/v1/auth/async/register/', {
+            'email': 'new@example.com',
+            'phone': '+996555000333',
+            'password1': 'Secret-password-1',
+            'password2': 'Secret-password-1',
+        })
+
+        self.assertEqual(response.status_code, 200)
+        user = User.objects.get(email='new@example.com')
+        self.assertTrue(user.check_password('Secret-password-1'))
+        self.assertEqual(response.json()['token'], Token.objects.get(user=user).key)
+
+    def test_register_validation(self):
+        response = self.client.post('/api/v1/auth/async/register/', {
+            'email': 'buyer@example.com',
+            'phone': '+996555000333',
+            'password1': 'Secret-password-1',
+            'password2': 'Other-password-1',
+        }, content_type='application/json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('email', response.json())
+
+    def test_register_serializer_hashes_password(self):
+        serializer = RegisterSerializer(data={
+            'email': 'new@example.com',
+            'phone': '+996555000333',
+            'password1': 'Secret-password-1',
+            'password2': 'Secret-password-1',
+        })
+        serializer.is_valid(raise_exception=True)
+
+        # only the hash set by the async view in the context is trusted
+        user = serializer.save(password='not-a-hash')
+
+        self.assertTrue(user.check_password('Secret-password-1'))
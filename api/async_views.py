@@ -0,0 +1,113 @@
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ValidationError
+from django.http import Http404
+from django.views import View
+from rest_framework.response import Response
+
+from .views import ProductViewSet, CategoryViewSet, TagViewSet
+
+
+class AsyncApiView(View):
+    """
+    Base of native async views for ASGI, which run a DRF view of api_view_class around their handler.
+    Parsing, authentication, throttling, content negotiation and exception handling are done by the DRF view,
+    the handler awaits the database and other blocking work instead of occupying a thread.
+    """
+    api_view_class = None
+
+    def get_api_view_kwargs(self, request, *args, **kwargs):
+        return {}
+
+    def get_api_view(self, request, *args, **kwargs):
+        view = self.api_view_class(
+            args=args, kwargs=kwargs, format_kwarg=None, **self.get_api_view_kwargs(request, *args, **kwargs)
+        )
+        view.request = view.initialize_request(request, *args, **kwargs)
+        view.headers = view.default_response_headers
+        return view
+
+    def initial(self, view):
+        """
+        Runs in a thread before the handler, the returned value is passed to it.
+        """
+        view.initial(view.request)
+
+    async def handle(self, view, initial):
+        raise NotImplementedError
+
+    async def respond(self, request, *args, **kwargs):
+        view = self.get_api_view(request, *args, **kwargs)
+
+        try:
+            initial = await sync_to_async(self.initial)(view)
+            response = await self.handle(view, initial)
+        except Exception as exc:
+            response = view.handle_exception(exc)
+
+        response = view.finalize_response(view.request, response, *args, **kwargs)
+
+        # the browsable API builds forms from the database
+        if response.accepted_renderer.format == 'api':
+            await sync_to_async(response.render)()
+        else:
+            response.render()
+
+        return response
+
+
+class AsyncReadOnlyApiView(AsyncApiView):
+    """
+    Native async list and retrieve of a DRF viewset for ASGI.
+
+    Authentication, permissions, filters, eager loading, serializers and pagination are taken from the viewset.
+    Rows are fetched with the async ORM and serialized from prefetched relations only,
+    so a query missed by the eager loading fails with SynchronousOnlyOperation instead of blocking the loop.
+    Response caching and conditional GET of the viewset are not applied.
+    """
+    http_method_names = ['get', 'head', 'options']
+
+    def get_api_view_kwargs(self, request, *args, **kwargs):
+        action = 'retrieve' if kwargs else 'list'
+        return {'action_map': {'get': action, 'head': action}}
+
+    def initial(self, viewset):
+        # authentication and filter validation may query the database
+        super().initial(viewset)
+        return viewset.filter_queryset(viewset.get_queryset())
+
+    async def handle(self, viewset, queryset):
+        return await getattr(self, viewset.action)(viewset, queryset)
+
+    async def list(self, viewset, queryset):
+        page = await viewset.paginator.apaginate_queryset(queryset, viewset.request, view=viewset)
+
+        if page is None:
+            return Response(viewset.get_serializer([instance async for instance in queryset], many=True).data)
+
+        return viewset.get_paginated_response(viewset.get_serializer(page, many=True).data)
+
+    async def retrieve(self, viewset, queryset):
+        lookup_url_kwarg = viewset.lookup_url_kwarg or viewset.lookup_field
+
+        try:
+            instance = await queryset.aget(**{viewset.lookup_field: viewset.kwargs[lookup_url_kwarg]})
+        except (queryset.model.DoesNotExist, TypeError, ValueError, ValidationError):
+            raise Http404
+
+        viewset.check_object_permissions(viewset.request, instance)
+        return Response(viewset.get_serializer(instance).data)
+
+    async def get(self, request, *args, **kwargs):
+        return await self.respond(request, *args, **kwargs)
+
+
+class AsyncProductApiView(AsyncReadOnlyApiView):
+    api_view_class = ProductViewSet
+
+
+class AsyncCategoryApiView(AsyncReadOnlyApiView):
+    api_view_class = CategoryViewSet
+
+
+class AsyncTagApiView(AsyncReadOnlyApiView):
+    api_view_class = TagViewSet
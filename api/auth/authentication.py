@@ -0,0 +1,27 @@
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+from utils.tokens import cache_token, get_cached_token
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Token authentication which keeps tokens with their users in the cache for AUTH_TOKEN_CACHE_TIMEOUT seconds,
+    so authenticated requests do not query the database. Entries are removed by account.signals
+    when the token is deleted or the user is changed.
+    """
+
+    def authenticate_credentials(self, key):
+        cached = get_cached_token(key)
+
+        if cached is None:
+            user, token = super().authenticate_credentials(key)
+            cache_token(user, token)
+            return user, token
+
+        user, token = cached
+
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed('User inactive or deleted.')
+
+        return user, token
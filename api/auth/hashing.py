@@ -0,0 +1,48 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.contrib.auth import authenticate
+from django.contrib.auth.hashers import make_password
+from django.db import close_old_connections
+
+_pool = None
+
+
+def get_hashing_workers():
+    return getattr(settings, 'PASSWORD_HASHING_WORKERS', None) or os.cpu_count()
+
+
+def get_hashing_pool():
+    """
+    Threads are enough for hashing: hashlib and the argon2/bcrypt bindings release the GIL while hashing.
+    """
+    global _pool
+
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=get_hashing_workers(), thread_name_prefix='password-hashing')
+
+    return _pool
+
+
+async def run_in_hashing_pool(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(get_hashing_pool(), func, *args)
+
+
+async def amake_password(password):
+    return await run_in_hashing_pool(make_password, password)
+
+
+async def aauthenticate(request=None, **credentials):
+    """
+    Runs django.contrib.auth.authenticate in the hashing pool, so checking the password does not block the loop.
+    """
+    return await run_in_hashing_pool(partial(authenticate_in_pool, request, credentials))
+
+
+def authenticate_in_pool(request, credentials):
+    # pool threads keep their database connections between calls, like the threads of a wsgi server
+    close_old_connections()
+    return authenticate(request, **credentials)
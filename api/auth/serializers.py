@@ -56,7 +56,9 @@ class RegisterSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         password = validated_data.pop('password1')
         validated_data.pop('password2')
-        validated_data['password'] = make_password(password)
+
+        # the async view hashes the password outside of the event loop
+        validated_data['password'] = self.context.get('hashed_password') or make_password(password)
 
         return super().create(validated_data)
 
@@ -0,0 +1,15 @@
+from django.conf import settings
+from rest_framework.throttling import SimpleRateThrottle
+
+
+class AuthRateThrottle(SimpleRateThrottle):
+    """
+    Limits login and register attempts per client IP to AUTH_THROTTLE_RATE, not limited unless it is set.
+    """
+    scope = 'auth'
+
+    def get_rate(self):
+        return getattr(settings, 'AUTH_THROTTLE_RATE', None)
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {'scope': self.scope, 'ident': self.get_ident(request)}
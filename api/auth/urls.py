@@ -4,4 +4,6 @@ from . import views
 urlpatterns = [
     path('login/', views.LoginApiView.as_view()),
     path('register/', views.RegisterApiView.as_view()),
-]
\ No newline at end of file
+    path('async/login/', views.AsyncLoginApiView.as_view()),
+    path('async/register/', views.AsyncRegisterApiView.as_view()),
+]
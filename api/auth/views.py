@@ -1,4 +1,7 @@
+from asgiref.sync import sync_to_async
 from django.contrib.auth import authenticate
+from django.utils.decorators import method_decorator
+from django.views.decorators.csrf import csrf_exempt
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from rest_framework import status
@@ -7,7 +10,10 @@ from rest_framework.generics import GenericAPIView
 from rest_framework.views import APIView
 
 from account.models import User
+from api.async_views import AsyncApiView
+from api.auth.hashing import aauthenticate, amake_password
 from api.auth.serializers import LoginSerializer, ReadUserSerializer, RegisterSerializer
+from api.auth.throttling import AuthRateThrottle
 
 
 class LoginApiView(GenericAPIView):
@@ -54,3 +60,60 @@ class RegisterApiView(GenericAPIView):
         }
 
         return Response(data)
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncAuthView(AsyncApiView):
+    """
+    Base of the async variants of the auth views for ASGI, passwords are hashed in a thread pool,
+    so the event loop serves other requests meanwhile.
+    """
+    throttle_classes = [AuthRateThrottle]
+    http_method_names = ['post', 'options']
+
+    def get_api_view_kwargs(self, request, *args, **kwargs):
+        return {'throttle_classes': self.throttle_classes}
+
+    def initial(self, view):
+        # multipart data is written to temporary files
+        super().initial(view)
+        return view.request.data
+
+    async def post(self, request, *args, **kwargs):
+        return await self.respond(request, *args, **kwargs)
+
+
+class AsyncLoginApiView(AsyncAuthView):
+    api_view_class = LoginApiView
+
+    async def handle(self, view, data):
+        serializer = view.get_serializer(data=data)
+        serializer.is_valid(raise_exception=True)
+        user = await aauthenticate(view.request, **serializer.validated_data)
+
+        if not user:
+            return Response({'detail': 'The user does not exist or incorrect password.'}, status.HTTP_401_UNAUTHORIZED)
+
+        token, created = await Token.objects.aget_or_create(user=user)
+
+        user_serializer = ReadUserSerializer(user, context={'request': view.request})
+
+        return Response({**user_serializer.data, 'token': token.key})
+
+
+class AsyncRegisterApiView(AsyncAuthView):
+    api_view_class = RegisterApiView
+
+    async def handle(self, view, data):
+        serializer = view.get_serializer(data=data)
+
+        # unique validators query the database
+        await sync_to_async(serializer.is_valid)(raise_exception=True)
+
+        serializer.context['hashed_password'] = await amake_password(serializer.validated_data['password1'])
+        user = await sync_to_async(serializer.save)()
+        token = await Token.objects.acreate(user=user)
+
+        user_serializer = ReadUserSerializer(user, context={'request': view.request})
+
+        return Response({**user_serializer.data, 'token': token.key})
@@ -0,0 +1,117 @@
+from operator import attrgetter
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models.manager import BaseManager
+from rest_framework import fields, relations, serializers
+
+# fields whose to_representation is the same as a builtin for values of the matching model fields
+SIMPLE_REPRESENTATIONS = {
+    fields.CharField: str,
+    fields.EmailField: str,
+    fields.IntegerField: int,
+    fields.BooleanField: bool,
+    fields.ReadOnlyField: lambda value: value,
+}
+
+
+def get_model(serializer):
+    meta = getattr(serializer, 'Meta', None)
+    return getattr(meta, 'model', None)
+
+
+def compile_getter(field, model):
+    """
+    Returns a plain attribute getter when reading the source can not fail, otherwise the DRF one,
+    which handles dotted sources, callables, defaults and missing related objects.
+    """
+    source = field.source
+
+    if source == '*':
+        return lambda instance: instance
+
+    if model is None or '.' in source:
+        return field.get_attribute
+
+    try:
+        model_field = model._meta.get_field(source)
+    except FieldDoesNotExist:
+        is_property = isinstance(getattr(model, source, None), property)
+        return attrgetter(source) if is_property else field.get_attribute
+
+    if model_field.concrete or model_field.many_to_many or model_field.one_to_many:
+        return attrgetter(source)
+
+    return field.get_attribute
+
+
+def compile_field(field, model):
+    if isinstance(field, serializers.ListSerializer):
+        child = compile_serializer(field.child)
+
+        def represent_many(value):
+            return [child(item) for item in (value.all() if isinstance(value, BaseManager) else value)]
+
+        return compile_getter(field, model), represent_many
+
+    if isinstance(field, serializers.BaseSerializer):
+        return compile_getter(field, model), compile_serializer(field)
+
+    if isinstance(field, relations.ManyRelatedField):
+        # the DRF getter turns the related manager into a queryset
+        return field.get_attribute, field.to_representation
+
+    if type(field) is relations.PrimaryKeyRelatedField and field.pk_field is None and model is not None:
+        # the same value as the PKOnlyObject optimization of DRF
+        try:
+            model_field = model._meta.get_field(field.source)
+        except FieldDoesNotExist:
+            model_field = None
+
+        if model_field is not None and model_field.many_to_one:
+            return attrgetter(model_field.attname), lambda value: value
+
+    return compile_getter(field, model), SIMPLE_REPRESENTATIONS.get(type(field), field.to_representation)
+
+
+def compile_serializer(serializer):
+    """
+    Returns a function with the output of serializer.to_representation which reads every field
+    through a getter and a representation chosen once, instead of the generic per-field DRF path.
+    Fields of the serializer are bound to its context, so the result is valid for this instance only.
+    """
+    model = get_model(serializer)
+    accessors = [
+        (field.field_name, *compile_field(field, model))
+        for field in serializer.fields.values()
+        if not field.write_only
+    ]
+
+    def to_representation(instance):
+        ret = {}
+
+        for name, getter, represent in accessors:
+            value = getter(instance)
+            ret[name] = None if value is None else represent(value)
+
+        return ret
+
+    return to_representation
+
+
+class CompiledSerializerMixin:
+    """
+    Serializes with compile_serializer, disabled by COMPILED_SERIALIZERS = False.
+    The output is the same as of the plain serializer, only faster on large pages.
+    """
+
+    def to_representation(self, instance):
+        if not getattr(settings, 'COMPILED_SERIALIZERS', True):
+            return super().to_representation(instance)
+
+        compiled = getattr(self, '_compiled_representation', None)
+
+        if compiled is None:
+            compiled = self._compiled_representation = compile_serializer(self)
+
+        return compiled(instance)
@@ -0,0 +1,94 @@
+from django.db.models import Count, Q
+from django_filters.utils import translate_validation
+
+
+class Facet:
+    """
+    Counts the filtered products per value of a field with one aggregate query.
+    Filters named in params are not applied to the facet's own counts, so other values stay selectable.
+    """
+
+    def __init__(self, name, field, params=None):
+        self.name = name
+        self.field = field
+        self.params = params or (name,)
+
+    def count(self, queryset):
+        raise NotImplementedError
+
+
+class ValueFacet(Facet):
+    """
+    Groups by the field, labels are read from label_field or from the choices of the field.
+    """
+
+    def __init__(self, name, field, label_field=None, params=None):
+        super().__init__(name, field, params)
+        self.label_field = label_field
+
+    def count(self, queryset):
+        label_field = self.label_field or self.field
+        choices = dict(queryset.model._meta.get_field(self.field).flatchoices)
+        rows = (
+            queryset.order_by()
+            .filter(**{f'{self.field}__isnull': False})
+            .values(self.field, label_field)
+            .annotate(count=Count('pk', distinct=True))
+            .order_by('-count', self.field)
+            .values_list(self.field, label_field, 'count')
+        )
+
+        return [
+            {'value': value, 'label': choices.get(label, label), 'count': count}
+            for value, label, count in rows
+        ]
+
+
+class RangeFacet(Facet):
+    """
+    Counts ranges [bounds[i], bounds[i + 1]) of the field, the last range is open.
+    """
+
+    def __init__(self, name, field, bounds, params=None):
+        super().__init__(name, field, params)
+        self.ranges = list(zip(bounds, [*bounds[1:], None]))
+
+    def get_range_filter(self, lower, upper):
+        condition = Q(**{f'{self.field}__gte': lower})
+        if upper is not None:
+            condition &= Q(**{f'{self.field}__lt': upper})
+        return condition
+
+    def count(self, queryset):
+        counts = queryset.order_by().aggregate(**{
+            f'range_{index}': Count('pk', distinct=True, filter=self.get_range_filter(lower, upper))
+            for index, (lower, upper) in enumerate(self.ranges)
+        })
+
+        return [
+            {'min': lower, 'max': upper, 'count': counts[f'range_{index}']}
+            for index, (lower, upper) in enumerate(self.ranges)
+        ]
+
+
+def count_facets(facets, filterset):
+    """
+    Returns counts of every facet over the queryset of the filterset.
+    The filterset is validated once and its filters are applied per facet, except the facet's own.
+    """
+    if not filterset.is_valid():
+        raise translate_validation(filterset.errors)
+
+    cleaned_data = filterset.form.cleaned_data
+    result = {}
+
+    for facet in facets:
+        queryset = filterset.queryset.all()
+
+        for name, value in cleaned_data.items():
+            if name not in facet.params:
+                queryset = filterset.filters[name].filter(queryset, value)
+
+        result[facet.name] = facet.count(queryset)
+
+    return result
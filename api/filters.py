@@ -1,6 +1,9 @@
 import django_filters
+from rest_framework.filters import SearchFilter
 
 from store.models import Product
+from store.search import get_search_backend
+from .facets import ValueFacet, RangeFacet
 
 
 class ProductFilter(django_filters.FilterSet):
@@ -17,4 +20,29 @@ class ProductFilter(django_filters.FilterSet):
             'receive_type',
             'rating',
             'is_published',
-        ]
\ No newline at end of file
+        ]
+
+
+PRODUCT_FACETS = [
+    ValueFacet('category', 'category', label_field='category__name'),
+    ValueFacet('tags', 'tags', label_field='tags__name'),
+    ValueFacet('receive_type', 'receive_type'),
+    RangeFacet('rating', 'rating', bounds=(1, 2, 3, 4, 5)),
+    RangeFacet('price', 'price', bounds=(0, 1000, 5000, 10000, 50000), params=('min_price', 'max_price')),
+]
+
+
+class FullTextSearchFilter(SearchFilter):
+    """
+    Searches products through the full-text index ordered by relevance.
+    Falls back to SearchFilter when the database has no full-text index.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        search_terms = self.get_search_terms(request)
+        backend = get_search_backend()
+
+        if not search_terms or backend is None:
+            return super().filter_queryset(request, queryset, view)
+
+        return backend.search(queryset, ' '.join(search_terms))
@@ -1,6 +1,100 @@
+import hashlib
+
+from django.core.cache import cache
+from django.core.exceptions import FieldDoesNotExist
+from django.db import transaction
+from django.db.models import Prefetch, Max, Count
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework import serializers, status
+from rest_framework.exceptions import NotFound, PermissionDenied, ValidationError
 from rest_framework.generics import GenericAPIView
+from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet
 
+from utils.cache import get_generations, get_generation_entries, bump_generation, deferred_generation_bumps
+from utils.profiling import time_serializer
+from .serializers import BulkIdsSerializer, BulkPatchSerializer
+
+
+def plan_eager_loading(serializer, model, prefix=''):
+    """
+    Walks the serializer tree and collects what should be loaded together with the model.
+
+    :return: tuple of (select_related lookups, Prefetch objects, columns used by the serializer).
+             Columns are None when some field can not be mapped to a model column.
+    """
+    select_related = []
+    prefetch_related = []
+    columns = {model._meta.pk.name}
+
+    for field in serializer.fields.values():
+        if field.write_only:
+            continue
+
+        if field.source == '*' or len(field.source_attrs) != 1:
+            columns = None
+            continue
+
+        try:
+            model_field = model._meta.get_field(field.source)
+        except FieldDoesNotExist:
+            # properties can name the columns they read in Meta.source_columns
+            source_columns = getattr(getattr(serializer, 'Meta', None), 'source_columns', {}).get(field.source)
+            if source_columns is None:
+                columns = None
+            elif columns is not None:
+                columns.update(source_columns)
+            continue
+
+        lookup = f'{prefix}{field.source}'
+
+        if isinstance(field, serializers.ListSerializer) and isinstance(field.child, serializers.ModelSerializer):
+            prefetch_related.append(Prefetch(lookup, queryset=_plan_prefetch_queryset(field.child, model_field)))
+        elif isinstance(field, serializers.ManyRelatedField):
+            related_columns = ['pk', model_field.field.name] if model_field.one_to_many else ['pk']
+            queryset = model_field.related_model._default_manager.only(*related_columns)
+            prefetch_related.append(Prefetch(lookup, queryset=queryset))
+        elif isinstance(field, serializers.ModelSerializer) and (model_field.many_to_one or model_field.one_to_one):
+            nested_select, nested_prefetch, nested_columns = plan_eager_loading(
+                field, model_field.related_model, f'{lookup}__'
+            )
+            select_related.extend([lookup, *nested_select])
+            prefetch_related.extend(nested_prefetch)
+            if columns is not None and nested_columns is not None:
+                columns.add(field.source)
+                columns.update(f'{field.source}__{column}' for column in nested_columns)
+            else:
+                columns = None
+        elif model_field.concrete and not model_field.many_to_many:
+            if columns is not None:
+                columns.add(field.source)
+        else:
+            columns = None
+
+    return select_related, prefetch_related, columns
+
+
+def _plan_prefetch_queryset(serializer, relation):
+    model = serializer.Meta.model
+    select_related, prefetch_related, columns = plan_eager_loading(serializer, model)
+    queryset = model._default_manager.all()
+
+    if select_related:
+        queryset = queryset.select_related(*select_related)
+    if prefetch_related:
+        queryset = queryset.prefetch_related(*prefetch_related)
+
+    if columns is None:
+        return queryset
+
+    if relation.one_to_many:
+        # Reverse foreign key prefetch joins rows back by the child's foreign key.
+        columns.add(relation.field.name)
+
+    return queryset.only(*columns)
+
 
 class SerializerByMethodMixin:
     serializer_classes = {}
@@ -31,7 +125,16 @@ class ProGenericAPIView(SerializerByMethodMixin, PermissionByMethodMixin, Generi
 
 
 class SerializerByActionMixin:
+    """
+    Takes the serializer from serializer_classes by action.
+
+    Actions from sparse_fields_actions return only fields listed in ?fields=a,b,c. When ?fields= or ?expand= is given,
+    nested objects are replaced by their primary keys except the ones listed in ?expand=a,b.
+    """
     serializer_classes = {}
+    sparse_fields_actions = ()
+    fields_query_param = 'fields'
+    expand_query_param = 'expand'
 
     def get_serializer_class(self):
         serializer_class = self.serializer_classes.get(self.action, self.serializer_class)
@@ -43,6 +146,368 @@ class SerializerByActionMixin:
 
         return serializer_class
 
+    def get_serializer(self, *args, **kwargs):
+        return self.select_fields(super().get_serializer(*args, **kwargs))
+
+    def get_field_selection(self):
+        """
+        :return: tuple of (requested fields or None for all of them, expanded fields) or None without selection
+        """
+        params = self.request.query_params
+
+        if self.action not in self.sparse_fields_actions or \
+                (self.fields_query_param not in params and self.expand_query_param not in params):
+            return None
+
+        def parse(param):
+            return frozenset(name.strip() for name in params[param].split(',') if name.strip())
+
+        fields = parse(self.fields_query_param) if self.fields_query_param in params else None
+        expand = parse(self.expand_query_param) if self.expand_query_param in params else frozenset()
+
+        return fields, expand
+
+    def select_fields(self, serializer):
+        selection = self.get_field_selection()
+
+        if selection is None:
+            return serializer
+
+        fields, expand = selection
+        child = getattr(serializer, 'child', serializer)
+        nested = {name for name, field in child.fields.items() if isinstance(field, serializers.BaseSerializer)}
+
+        errors = {}
+        if fields is not None and fields - child.fields.keys():
+            errors[self.fields_query_param] = [f'Unknown fields: {", ".join(sorted(fields - child.fields.keys()))}']
+        if expand - nested:
+            errors[self.expand_query_param] = [f'Not expandable: {", ".join(sorted(expand - nested))}']
+        if errors:
+            raise ValidationError(errors)
+
+        for name, field in list(child.fields.items()):
+            if fields is not None and name not in fields:
+                del child.fields[name]
+            elif name in nested and name not in expand:
+                kwargs = {'many': True} if isinstance(field, serializers.ListSerializer) else {}
+                if field.source != name:
+                    kwargs['source'] = field.source
+                child.fields[name] = serializers.PrimaryKeyRelatedField(read_only=True, **kwargs)
+
+        return serializer
+
+
+class StatsSerializerMixin:
+    """
+    Serializes list and retrieve with stats_serializer_class when ?stats=true is given.
+    """
+    stats_serializer_class = None
+    stats_query_param = 'stats'
+
+    def get_serializer_class(self):
+        if self.action in ('list', 'retrieve') and \
+                self.request.query_params.get(self.stats_query_param) in ('1', 'true'):
+            return self.stats_serializer_class
+        return super().get_serializer_class()
+
+
+class EagerLoadingMixin:
+    """
+    Adds select_related/prefetch_related to the queryset according to the serializer of the current action.
+    With a field selection of SerializerByActionMixin only the selected fields are loaded
+    and the rows are narrowed to the columns they use.
+    """
+    _eager_loading_plans = {}
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        serializer_class = self.get_serializer_class()
+
+        if not issubclass(serializer_class, serializers.ModelSerializer):
+            return queryset
+
+        selection = self.get_field_selection() if hasattr(self, 'get_field_selection') else None
+
+        if selection is None:
+            plan = self._eager_loading_plans.get(serializer_class)
+
+            if plan is None:
+                select_related, prefetch_related, _ = plan_eager_loading(serializer_class(), queryset.model)
+                plan = self._eager_loading_plans[serializer_class] = (select_related, prefetch_related, None)
+        else:
+            # plans of selections are not cached, the number of combinations is not limited
+            plan = plan_eager_loading(self.select_fields(serializer_class()), queryset.model)
+
+        select_related, prefetch_related, columns = plan
+
+        if select_related:
+            queryset = queryset.select_related(*select_related)
+        if prefetch_related:
+            queryset = queryset.prefetch_related(*prefetch_related)
+        if columns is not None:
+            queryset = queryset.only(*columns, *self.get_ordering_columns(queryset.model))
+
+        return queryset
+
+    def get_ordering_columns(self, model):
+        # pagination reads values of the ordering field from the rows
+        ordering_fields = getattr(self, 'ordering_fields', None)
+        columns = list(ordering_fields) if isinstance(ordering_fields, (list, tuple)) else []
+        columns.extend(field.lstrip('-') for field in model._meta.ordering)
+        return columns
+
+
+def get_request_fingerprint(request, *extra):
+    query = sorted((key, sorted(values)) for key, values in request.query_params.lists())
+    raw_key = repr((request.scheme, request.get_host(), request.path, query, *extra))
+    return hashlib.sha1(raw_key.encode()).hexdigest()
+
+
+class ConditionalGetMixin:
+    """
+    Answers list and retrieve requests with 304 when the client already has the current version.
+    ETag is built from MAX(updated_at) and the count of rows together with generations of cache_models,
+    Last-Modified is the latest of MAX(updated_at) and the changes of cache_models,
+    so both follow deletions and changes of related objects.
+    """
+    conditional_actions = ('list', 'retrieve')
+
+    def get_conditional_queryset(self):
+        queryset = self.filter_queryset(self.get_queryset())
+
+        if self.action == 'retrieve':
+            lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+            queryset = queryset.filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+
+        return queryset.order_by()
+
+    def get_validators(self, request):
+        state = self.get_conditional_queryset().aggregate(last_modified=Max('updated_at'), count=Count('pk'))
+
+        if not state['count']:
+            return None, None
+
+        entries = get_generation_entries(getattr(self, 'cache_models', ()))
+        generations = [generation for generation, _ in entries]
+        last_modified = int(max([state['last_modified'].timestamp(), *(changed_at for _, changed_at in entries)]))
+        fingerprint = get_request_fingerprint(
+            request, request.accepted_media_type, state['last_modified'].isoformat(), state['count'], generations
+        )
+        return quote_etag(fingerprint), last_modified
+
+    def dispatch_conditional(self, handler, request, *args, **kwargs):
+        if self.action not in self.conditional_actions or request.method not in ('GET', 'HEAD'):
+            return handler(request, *args, **kwargs)
+
+        etag, last_modified = self.get_validators(request)
+
+        if etag is None:
+            return handler(request, *args, **kwargs)
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+
+        if response is None:
+            response = handler(request, *args, **kwargs)
+
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified)
+
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.dispatch_conditional(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.dispatch_conditional(super().retrieve, request, *args, **kwargs)
+
+
+class CacheResponseMixin:
+    """
+    Caches data of anonymous read responses. The cache key contains generations of cache_models,
+    so any change of these models makes cached responses unreachable.
+    """
+    cache_actions = ('list', 'retrieve')
+    cache_models = ()
+    cache_timeout = 60 * 15
+
+    def get_cache_key(self, request):
+        generations = get_generations(self.cache_models)
+        return f'api:response:{get_request_fingerprint(request, generations)}'
+
+    def should_cache_response(self, request):
+        return bool(
+            self.cache_models and
+            self.action in self.cache_actions and
+            request.method == 'GET' and
+            not request.user.is_authenticated
+        )
+
+    def dispatch_cached(self, handler, request, *args, **kwargs):
+        if not self.should_cache_response(request):
+            return handler(request, *args, **kwargs)
+
+        key = self.get_cache_key(request)
+        cached = cache.get(key)
+
+        if cached is not None:
+            data, status = cached
+            return Response(data, status=status)
+
+        response = handler(request, *args, **kwargs)
+
+        if response.status_code == 200:
+            cache.set(key, (response.data, response.status_code), self.cache_timeout)
+
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.dispatch_cached(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.dispatch_cached(super().retrieve, request, *args, **kwargs)
+
+
+class BulkUpdateDestroyMixin:
+    """
+    Updates and deletes many objects of the request user at once.
+    Ownership of all objects is checked with one query by bulk_owner_field.
+    """
+    bulk_owner_field = 'user'
+
+    def get_bulk_queryset(self):
+        return self.queryset.model._default_manager.all()
+
+    def get_owned_queryset(self, ids):
+        ids = set(ids)
+        queryset = self.get_bulk_queryset().filter(pk__in=ids)
+        owners = dict(queryset.values_list('pk', self.bulk_owner_field))
+
+        missing = ids - owners.keys()
+        if missing:
+            raise NotFound(f'Objects not found: {sorted(missing)}')
+
+        if any(owner != self.request.user.pk for owner in owners.values()):
+            raise PermissionDenied()
+
+        return queryset
+
+    def get_bulk_serializer_context(self, data):
+        return self.get_serializer_context()
+
+    def after_bulk_update(self, queryset, fields):
+        pass
+
+    def bulk_delete(self, queryset):
+        queryset.delete()
+
+    def perform_bulk_update(self, request):
+        bulk_serializer = BulkPatchSerializer(data=request.data)
+        bulk_serializer.is_valid(raise_exception=True)
+        bulk_data = bulk_serializer.validated_data
+
+        with transaction.atomic(), deferred_generation_bumps():
+            if 'items' in bulk_data:
+                queryset, fields = self.bulk_update_items(bulk_data['items'])
+            else:
+                queryset, fields = self.bulk_update_queryset(bulk_data['ids'], bulk_data['data'])
+
+            self.after_bulk_update(queryset, fields)
+            bump_generation(queryset.model)
+
+        return Response({'updated': queryset.count()})
+
+    def bulk_update_items(self, items):
+        patches = {item['id']: {key: value for key, value in item.items() if key != 'id'} for item in items}
+        queryset = self.get_owned_queryset(patches)
+        objects = queryset.in_bulk()
+
+        serializer_class = self.get_serializer_class()
+        context = self.get_bulk_serializer_context(list(patches.values()))
+        validated, errors = [], []
+
+        for pk, patch in patches.items():
+            serializer = serializer_class(objects[pk], data=patch, partial=True, context=context)
+            if serializer.is_valid():
+                validated.append((objects[pk], serializer.validated_data))
+                errors.append({})
+            else:
+                errors.append(serializer.errors)
+
+        if any(errors):
+            raise ValidationError(errors)
+
+        fields, relations = set(), {}
+
+        for instance, data in validated:
+            for attr, value in data.items():
+                if instance._meta.get_field(attr).many_to_many:
+                    relations.setdefault(attr, {})[instance.pk] = value
+                else:
+                    setattr(instance, attr, value)
+                    fields.add(attr)
+
+        if fields:
+            if hasattr(queryset.model, 'updated_at'):
+                now = timezone.now()
+                for instance, _ in validated:
+                    instance.updated_at = now
+                fields.add('updated_at')
+            queryset.model._default_manager.bulk_update(
+                [instance for instance, _ in validated], fields, batch_size=1000
+            )
+
+        for attr, values in relations.items():
+            self.bulk_set_relation(queryset.model, attr, values)
+
+        return queryset, fields | relations.keys()
+
+    def bulk_update_queryset(self, ids, data):
+        queryset = self.get_owned_queryset(ids)
+        serializer = self.get_serializer_class()(
+            data=data, partial=True, context=self.get_bulk_serializer_context([data])
+        )
+        serializer.is_valid(raise_exception=True)
+
+        values, relations = {}, {}
+
+        for attr, value in serializer.validated_data.items():
+            if queryset.model._meta.get_field(attr).many_to_many:
+                relations[attr] = dict.fromkeys(ids, value)
+            else:
+                values[attr] = value
+
+        if values:
+            if hasattr(queryset.model, 'updated_at'):
+                values['updated_at'] = timezone.now()
+            queryset.update(**values)
+
+        for attr, related in relations.items():
+            self.bulk_set_relation(queryset.model, attr, related)
+
+        return queryset, values.keys() | relations.keys()
+
+    def bulk_set_relation(self, model, attr, values):
+        field = model._meta.get_field(attr)
+        through = getattr(model, attr).through
+        source, target = field.m2m_field_name(), field.m2m_reverse_field_name()
+
+        through.objects.filter(**{f'{source}__in': values.keys()}).delete()
+        through.objects.bulk_create([
+            through(**{f'{source}_id': pk, f'{target}_id': related.pk})
+            for pk, related_objects in values.items()
+            for related in related_objects
+        ])
+
+    def perform_bulk_destroy(self, request):
+        serializer = BulkIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        with transaction.atomic(), deferred_generation_bumps():
+            self.bulk_delete(self.get_owned_queryset(serializer.validated_data['ids']))
+
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
 
 class PermissionByActionMixin:
     permission_classes_by_action = {}
@@ -60,5 +525,15 @@ class PermissionByActionMixin:
         return [permission() for permission in permission_classes]
 
 
-class ProModelViewSet(PermissionByActionMixin, SerializerByActionMixin, ModelViewSet):
+class ProfiledSerializerMixin:
+    """
+    Reports the time serializers of the view take to ProfilingMiddleware.
+    """
+
+    def get_serializer(self, *args, **kwargs):
+        return time_serializer(self.request, super().get_serializer(*args, **kwargs))
+
+
+class ProModelViewSet(PermissionByActionMixin, ProfiledSerializerMixin, SerializerByActionMixin, EagerLoadingMixin,
+                      ModelViewSet):
     pass
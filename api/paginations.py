@@ -1,8 +1,253 @@
+import base64
+import binascii
+import json
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.paginator import InvalidPage
+from django.db import connections
+from django.db.models import Q
 from rest_framework import pagination
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param, remove_query_param
 
 
 class SimplePagination(pagination.PageNumberPagination):
     page_size = 12
     page_query_param = 'page'
     page_size_query_param = 'page_size'
-    max_page_size = 100
\ No newline at end of file
+    max_page_size = 100
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """
+        paginate_queryset for async views, the count and the page are fetched with the async ORM.
+        """
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        paginator = self.django_paginator_class(queryset, page_size)
+        paginator.count = await queryset.acount()
+        page_number = self.get_page_number(request, paginator)
+
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            raise NotFound(self.invalid_page_message.format(page_number=page_number, message=str(exc)))
+
+        # iterating a queryset asynchronously fetches it together with its prefetches
+        self.page.object_list = [instance async for instance in self.page.object_list]
+
+        if paginator.num_pages > 1 and self.template is not None:
+            self.display_page_controls = True
+
+        self.request = request
+        return list(self.page)
+
+
+def estimate_count(queryset):
+    """
+    Returns the row count estimated by the query planner, databases without estimates count exactly.
+    """
+    connection = connections[queryset.db]
+
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+
+    sql, params = queryset.order_by().values('pk').query.sql_with_params()
+
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class KeysetPagination(pagination.BasePagination):
+    """
+    Paginates by the last seen (ordering value, id) pair, so deep pages cost the same as the first one.
+    The count is not calculated unless requested with ?count=exact or ?count=estimate.
+    """
+    page_size = 12
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    invalid_cursor_message = 'Invalid cursor'
+    invalid_ordering_message = 'The ordering can not be paginated by cursor, choose one with ?ordering='
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count = self.get_count(queryset, request)
+        queryset = self.get_page_queryset(queryset, request, view)
+        return self.set_page(list(queryset))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        self.count = await sync_to_async(self.get_count)(queryset, request)
+        queryset = self.get_page_queryset(queryset, request, view)
+        return self.set_page([instance async for instance in queryset])
+
+    def get_page_queryset(self, queryset, request, view):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.field, self.descending = self.get_ordering(queryset, view)
+
+        self.cursor = cursor = self.decode_cursor(request, queryset.model)
+        self.reverse = bool(cursor and cursor['r'])
+
+        # previous pages are fetched in the opposite order and flipped back
+        descending = self.descending != self.reverse
+        prefix = '-' if descending else ''
+        queryset = queryset.order_by(f'{prefix}{self.field}', f'{prefix}pk')
+
+        if cursor:
+            lookup = 'lt' if descending else 'gt'
+            queryset = queryset.filter(
+                Q(**{f'{self.field}__{lookup}': cursor['v']}) |
+                Q(**{self.field: cursor['v'], f'pk__{lookup}': cursor['i']})
+            )
+
+        return queryset[:self.page_size + 1]
+
+    def set_page(self, results):
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+
+        if self.reverse:
+            results.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, self.cursor is not None
+
+        self.page = results
+        return results
+
+    def get_page_size(self, request):
+        try:
+            return pagination._positive_int(
+                request.query_params[self.page_size_query_param],
+                strict=True,
+                cutoff=self.max_page_size
+            )
+        except (KeyError, ValueError):
+            return self.page_size
+
+    def get_ordering(self, queryset, view):
+        allowed = getattr(view, 'ordering_fields', None) or []
+        ordering = queryset.query.order_by[:1]
+
+        # the relevance of full-text search and other annotations are not stored in the cursor
+        if ordering and not (isinstance(ordering[0], str) and ordering[0].lstrip('-') in [*allowed, 'pk', 'id']):
+            raise ValidationError({self.cursor_query_param: [self.invalid_ordering_message]})
+
+        candidates = [*ordering, *queryset.query.get_meta().ordering[:1]]
+
+        for field in candidates:
+            if isinstance(field, str) and field.lstrip('-') in allowed:
+                return field.lstrip('-'), field.startswith('-')
+
+        return 'pk', False
+
+    def get_count(self, queryset, request):
+        count = request.query_params.get(self.count_query_param)
+
+        if count == 'exact':
+            return queryset.count()
+        if count == 'estimate':
+            return estimate_count(queryset)
+        return None
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+
+        if not encoded:
+            return None
+
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+            model_field = model._meta.pk if self.field == 'pk' else model._meta.get_field(self.field)
+            value = model_field.to_python(cursor['v'])
+            if value is None:
+                raise ValueError('The cursor has no value')
+            return {'v': value, 'i': int(cursor['i']), 'r': bool(cursor.get('r'))}
+        except (TypeError, ValueError, KeyError, UnicodeEncodeError, binascii.Error, DjangoValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, instance, reverse):
+        value = getattr(instance, self.field)
+        data = {'v': value.isoformat() if hasattr(value, 'isoformat') else str(value), 'i': instance.pk, 'r': reverse}
+        encoded = base64.urlsafe_b64encode(json.dumps(data).encode('ascii')).decode('ascii')
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.request.build_absolute_uri(), self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        response = {
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        }
+
+        if self.count is not None:
+            response = {'count': self.count, **response}
+
+        return Response(response)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'count': {'type': 'integer', 'example': 123},
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class CatalogPagination(SimplePagination):
+    """
+    Page number pagination, switched to keyset pagination by ?pagination=cursor or a ?cursor= parameter.
+    """
+    mode_query_param = 'pagination'
+    keyset_pagination_class = KeysetPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+
+        if request.query_params.get(self.mode_query_param) == 'cursor' or \
+                request.query_params.get(self.keyset_pagination_class.cursor_query_param):
+            self.keyset = self.keyset_pagination_class()
+            return self.keyset.paginate_queryset(queryset, request, view)
+
+        return super().paginate_queryset(queryset, request, view)
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+
+        if request.query_params.get(self.mode_query_param) == 'cursor' or \
+                request.query_params.get(self.keyset_pagination_class.cursor_query_param):
+            self.keyset = self.keyset_pagination_class()
+            return await self.keyset.apaginate_queryset(queryset, request, view)
+
+        return await super().apaginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -0,0 +1,22 @@
+from rest_framework.renderers import JSONRenderer
+
+from utils.json import JSONEncoder, dumps
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer encoding with orjson when it is installed. The output is the same,
+    indented output (e.g. for the browsable API) and non-default settings go through JSONRenderer.
+    """
+    encoder_class = JSONEncoder
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+
+        if indent is not None or self.ensure_ascii or not self.compact or not self.strict:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        return dumps(data)
@@ -1,10 +1,70 @@
 import uuid
+from urllib.parse import quote
 
+from django.conf import settings
+from django.db import transaction
+from django.urls import reverse
+from django.utils.http import RFC3986_SUBDELIMS
 from rest_framework import serializers
 
 from account.models import User
-from store.models import Tag, Category, Product, ProductImage, ProductAttribute
-from utils.main import base64_to_image_file
+from store.models import Tag, Category, Product, ProductImage, ProductAttribute, CategoryStats, TagStats
+from store.bulk import create_products
+from store.thumbnails import VARIANTS
+from utils.cache import bump_generation
+from utils.main import base64_to_temporary_file
+from .compiled import CompiledSerializerMixin
+
+
+class Base64OrFileImageField(serializers.ImageField):
+    """
+    Accepts an uploaded file (multipart) or a base64 string (JSON), the latter is decoded into a temporary file.
+    """
+
+    def to_internal_value(self, data):
+        if isinstance(data, str):
+            try:
+                data = base64_to_temporary_file(data, uuid.uuid4())
+            except (ValueError, IndexError):
+                self.fail('invalid_image')
+
+        return super().to_internal_value(data)
+
+
+class SrcsetField(serializers.ReadOnlyField):
+    """
+    Image variants in the srcset format: "<url> 150w, <url> 600w, <url> 1200w".
+    """
+
+    name_placeholder = '__name__'
+
+    def get_url_templates(self):
+        # urls of an image differ only by its quoted name, so every variant is reversed once per serializer
+        templates = getattr(self, '_url_templates', None)
+
+        if templates is None:
+            request = self.context.get('request')
+            templates = []
+
+            for variant, (width, _) in VARIANTS.items():
+                url = reverse('thumbnail', kwargs={'variant': variant, 'name': self.name_placeholder})
+                if request is not None:
+                    url = request.build_absolute_uri(url)
+                prefix, _, suffix = url.rpartition(self.name_placeholder)
+                templates.append((prefix, suffix, width))
+
+            self._url_templates = templates
+
+        return templates
+
+    def to_representation(self, value):
+        if not value:
+            return None
+
+        # quoted the same way as by reverse()
+        name = quote(value.name, safe=RFC3986_SUBDELIMS + '/~:@')
+
+        return ', '.join(f'{prefix}{name}{suffix} {width}w' for prefix, suffix, width in self.get_url_templates())
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -20,9 +80,11 @@ class UserSerializer(serializers.ModelSerializer):
 
 
 class ProductImageSerializer(serializers.ModelSerializer):
+    srcset = SrcsetField(source='image')
+
     class Meta:
         model = ProductImage
-        exclude = ('created_at', 'updated_at', 'product')
+        exclude = ('created_at', 'updated_at', 'product', 'processing_status')
 
 
 class CreateProductImageSerializer(serializers.ModelSerializer):
@@ -92,6 +154,37 @@ class TagSerializer(serializers.ModelSerializer):
         exclude = ('created_at', 'updated_at')
 
 
+class CatalogueStatsSerializer(serializers.ModelSerializer):
+    """
+    Statistics of a category or a tag, zeros for ones without products.
+    """
+
+    class Meta:
+        fields = ('product_count', 'published_count', 'min_price', 'max_price', 'avg_price', 'avg_rating')
+
+    def get_attribute(self, instance):
+        # the reverse one-to-one accessor raises an AttributeError subclass when there is no row
+        return getattr(instance, self.source, None) or self.Meta.model()
+
+
+class CategoryStatsSerializer(CatalogueStatsSerializer):
+    class Meta(CatalogueStatsSerializer.Meta):
+        model = CategoryStats
+
+
+class TagStatsSerializer(CatalogueStatsSerializer):
+    class Meta(CatalogueStatsSerializer.Meta):
+        model = TagStats
+
+
+class CategoryWithStatsSerializer(CategorySerializer):
+    stats = CategoryStatsSerializer(read_only=True)
+
+
+class TagWithStatsSerializer(TagSerializer):
+    stats = TagStatsSerializer(read_only=True)
+
+
 class DetailTagSerializer(serializers.ModelSerializer):
     class Meta:
         model = Tag
@@ -104,11 +197,12 @@ class CreateUpdateTagSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
-class ListProductSerializer(serializers.ModelSerializer):
+class ListProductSerializer(CompiledSerializerMixin, serializers.ModelSerializer):
     category = CategorySerializer()
     tags = TagSerializer(many=True)
     user = UserSerializer()
     image = serializers.ImageField()
+    image_srcset = SrcsetField(source='image')
     images = ProductImageSerializer(many=True)
 
     class Meta:
@@ -117,10 +211,13 @@ class ListProductSerializer(serializers.ModelSerializer):
             'created_at',
             'updated_at',
             'content',
+            'cover_image',
         )
+        # Product.image reads cover_image when images are not prefetched
+        source_columns = {'image': ('cover_image',)}
 
 
-class DetailProductSerializer(serializers.ModelSerializer):
+class DetailProductSerializer(CompiledSerializerMixin, serializers.ModelSerializer):
     category = CategorySerializer()
     tags = TagSerializer(many=True)
     user = UserSerializer()
@@ -130,10 +227,31 @@ class DetailProductSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Product
-        fields = '__all__'
+        exclude = ('cover_image',)
+        source_columns = {'image': ('cover_image',)}
+
+
+class PrefetchedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    Takes related objects from context['prefetched_objects'] when they are loaded there in advance.
+    """
+
+    def to_internal_value(self, data):
+        # True and 1.9 would pass int() as 1
+        if isinstance(data, (bool, float)):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+        objects = self.context.get('prefetched_objects', {}).get(self.get_queryset().model, {})
+
+        try:
+            return objects[int(data)]
+        except (KeyError, TypeError, ValueError):
+            return super().to_internal_value(data)
 
 
 class UpdateProductSerializer(serializers.ModelSerializer):
+    serializer_related_field = PrefetchedPrimaryKeyRelatedField
+
     class Meta:
         model = Product
         fields = (
@@ -154,31 +272,93 @@ class UpdateProductSerializer(serializers.ModelSerializer):
         return value
 
 
+def prefetch_product_relations(data):
+    """
+    Loads categories and tags referenced by a list of raw product data for PrefetchedPrimaryKeyRelatedField.
+    """
+    items = [item for item in data if isinstance(item, dict)]
+    category_ids = [item.get('category') for item in items]
+    tag_ids = [tag for item in items if isinstance(item.get('tags'), list) for tag in item['tags']]
+
+    def filter_ids(values):
+        return {int(value) for value in values if isinstance(value, (int, str)) and str(value).isdigit()}
+
+    return {
+        Category: Category.objects.in_bulk(filter_ids(category_ids)),
+        Tag: Tag.objects.in_bulk(filter_ids(tag_ids)),
+    }
+
+
+class BulkCreateProductListSerializer(serializers.ListSerializer):
+    """
+    Validates a list of at most BULK_CREATE_MAX_ITEMS products with categories and tags loaded in two queries
+    and creates them with one bulk insert per table.
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('max_length', getattr(settings, 'BULK_CREATE_MAX_ITEMS', 1000))
+        super().__init__(*args, **kwargs)
+
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            self.context['prefetched_objects'] = prefetch_product_relations(data)
+        return super().to_internal_value(data)
+
+    def create(self, validated_data):
+        user = self.context['request'].user
+        image_field = ProductImage._meta.get_field('image')
+        items, stored_names = [], []
+
+        try:
+            for item in validated_data:
+                product_tags = item.pop('tags')
+                product_attributes = item.pop('attributes')
+                image_names = []
+
+                for file_image in item.pop('images'):
+                    name = image_field.generate_filename(None, file_image.name)
+                    image_names.append(image_field.storage.save(name, file_image))
+                    stored_names.append(image_names[-1])
+                    file_image.close()
+
+                items.append((
+                    Product(**item, user=user),
+                    [tag.pk for tag in product_tags],
+                    [ProductAttribute(**attribute) for attribute in product_attributes],
+                    image_names,
+                ))
+
+            with transaction.atomic():
+                products = create_products(items)
+        except BaseException:
+            # no rows refer to the stored files after the rollback
+            for name in stored_names:
+                image_field.storage.delete(name)
+            raise
+
+        bump_generation(Product, ProductAttribute, ProductImage)
+
+        return products
+
+
 class CreateProductSerializer(serializers.ModelSerializer):
+    serializer_related_field = PrefetchedPrimaryKeyRelatedField
+
     attributes = ProductAttributeSerializer(many=True)
-    images = serializers.ListSerializer(child=serializers.CharField())
+    images = serializers.ListField(write_only=True, child=Base64OrFileImageField(
+        error_messages={'invalid_image': 'Загрузите корректное изображение'}
+    ))
 
     class Meta:
         model = Product
-        exclude = ('user',)
+        exclude = ('user', 'cover_image')
+        list_serializer_class = BulkCreateProductListSerializer
 
     def create(self, validated_data):
-        images = validated_data.pop('images')
+        file_images = validated_data.pop('images')
         attributes = validated_data.pop('attributes')
         tags = validated_data.pop('tags')
 
-        file_images = []
-
-        for image in images:
-            try:
-                file = base64_to_image_file(image, uuid.uuid4())
-                file_images.append(file)
-            except Exception as e:
-                print(e)
-                raise serializers.ValidationError(
-                    {'images': ['Загрузите корректное изображение']}
-                )
-
         validated_data['user'] = self.context['request'].user
 
         product = super().create(validated_data)
@@ -188,8 +368,61 @@ class CreateProductSerializer(serializers.ModelSerializer):
             ProductAttribute.objects.create(**attribute, product=product)
 
         for file_image in file_images:
-            product_image = ProductImage.objects.create(product=product)
+            product_image = ProductImage(product=product)
             product_image.image.save(file_image.name, file_image)
-            product_image.save()
+            file_image.close()
 
         return product
+
+
+def validate_unique_ids(ids):
+    """
+    Rejects repeated ids, the count of owned objects would not show them.
+    """
+    seen, duplicates = set(), set()
+
+    for pk in ids:
+        (duplicates if pk in seen else seen).add(pk)
+
+    if duplicates:
+        raise serializers.ValidationError(f'Duplicate ids: {sorted(duplicates)}')
+
+    return ids
+
+
+class BulkIdsSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1), allow_empty=False, max_length=10000)
+
+    def validate_ids(self, ids):
+        return validate_unique_ids(ids)
+
+
+class BulkPatchSerializer(serializers.Serializer):
+    """
+    Either the same data for all ids or a list of patches with ids.
+    """
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1), allow_empty=False, max_length=10000,
+                                required=False)
+    data = serializers.DictField(required=False)
+    items = serializers.ListField(child=serializers.DictField(), allow_empty=False, max_length=10000,
+                                  required=False)
+
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            data = {'items': data}
+        return super().to_internal_value(data)
+
+    def validate_items(self, items):
+        for item in items:
+            if not isinstance(item.get('id'), int) or isinstance(item.get('id'), bool):
+                raise serializers.ValidationError('Every item should have an integer id')
+        validate_unique_ids([item['id'] for item in items])
+        return items
+
+    def validate_ids(self, ids):
+        return validate_unique_ids(ids)
+
+    def validate(self, attrs):
+        if 'items' not in attrs and not ('ids' in attrs and 'data' in attrs):
+            raise serializers.ValidationError('Send a list of patches or ids with data')
+        return attrs
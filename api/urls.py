@@ -1,7 +1,7 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .yasg import urlpatterns as url_doc
-from . import views
+from . import views, async_views
 
 router = DefaultRouter()
 router.register('products', views.ProductViewSet)
@@ -12,6 +12,14 @@ router.register('tags', views.TagViewSet)
 
 urlpatterns = [
     path('auth/', include('api.auth.urls')),
+    path('async/products/', async_views.AsyncProductApiView.as_view()),
+    path('async/products/<int:id>/', async_views.AsyncProductApiView.as_view()),
+    path('async/categories/', async_views.AsyncCategoryApiView.as_view()),
+    path('async/categories/<int:id>/', async_views.AsyncCategoryApiView.as_view()),
+    path('async/tags/', async_views.AsyncTagApiView.as_view()),
+    path('async/tags/<int:id>/', async_views.AsyncTagApiView.as_view()),
+    path('profiling/', views.ProfilingReportApiView.as_view()),
+    path('thumbnails/<str:variant>/<path:name>', views.ThumbnailApiView.as_view(), name='thumbnail'),
     path('', include(router.urls))
 ]
 
@@ -1,17 +1,35 @@
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, StreamingHttpResponse
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import SearchFilter, OrderingFilter
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.mixins import DestroyModelMixin, CreateModelMixin, UpdateModelMixin
 from rest_framework.permissions import IsAuthenticatedOrReadOnly, AllowAny, IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
 from rest_framework.viewsets import GenericViewSet
 
-from store.models import Tag, Category, Product, ProductImage, ProductAttribute
-from .filters import ProductFilter
-from .mixins import ProModelViewSet, PermissionByActionMixin, SerializerByActionMixin
-from .paginations import SimplePagination
+from account.models import User
+from store.models import Tag, Category, Product, ProductImage, ProductAttribute, CategoryStats, TagStats
+from store.covers import deferred_cover_updates
+from store.exports import EXPORT_FORMATS, iter_products
+from store.search import index_products, remove_products
+from store.signals import bulk_product_deletion
+from store.stats import PRODUCT_STATS_FIELDS, refresh_stats, deferred_stats_refresh, get_stats_scope
+from store.thumbnails import get_thumbnail_path, BrokenImageError
+from utils.profiling import get_report, clear_records
+from .facets import count_facets
+from .filters import ProductFilter, FullTextSearchFilter, PRODUCT_FACETS
+from .mixins import ProModelViewSet, PermissionByActionMixin, SerializerByActionMixin, CacheResponseMixin, \
+    ConditionalGetMixin, BulkUpdateDestroyMixin, StatsSerializerMixin
+from .paginations import CatalogPagination
 from .permissions import IsOwnerOrReadOnly, IsOwner, IsOwnerProduct, IsSuperuser
 from .serializers import CategorySerializer, TagSerializer, CreateProductAttributeSerializer, \
     UpdateProductAttributeSerializer, CreateProductImageSerializer, ListProductSerializer, \
-    CreateProductSerializer, DetailProductSerializer, UpdateProductSerializer
+    CreateProductSerializer, DetailProductSerializer, UpdateProductSerializer, prefetch_product_relations, \
+    CategoryWithStatsSerializer, TagWithStatsSerializer
 
 filtering = [
     SearchFilter,
@@ -20,12 +38,12 @@ filtering = [
 ]
 
 
-class ProductViewSet(ProModelViewSet):
+class ProductViewSet(ConditionalGetMixin, CacheResponseMixin, BulkUpdateDestroyMixin, ProModelViewSet):
     queryset = Product.objects.all()
     permission_classes = [IsAuthenticatedOrReadOnly, IsOwnerOrReadOnly]
     lookup_field = 'id'
     filter_backends = [
-        SearchFilter,
+        FullTextSearchFilter,
         DjangoFilterBackend,
         OrderingFilter,
     ]
@@ -35,22 +53,105 @@ class ProductViewSet(ProModelViewSet):
     serializer_classes = {
         'list': ListProductSerializer,
         'create': CreateProductSerializer,
+        'bulk_create': CreateProductSerializer,
         'retrieve': DetailProductSerializer,
         'update': UpdateProductSerializer,
+        'bulk_update': UpdateProductSerializer,
     }
     permission_classes_by_action = {
         'list': [AllowAny],
         'retrieve': [AllowAny],
         'create': [IsAuthenticated],
+        'bulk_create': [IsAuthenticated],
         'update': [IsAuthenticated, IsOwner],
+        'bulk_update': [IsAuthenticated],
         'destroy': [IsAuthenticated, IsOwner],
-
+        'bulk_destroy': [IsAuthenticated],
+        'export': [IsAuthenticated],
+        'facets': [AllowAny],
     }
-    pagination_class = SimplePagination
+    pagination_class = CatalogPagination
+    sparse_fields_actions = ('list', 'retrieve')
+    cache_actions = ('list', 'retrieve', 'facets')
+    cache_models = (Product, Category, Tag, ProductImage, ProductAttribute, User)
+
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk_create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        products = serializer.save()
+
+        return Response({'ids': [product.id for product in products]}, status=status.HTTP_201_CREATED)
+
+    @bulk_create.mapping.patch
+    def bulk_update(self, request, *args, **kwargs):
+        return self.perform_bulk_update(request)
+
+    @bulk_create.mapping.delete
+    def bulk_destroy(self, request, *args, **kwargs):
+        return self.perform_bulk_destroy(request)
+
+    @action(detail=False, methods=['get'])
+    def export(self, request, *args, **kwargs):
+        export_format = request.query_params.get('type', 'jsonl')
+
+        if export_format not in EXPORT_FORMATS:
+            raise ValidationError({'type': [f'Choose one of: {", ".join(EXPORT_FORMATS)}']})
+
+        iter_format, content_type = EXPORT_FORMATS[export_format]
+        # the serializer based query planning of get_queryset is not needed here
+        queryset = self.filter_queryset(self.queryset.all())
+        rows = iter_products(queryset, build_url=request.build_absolute_uri)
+
+        response = StreamingHttpResponse(iter_format(rows), content_type=f'{content_type}; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="products.{export_format}"'
+        return response
+
+    @action(detail=False, methods=['get'])
+    def facets(self, request, *args, **kwargs):
+        return self.dispatch_cached(self.count_facets, request, *args, **kwargs)
+
+    def count_facets(self, request, *args, **kwargs):
+        queryset = FullTextSearchFilter().filter_queryset(request, self.queryset.all(), self)
+        filterset = self.filterset_class(request.query_params, queryset=queryset, request=request)
+        return Response(count_facets(PRODUCT_FACETS, filterset))
+
+    def get_bulk_serializer_context(self, data):
+        return {**self.get_serializer_context(), 'prefetched_objects': prefetch_product_relations(data)}
+
+    def get_owned_queryset(self, ids):
+        queryset = super().get_owned_queryset(ids)
+        # categories and tags the products leave are refreshed too
+        refresh_stats(*get_stats_scope(queryset))
+        return queryset
+
+    def perform_bulk_update(self, request):
+        with deferred_stats_refresh():
+            return super().perform_bulk_update(request)
+
+    def perform_bulk_destroy(self, request):
+        with deferred_stats_refresh():
+            return super().perform_bulk_destroy(request)
+
+    def bulk_delete(self, queryset):
+        # statistics of the scope are refreshed by get_owned_queryset, the index rows are removed with one query
+        ids = list(queryset.values_list('pk', flat=True))
+
+        with bulk_product_deletion():
+            queryset.delete()
+
+        remove_products(ids)
+
+    def after_bulk_update(self, queryset, fields):
+        if {'name', 'description', 'content'} & set(fields):
+            index_products(list(queryset.only('id', 'name', 'description', 'content')))
+        if {*PRODUCT_STATS_FIELDS, 'tags'} & set(fields):
+            refresh_stats(*get_stats_scope(queryset))
 
 
 class ImageViewSet(
     PermissionByActionMixin,
+    BulkUpdateDestroyMixin,
     CreateModelMixin,
     DestroyModelMixin,
     GenericViewSet,
@@ -60,12 +161,24 @@ class ImageViewSet(
     permission_classes_by_action = {
         'create': [IsAuthenticated],
         'destroy': [IsAuthenticated, IsOwnerProduct],
+        'bulk_destroy': [IsAuthenticated],
     }
+    bulk_owner_field = 'product__user'
+
+    @action(detail=False, methods=['delete'], url_path='bulk')
+    def bulk_destroy(self, request, *args, **kwargs):
+        return self.perform_bulk_destroy(request)
+
+    def perform_bulk_destroy(self, request):
+        # one cover update per affected product instead of one per deleted image
+        with deferred_cover_updates():
+            return super().perform_bulk_destroy(request)
 
 
 class AttributeViewSet(
     SerializerByActionMixin,
     PermissionByActionMixin,
+    BulkUpdateDestroyMixin,
     CreateModelMixin,
     UpdateModelMixin,
     DestroyModelMixin,
@@ -76,22 +189,37 @@ class AttributeViewSet(
     serializer_classes = {
         'create': CreateProductAttributeSerializer,
         'update': UpdateProductAttributeSerializer,
+        'bulk_update': UpdateProductAttributeSerializer,
     }
     permission_classes_by_action = {
         'create': [IsAuthenticated],
         'update': [IsAuthenticated, IsOwnerProduct],
+        'bulk_update': [IsAuthenticated],
         'destroy': [IsAuthenticated, IsOwnerProduct],
+        'bulk_destroy': [IsAuthenticated],
     }
+    bulk_owner_field = 'product__user'
+
+    @action(detail=False, methods=['patch'], url_path='bulk')
+    def bulk_update(self, request, *args, **kwargs):
+        return self.perform_bulk_update(request)
 
+    @bulk_update.mapping.delete
+    def bulk_destroy(self, request, *args, **kwargs):
+        return self.perform_bulk_destroy(request)
 
-class CategoryViewSet(ProModelViewSet):
-    queryset = Category.objects.all()
+
+class CategoryViewSet(ConditionalGetMixin, CacheResponseMixin, StatsSerializerMixin, ProModelViewSet):
+    # pages of an unordered queryset are not stable
+    queryset = Category.objects.order_by('id')
     lookup_field = 'id'
     filter_backends = filtering
     ordering_fields = ['name', 'created_at']
     search_fields = ['name']
-    pagination_class = SimplePagination
-    serializer_class = CategorySerializer,
+    pagination_class = CatalogPagination
+    serializer_class = CategorySerializer
+    stats_serializer_class = CategoryWithStatsSerializer
+    cache_models = (Category, CategoryStats)
     permission_classes_by_action = {
         'list': [AllowAny],
         'retrieve': [AllowAny],
@@ -101,14 +229,16 @@ class CategoryViewSet(ProModelViewSet):
     }
 
 
-class TagViewSet(ProModelViewSet):
-    queryset = Tag.objects.all()
+class TagViewSet(ConditionalGetMixin, CacheResponseMixin, StatsSerializerMixin, ProModelViewSet):
+    queryset = Tag.objects.order_by('id')
     lookup_field = 'id'
     filter_backends = filtering
     ordering_fields = ['name', 'created_at']
     search_fields = ['name']
-    pagination_class = SimplePagination
+    pagination_class = CatalogPagination
     serializer_class = TagSerializer
+    stats_serializer_class = TagWithStatsSerializer
+    cache_models = (Tag, TagStats)
     permission_classes_by_action = {
         'list': [AllowAny],
         'retrieve': [AllowAny],
@@ -116,3 +246,29 @@ class TagViewSet(ProModelViewSet):
         'update': [IsAuthenticated, IsSuperuser],
         'destroy': [IsAuthenticated, IsSuperuser],
     }
+
+
+class ThumbnailApiView(APIView):
+    permission_classes = [AllowAny]
+
+    def get(self, request, variant, name):
+        try:
+            path = get_thumbnail_path(name, variant)
+        except (FileNotFoundError, SuspiciousFileOperation, BrokenImageError):
+            raise Http404
+
+        response = FileResponse(open(path, 'rb'), content_type='image/webp')
+        # the url stays the same when the image is replaced under its name
+        response['Cache-Control'] = 'public, max-age=86400'
+        return response
+
+
+class ProfilingReportApiView(APIView):
+    permission_classes = [IsAuthenticated, IsSuperuser]
+
+    def get(self, request):
+        return Response(get_report())
+
+    def delete(self, request):
+        clear_records()
+        return Response(status=status.HTTP_204_NO_CONTENT)
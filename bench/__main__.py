@@ -0,0 +1,72 @@
+"""
+Benchmarks of the API against a generated catalogue.
+
+    python -m bench run --products 10000 --output results.json
+    python -m bench compare baseline.json results.json
+    python -m bench list
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m bench')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='Generates a catalogue and runs the benchmarks')
+    run_parser.add_argument('--products', type=int, default=10000, help='10000, 100000 or 1000000 for example')
+    run_parser.add_argument('--seed', type=int, default=0)
+    run_parser.add_argument('--repeat', type=int, default=20)
+    run_parser.add_argument('--warmup', type=int, default=2)
+    run_parser.add_argument('--only', help='Comma separated names of the benchmarks to run')
+    run_parser.add_argument('--keepdb', action='store_true',
+                            help='Keeps the database for the next run with the same number of products')
+    run_parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'market-bench'),
+                            help='Directory of the SQLite database and media files')
+    run_parser.add_argument('--output', help='Path of the JSON results')
+
+    compare_parser = commands.add_parser('compare', help='Compares median times of two results')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=0.1,
+                                help='Slowdown share reported as a regression, the exit code is 1 when there is one')
+
+    commands.add_parser('list', help='Lists the benchmarks')
+
+    args = parser.parse_args()
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project.settings')
+    import django
+    django.setup()
+
+    from . import runner
+    from .benchmarks import BENCHMARKS
+
+    if args.command == 'list':
+        print('\n'.join(BENCHMARKS))
+        return 0
+
+    if args.command == 'compare':
+        rows, regressions = runner.compare(runner.load(args.baseline), runner.load(args.current), args.threshold)
+
+        print(f'{"benchmark":32} {"baseline ms":>12} {"current ms":>12} {"ratio":>7}')
+        for name, baseline, current, ratio in rows:
+            mark = '  slower' if name in regressions else ''
+            print(f'{name:32} {baseline:12.3f} {current:12.3f} {ratio:7.2f}{mark}')
+
+        return 1 if regressions else 0
+
+    names = [name.strip() for name in args.only.split(',')] if args.only else None
+    results = runner.run(args.products, seed=args.seed, repeat=args.repeat, warmup=args.warmup, names=names,
+                         data_dir=args.data_dir, keepdb=args.keepdb)
+
+    if args.output:
+        runner.save(results, args.output)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
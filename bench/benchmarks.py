@@ -0,0 +1,288 @@
+import asyncio
+import base64
+import io
+import random
+from unittest import mock
+
+from django.test import AsyncClient, RequestFactory, override_settings
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from account.models import User
+from api.auth.hashing import get_hashing_workers
+from api.mixins import plan_eager_loading
+from api.renderers import FastJSONRenderer
+from api.serializers import ListProductSerializer
+from store.exports import iter_products
+from store.imports import CatalogueImporter
+from store.models import Product
+from .fixtures import PASSWORD, NOUNS
+
+BENCHMARKS = {}
+
+
+class Benchmark:
+    """
+    :param setup: Called with the context once, returns the measured operation
+    :param items: The number of rows or requests handled by one operation, for the throughput
+    :param rollback: Whether the operation writes, it is run in a transaction rolled back afterwards
+    :param memory: Whether the peak of Python allocations is measured
+    :param rss: Whether the peak RSS of one operation is measured in a process of its own
+    :param queries: Whether the queries are counted, queries of other threads are not visible
+    :param workers: Returns the number of threads doing the work, for the throughput per worker
+    """
+
+    def __init__(self, name, setup, items=1, rollback=False, memory=False, rss=False, queries=True, workers=None):
+        self.name = name
+        self.setup = setup
+        self.items = items
+        self.rollback = rollback
+        self.memory = memory
+        self.rss = rss
+        self.queries = queries
+        self.workers = workers
+
+
+def benchmark(name, **options):
+    def decorator(setup):
+        BENCHMARKS[name] = Benchmark(name, setup, **options)
+        return setup
+
+    return decorator
+
+
+def create_image_data_uri(size=(64, 64), seed=None):
+    """
+    A solid image, or a noise one of the same size every time for a seed, which does not compress like photos.
+    """
+    if seed is None:
+        image = Image.new('RGB', size, (200, 40, 40))
+    else:
+        image = Image.frombytes('RGB', size, random.Random(seed).randbytes(size[0] * size[1] * 3))
+
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=90)
+    return 'data:image/jpeg;base64,' + base64.b64encode(buffer.getvalue()).decode()
+
+
+class BenchmarkContext:
+    """
+    Clients and objects of the generated catalogue the benchmarks are run against.
+
+    :param images_dir: Media directory of the generated catalogue, the source of imported images
+    """
+
+    def __init__(self, images_dir):
+        self.images_dir = images_dir
+        self.user = User.objects.filter(email__endswith='@bench.example.com').order_by('pk').first()
+        self.token = Token.objects.get_or_create(user=self.user)[0]
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.anonymous_client = APIClient()
+
+        count = Product.objects.count()
+        self.product = Product.objects.order_by('pk')[count // 2]
+        self.category = self.product.category
+        self.search = NOUNS[0]
+        self.image = create_image_data_uri()
+
+    def check(self, response, status=200):
+        if response.status_code != status:
+            raise RuntimeError(f'{response.status_code} instead of {status}: {response.content[:500]!r}')
+
+        # streamed responses query the database while they are consumed
+        if response.streaming:
+            b''.join(response.streaming_content)
+
+        return response
+
+    def get(self, url, client=None, **params):
+        return self.check((client or self.client).get(url, params))
+
+    def post(self, url, data, status=201):
+        return self.check(self.client.post(url, data, format='json'), status)
+
+    def get_product_data(self, index=0, images=None):
+        return {
+            'name': f'Товар бенчмарка {index}',
+            'description': 'Описание',
+            'content': 'Контент',
+            'category': self.category.pk,
+            'tags': list(self.product.tags.values_list('pk', flat=True)),
+            'price': '100.00',
+            'rating': '4.5',
+            'attributes': [{'name': 'Цвет', 'value': 'Синий'}],
+            'images': images or [self.image],
+        }
+
+    def get_page(self, size=100):
+        serializer = ListProductSerializer()
+        select_related, prefetch_related, _ = plan_eager_loading(serializer, Product)
+        return list(Product.objects.select_related(*select_related).prefetch_related(*prefetch_related)[:size])
+
+    def get_serializer_context(self):
+        return {'request': RequestFactory().get('/api/v1/products/')}
+
+
+@benchmark('products.list')
+def products_list(context):
+    return lambda: context.get('/api/v1/products/')
+
+
+@benchmark('products.list.page_100', items=100)
+def products_list_page_100(context):
+    return lambda: context.get('/api/v1/products/', page_size=100)
+
+
+@benchmark('products.list.cached')
+def products_list_cached(context):
+    # anonymous responses are cached, the warmup fills the cache
+    return lambda: context.get('/api/v1/products/', client=context.anonymous_client)
+
+
+@benchmark('products.list.cursor')
+def products_list_cursor(context):
+    return lambda: context.get('/api/v1/products/', pagination='cursor', ordering='price')
+
+
+@benchmark('products.list.sparse', items=100)
+def products_list_sparse(context):
+    return lambda: context.get('/api/v1/products/', page_size=100, fields='id,name,price,image')
+
+
+@benchmark('products.search')
+def products_search(context):
+    return lambda: context.get('/api/v1/products/', search=context.search)
+
+
+@benchmark('products.filter')
+def products_filter(context):
+    return lambda: context.get(
+        '/api/v1/products/', category=context.category.pk, min_price=1000, max_price=50000,
+        receive_type=Product.IN_STOCK, ordering='-rating',
+    )
+
+
+@benchmark('products.detail')
+def products_detail(context):
+    return lambda: context.get(f'/api/v1/products/{context.product.pk}/')
+
+
+@benchmark('products.facets')
+def products_facets(context):
+    return lambda: context.get('/api/v1/products/facets/')
+
+
+@benchmark('products.facets.filtered')
+def products_facets_filtered(context):
+    return lambda: context.get('/api/v1/products/facets/', category=context.category.pk, min_price=1000)
+
+
+@benchmark('categories.list.stats', items=100)
+def categories_list_stats(context):
+    return lambda: context.get('/api/v1/categories/', page_size=100, stats='true')
+
+
+@benchmark('products.create', rollback=True, memory=True)
+def products_create(context):
+    data = context.get_product_data()
+    return lambda: context.post('/api/v1/products/', data)
+
+
+@benchmark('products.create.10_images', rollback=True, memory=True, rss=True)
+def products_create_10_images(context):
+    images = [create_image_data_uri((1200, 1200), seed) for seed in range(10)]
+    data = context.get_product_data(images=images)
+    return lambda: context.post('/api/v1/products/', data)
+
+
+@benchmark('products.bulk_create', items=100, rollback=True, memory=True)
+def products_bulk_create(context):
+    data = [context.get_product_data(index) for index in range(100)]
+    return lambda: context.post('/api/v1/products/bulk/', data)
+
+
+@benchmark('products.export', memory=True)
+def products_export(context):
+    return lambda: context.get('/api/v1/products/export/', type='jsonl', category=context.category.pk)
+
+
+@benchmark('catalogue.import', items=1000, rollback=True, memory=True)
+def catalogue_import(context):
+    ids = list(Product.objects.order_by('pk').values_list('pk', flat=True)[:1000])
+    rows = list(iter_products(Product.objects.filter(pk__in=ids), build_url=lambda url: f'http://testserver{url}'))
+
+    def operation():
+        importer = CatalogueImporter(context.user, context.images_dir)
+        importer.import_rows(rows)
+
+    return operation
+
+
+@benchmark('auth.token')
+def auth_token(context):
+    # the smallest authenticated page, most of the time is authentication
+    return lambda: context.get('/api/v1/tags/', page_size=1)
+
+
+@benchmark('auth.token.uncached')
+def auth_token_uncached(context):
+    # the baseline of auth.token, the token and the user are queried on every request
+    def operation():
+        with mock.patch('api.auth.authentication.get_cached_token', return_value=None), \
+                mock.patch('api.auth.authentication.cache_token'):
+            return context.get('/api/v1/tags/', page_size=1)
+
+    return operation
+
+
+@benchmark('auth.login')
+def auth_login(context):
+    data = {'email': context.user.email, 'password': PASSWORD}
+    return lambda: context.post('/api/v1/auth/login/', data, status=200)
+
+
+@benchmark('auth.login.async', items=8, queries=False, workers=get_hashing_workers)
+def auth_login_async(context):
+    data = {'email': context.user.email, 'password': PASSWORD}
+
+    async def login():
+        client = AsyncClient()
+        return await client.post('/api/v1/auth/async/login/', data, content_type='application/json')
+
+    async def operation():
+        for response in await asyncio.gather(*(login() for _ in range(8))):
+            context.check(response)
+
+    return lambda: asyncio.run(operation())
+
+
+@benchmark('serialize.products.compiled', items=100)
+def serialize_products_compiled(context):
+    products, serializer_context = context.get_page(), context.get_serializer_context()
+    return lambda: ListProductSerializer(products, many=True, context=serializer_context).data
+
+
+@benchmark('serialize.products.plain', items=100)
+def serialize_products_plain(context):
+    products, serializer_context = context.get_page(), context.get_serializer_context()
+
+    def operation():
+        with override_settings(COMPILED_SERIALIZERS=False):
+            return ListProductSerializer(products, many=True, context=serializer_context).data
+
+    return operation
+
+
+@benchmark('render.products.fast', items=100)
+def render_products_fast(context):
+    data = ListProductSerializer(context.get_page(), many=True, context=context.get_serializer_context()).data
+    return lambda: FastJSONRenderer().render(data)
+
+
+@benchmark('render.products.plain', items=100)
+def render_products_plain(context):
+    data = ListProductSerializer(context.get_page(), many=True, context=context.get_serializer_context()).data
+    return lambda: JSONRenderer().render(data)
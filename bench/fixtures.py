@@ -0,0 +1,149 @@
+import io
+import random
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image
+
+from account.models import User
+from store.models import Category, Tag, Product, ProductImage, ProductAttribute
+from store.search import create_search_index, rebuild_search_index
+from store.stats import rebuild_stats
+from utils.cache import bump_generation
+from utils.choices import ImageStatus
+
+PASSWORD = 'bench-password'
+
+NOUNS = ['телефон', 'ноутбук', 'чехол', 'наушники', 'куртка', 'футболка', 'кроссовки', 'рюкзак', 'часы', 'лампа',
+         'кресло', 'стол', 'чайник', 'пылесос', 'монитор', 'клавиатура', 'сумка', 'шапка', 'плед', 'кружка']
+ADJECTIVES = ['новый', 'лёгкий', 'тёплый', 'быстрый', 'тихий', 'большой', 'компактный', 'яркий', 'прочный', 'мягкий']
+COLORS = ['Красный', 'Синий', 'Чёрный', 'Белый', 'Зелёный', 'Серый']
+MATERIALS = ['Хлопок', 'Пластик', 'Металл', 'Дерево', 'Кожа']
+# 3.3 is rejected by example_validation
+RATINGS = [Decimal(value) / 10 for value in range(10, 51) if value != 33]
+IMAGE_COLORS = [(200, 40, 40), (40, 160, 60), (40, 80, 200), (230, 200, 40), (120, 120, 120), (20, 20, 20)]
+
+
+def get_scale(products):
+    """
+    :return: the numbers of users, categories and tags generated together with the products
+    """
+    return {
+        'products': products,
+        'users': max(10, products // 100),
+        'categories': max(10, min(500, products // 1000)),
+        'tags': max(30, min(2000, products // 500)),
+    }
+
+
+def create_image_files():
+    """
+    Stores small PNG images shared by all generated products and returns their names.
+    """
+    names = []
+
+    for index, color in enumerate(IMAGE_COLORS):
+        name = f'product_images/bench-{index}.png'
+
+        if not default_storage.exists(name):
+            buffer = io.BytesIO()
+            Image.new('RGB', (64, 64), color).save(buffer, 'PNG')
+            default_storage.save(name, ContentFile(buffer.getvalue()))
+
+        names.append(name)
+
+    return names
+
+
+def iter_batches(count, batch_size):
+    for start in range(0, count, batch_size):
+        yield range(start, min(start + batch_size, count))
+
+
+def generate_catalogue(products, seed=0, batch_size=5000):
+    """
+    Generates the same catalogue for the same arguments with bulk_create, in batches of batch_size products.
+    Search index, statistics and cache generations are rebuilt once at the end, as bulk_create sends no signals.
+    """
+    rng = random.Random(seed)
+    scale = get_scale(products)
+    # one hash for every user, hashing is the slowest part of creating users
+    password = make_password(PASSWORD, salt='bench')
+
+    with transaction.atomic():
+        users = User.objects.bulk_create([
+            User(email=f'user{index}@bench.example.com', phone=f'+99670{index:07d}', password=password,
+                 first_name='Продавец', last_name=str(index))
+            for index in range(scale['users'])
+        ])
+        categories = Category.objects.bulk_create([
+            Category(name=f'Категория {index}') for index in range(scale['categories'])
+        ])
+        tags = Tag.objects.bulk_create([
+            Tag(name=f'{rng.choice(ADJECTIVES)} {index}') for index in range(scale['tags'])
+        ])
+
+    image_names = create_image_files()
+    receive_types = [value for value, _ in Product.RECEIVE_TYPE]
+
+    for batch in iter_batches(products, batch_size):
+        items = []
+
+        for index in batch:
+            noun, adjective = rng.choice(NOUNS), rng.choice(ADJECTIVES)
+            image_name = rng.choice(image_names)
+            product = Product(
+                name=f'{adjective.capitalize()} {noun} {index}',
+                description=f'{adjective.capitalize()} {noun} для дома и работы',
+                content=' '.join(rng.choice(NOUNS + ADJECTIVES) for _ in range(40)),
+                category=rng.choice(categories),
+                price=Decimal(rng.randint(100, 10000000)) / 100,
+                user=rng.choice(users),
+                receive_type=rng.choice(receive_types),
+                rating=rng.choice(RATINGS),
+                is_published=rng.random() < 0.9,
+                cover_image=image_name,
+            )
+            items.append((product, rng.sample(tags, 3), image_name))
+
+        with transaction.atomic():
+            Product.objects.bulk_create([product for product, *_ in items])
+            Product.tags.through.objects.bulk_create([
+                Product.tags.through(product_id=product.pk, tag_id=tag.pk)
+                for product, product_tags, _ in items
+                for tag in product_tags
+            ])
+            ProductAttribute.objects.bulk_create([
+                attribute
+                for product, *_ in items
+                for attribute in (
+                    ProductAttribute(product=product, name='Цвет', value=rng.choice(COLORS)),
+                    ProductAttribute(product=product, name='Материал', value=rng.choice(MATERIALS)),
+                )
+            ])
+            ProductImage.objects.bulk_create([
+                ProductImage(product=product, image=image_name, processing_status=ImageStatus.DONE)
+                for product, _, image_name in items
+            ])
+
+    create_search_index()
+    rebuild_search_index()
+    rebuild_stats()
+    bump_generation(User, Category, Tag, Product, ProductImage, ProductAttribute)
+
+    return scale
+
+
+def is_generated(products):
+    """
+    Checks whether the database already has a catalogue generated for this number of products.
+    """
+    scale = get_scale(products)
+    return (
+        Product.objects.count() == scale['products'] and
+        Category.objects.count() == scale['categories'] and
+        User.objects.filter(email__endswith='@bench.example.com').count() == scale['users']
+    )
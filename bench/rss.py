@@ -0,0 +1,77 @@
+import multiprocessing
+import resource
+import sys
+
+
+def read_status_kb(field):
+    try:
+        with open('/proc/self/status') as file:
+            for line in file:
+                if line.startswith(f'{field}:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+
+    return None
+
+
+def get_peak_rss_kb():
+    # ru_maxrss survives exec on Linux, so a new process starts with the peak of its parent, VmHWM does not
+    peak = read_status_kb('VmHWM')
+
+    if peak is not None:
+        return peak
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes elsewhere
+    return peak / 1024 if sys.platform == 'darwin' else peak
+
+
+def reset_peak_rss():
+    """
+    Lowers the peak RSS to the current one on Linux, so the setup of the benchmark is not counted.
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as file:
+            file.write('5')
+    except OSError:
+        return False
+
+    return True
+
+
+def measure_peak_rss(name, database_name, images_dir, upload_root):
+    """
+    Runs one operation of the benchmark in a new process and returns how much it raised the peak RSS in KB.
+    Unlike tracemalloc it also counts memory of C libraries such as PIL and the base64 decoder.
+    """
+    context = multiprocessing.get_context('spawn')
+
+    with context.Pool(1) as pool:
+        return pool.apply(_measure_peak_rss, (name, database_name, images_dir, upload_root))
+
+
+def _measure_peak_rss(name, database_name, images_dir, upload_root):
+    # Django is set up here, the module is imported by the new process before it
+    import django
+    django.setup()
+
+    from django.db import connection, transaction
+    from django.test.utils import override_settings, setup_test_environment
+
+    from utils.cache import get_process_caches
+    from .benchmarks import BENCHMARKS, BenchmarkContext
+
+    setup_test_environment(debug=False)
+    connection.settings_dict['NAME'] = database_name
+
+    with override_settings(CACHES=get_process_caches('bench'), MEDIA_ROOT=upload_root):
+        benchmark = BENCHMARKS[name]
+        operation = benchmark.setup(BenchmarkContext(images_dir))
+        before = read_status_kb('VmRSS') if reset_peak_rss() else get_peak_rss_kb()
+
+        with transaction.atomic():
+            operation()
+            transaction.set_rollback(benchmark.rollback)
+
+        return round(get_peak_rss_kb() - before, 1)
@@ -0,0 +1,208 @@
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+import django
+from django.conf import settings
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings, setup_test_environment, \
+    teardown_test_environment
+
+from utils.cache import get_process_caches
+from utils.json import orjson
+from utils.profiling import percentile
+from .benchmarks import BENCHMARKS, BenchmarkContext
+from .fixtures import generate_catalogue, is_generated
+from .rss import measure_peak_rss
+
+
+def get_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(benchmark, context, repeat, warmup):
+    operation = benchmark.setup(context)
+
+    def call():
+        if not benchmark.rollback:
+            return operation()
+
+        with transaction.atomic():
+            operation()
+            transaction.set_rollback(True)
+
+    for _ in range(warmup):
+        call()
+
+    timings = []
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        call()
+        timings.append(time.perf_counter() - start)
+
+    median = statistics.median(timings)
+    result = {
+        'repeat': repeat,
+        'min_ms': round(min(timings) * 1000, 3),
+        'median_ms': round(median * 1000, 3),
+        'p95_ms': round(percentile(sorted(timings), 0.95) * 1000, 3),
+        'mean_ms': round(statistics.fmean(timings) * 1000, 3),
+        'items': benchmark.items,
+        'items_per_second': round(benchmark.items / median, 1),
+    }
+
+    if benchmark.workers is not None:
+        result['workers'] = benchmark.workers()
+        result['items_per_second_per_worker'] = round(benchmark.items / median / result['workers'], 1)
+
+    # counting and tracing slow the operation down, so they get runs of their own
+    if benchmark.queries:
+        with CaptureQueriesContext(connection) as captured:
+            call()
+        result['queries'] = len(captured.captured_queries)
+
+    if benchmark.memory:
+        tracemalloc.start()
+        try:
+            call()
+            result['peak_memory_kb'] = round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+        finally:
+            tracemalloc.stop()
+
+    return result
+
+
+def setup_database(products, data_dir, keepdb):
+    """
+    Creates the test database, a file in data_dir for SQLite so it can be kept between runs.
+    """
+    test_settings = connection.settings_dict.setdefault('TEST', {})
+
+    if connection.vendor == 'sqlite' and not test_settings.get('NAME'):
+        test_settings['NAME'] = os.path.join(data_dir, f'bench-{products}.sqlite3')
+
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=keepdb)
+    return old_name
+
+
+def run(products, seed=0, repeat=20, warmup=2, names=None, data_dir='.', keepdb=False, log=print):
+    """
+    Runs the benchmarks against a generated catalogue in a test database.
+
+    :param names: Names of the benchmarks to run, all of them by default
+    :param keepdb: Keeps the database and media between runs, the catalogue is generated only once
+    :return: Results which can be saved as JSON and compared with compare()
+    """
+    unknown = set(names or ()) - BENCHMARKS.keys()
+    if unknown:
+        raise ValueError(f'Unknown benchmarks: {", ".join(sorted(unknown))}')
+
+    os.makedirs(data_dir, exist_ok=True)
+    media_root = os.path.join(data_dir, f'bench-{products}-media')
+
+    # files of the benchmarks are written to a temporary directory, the rolled back rows do not remove them
+    upload_root = tempfile.mkdtemp(prefix='bench-uploads-')
+
+    setup_test_environment(debug=False)
+    caches_override = override_settings(CACHES=get_process_caches('bench'))
+    caches_override.enable()
+    old_name = setup_database(products, data_dir, keepdb)
+
+    try:
+        if not is_generated(products):
+            if keepdb:
+                # a kept database of an interrupted or a different generation
+                connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=False)
+                old_name = setup_database(products, data_dir, keepdb)
+
+            log(f'Generating a catalogue of {products} products')
+            start = time.perf_counter()
+
+            with override_settings(MEDIA_ROOT=media_root):
+                generate_catalogue(products, seed=seed)
+
+            log(f'Generated in {time.perf_counter() - start:.1f} s')
+
+        with override_settings(MEDIA_ROOT=upload_root):
+            context = BenchmarkContext(media_root)
+            results = {}
+
+            for name, benchmark in BENCHMARKS.items():
+                if names and name not in names:
+                    continue
+
+                results[name] = run_benchmark(benchmark, context, repeat, warmup)
+
+                if benchmark.rss:
+                    results[name]['peak_rss_kb'] = measure_peak_rss(
+                        name, connection.settings_dict['NAME'], media_root, upload_root
+                    )
+
+                log(f'{name:32} {results[name]["median_ms"]:10.3f} ms')
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=keepdb)
+        caches_override.disable()
+        teardown_test_environment()
+        shutil.rmtree(upload_root, ignore_errors=True)
+
+        if not keepdb:
+            shutil.rmtree(media_root, ignore_errors=True)
+
+    return {
+        'commit': get_commit(),
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'products': products,
+        'seed': seed,
+        'environment': {
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'orjson': orjson is not None,
+        },
+        'benchmarks': results,
+    }
+
+
+def compare(baseline, current, threshold=0.1):
+    """
+    :return: tuple of (table rows of benchmarks in both results, names of benchmarks slower by more than threshold)
+    """
+    rows, regressions = [], []
+
+    for name, result in current['benchmarks'].items():
+        base = baseline['benchmarks'].get(name)
+
+        if base is None:
+            continue
+
+        ratio = result['median_ms'] / base['median_ms']
+        rows.append((name, base['median_ms'], result['median_ms'], ratio))
+
+        if ratio > 1 + threshold:
+            regressions.append(name)
+
+    return rows, regressions
+
+
+def load(path):
+    with open(path) as file:
+        return json.load(file)
+
+
+def save(results, path):
+    with open(path, 'w') as file:
+        json.dump(results, file, indent=2)
+        file.write('\n')
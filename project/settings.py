@@ -1,4 +1,5 @@
 import os
+import tempfile
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -38,6 +39,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'utils.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -78,6 +80,35 @@ DATABASES = {
     }
 }
 
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# File based cache is shared between worker processes, so invalidation made by one worker is seen by others.
+# Generations of models are kept apart from cached data: culling of a full cache must never drop them.
+
+CACHE_ROOT = os.path.join(tempfile.gettempdir(), 'market-cache')
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(CACHE_ROOT, 'default'),
+        'TIMEOUT': 60 * 15,
+        'OPTIONS': {
+            'MAX_ENTRIES': 20000,
+        },
+    },
+    'generations': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(CACHE_ROOT, 'generations'),
+        'TIMEOUT': None,
+        # one entry per model, the limit is never reached
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+}
+
+GENERATION_CACHE_ALIAS = 'generations'
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -119,6 +150,14 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static', 'static_root')
 MEDIA_URL = 'media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Generated image variants are evicted starting from the least recently used above this size
+THUMBNAIL_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+# Uploaded files are streamed to disk instead of being kept in memory
+FILE_UPLOAD_HANDLERS = [
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
@@ -126,14 +165,36 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'account.User'
 
+# BasicAuthentication is not used, it runs the password hasher on every request
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.BasicAuthentication',
+        'api.auth.authentication.CachedTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
-        'rest_framework.authentication.TokenAuthentication',
+    ],
+    # orjson is used when it is installed
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'api.parsers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
     ],
 }
 
+AUTH_TOKEN_CACHE_TIMEOUT = 300
+
+# Seconds a deleted token or a token of a changed user is not cached again, longer than a request loads the token
+AUTH_TOKEN_TOMBSTONE_TIMEOUT = 30
+
+# Products created by one request to /api/v1/products/bulk/
+BULK_CREATE_MAX_ITEMS = 1000
+
+# Share of requests recorded by ProfilingMiddleware, 0 disables it. The report is at /api/v1/profiling/
+PROFILING_SAMPLE_RATE = 0
+PROFILING_BUFFER_SIZE = 1000
+
 CORS_ALLOW_HEADERS = (
     'accept',
     'authorization',
@@ -1,4 +1,5 @@
 from django.contrib import admin
+from django.urls import reverse
 from django.utils.safestring import mark_safe
 from store.models import Tag, Category, ProductImage, ProductAttribute, Product
 
@@ -34,6 +35,7 @@ class ProductAdmin(admin.ModelAdmin):
     list_display = ('id', 'name', 'price', 'category', 'is_published', 'get_image')
     list_display_links = ('id', 'name',)
     list_filter = ('category', 'tags', 'user', 'is_published',)
+    list_select_related = ('category',)
     search_fields = ('name', 'description', 'content',)
     readonly_fields = ('created_at', 'updated_at', 'get_big_image',)
     inlines = [ProductAttributeStackedInline, ProductImageStackedInline]
@@ -41,7 +43,8 @@ class ProductAdmin(admin.ModelAdmin):
     @admin.display(description='Изображение')
     def get_image(self, item):
         if item.image:
-            return mark_safe(f'<img src="{item.image.url}" width="150px">')
+            url = reverse('thumbnail', kwargs={'variant': 'thumb', 'name': item.image.name})
+            return mark_safe(f'<img src="{url}" width="150px">')
         return '-'
 
     @admin.display(description='Изображение')
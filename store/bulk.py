@@ -0,0 +1,38 @@
+from store.models import Product, ProductImage, ProductAttribute
+from store.search import index_products
+from store.stats import refresh_stats
+
+
+def create_products(items):
+    """
+    Creates products with their tags, attributes and images with one bulk insert per table.
+    Run it in a transaction, a failed insert leaves the rows of the tables before it.
+
+    :param items: tuples of (unsaved product, tag ids, unsaved attributes, names of stored images)
+    :return: The created products
+    """
+    products, tags, attributes, images = [], [], [], []
+
+    for product, _, _, image_names in items:
+        # the last created image is the first in ProductImage ordering
+        product.cover_image = image_names[-1] if image_names else None
+        products.append(product)
+
+    Product.objects.bulk_create(products)
+
+    for product, tag_ids, product_attributes, image_names in items:
+        tags.extend(Product.tags.through(product_id=product.pk, tag_id=tag_id) for tag_id in tag_ids)
+        for attribute in product_attributes:
+            attribute.product = product
+            attributes.append(attribute)
+        images.extend(ProductImage(product=product, image=name) for name in image_names)
+
+    Product.tags.through.objects.bulk_create(tags)
+    ProductAttribute.objects.bulk_create(attributes)
+    ProductImage.objects.bulk_create(images)
+
+    # bulk_create does not send signals
+    index_products(products)
+    refresh_stats({product.category_id for product in products}, {tag.tag_id for tag in tags})
+
+    return products
@@ -0,0 +1,28 @@
+from django.db.models import OuterRef, Subquery
+
+from store.models import Product, ProductImage
+from utils.deferred import Deferred
+
+
+def update_cover_images(product_ids=None):
+    """
+    Sets Product.cover_image to the first image of the given products, of all of them when product_ids is None,
+    with one query. Inside deferred_cover_updates the products are updated once on its exit.
+
+    :return: The number of updated products
+    """
+    deferred = deferred_cover_updates.collected
+
+    if deferred is not None and product_ids is not None:
+        deferred.update(product_ids)
+        return 0
+
+    first_image = ProductImage.objects.filter(product=OuterRef('pk')).order_by(
+        *ProductImage._meta.ordering, '-pk'
+    ).values('image')[:1]
+    queryset = Product.objects.all() if product_ids is None else Product.objects.filter(pk__in=product_ids)
+    return queryset.update(cover_image=Subquery(first_image))
+
+
+# covers of all products whose images changed are updated with one query
+deferred_cover_updates = Deferred(set, update_cover_images)
@@ -0,0 +1,107 @@
+import csv
+
+from django.db.models import Prefetch
+
+from store.models import Tag, ProductAttribute, ProductImage
+from utils.json import dumps, iter_dumps
+
+EXPORT_FIELDS = (
+    'id',
+    'name',
+    'description',
+    'content',
+    'category',
+    'tags',
+    'price',
+    'user',
+    'receive_type',
+    'rating',
+    'is_published',
+    'attributes',
+    'images',
+    'created_at',
+    'updated_at',
+)
+
+# separators of list values in csv cells
+CSV_LIST_SEPARATOR = '|'
+CSV_ATTRIBUTE_SEPARATOR = '='
+
+
+def iter_products(queryset, chunk_size=1000, build_url=None):
+    """
+    Yields products as plain dicts. Related objects are prefetched for every chunk,
+    so memory use depends on the chunk size and not on the size of the catalogue.
+
+    :param build_url: Makes absolute image urls from relative ones
+    """
+    queryset = queryset.order_by('pk').select_related('category').prefetch_related(
+        Prefetch('tags', queryset=Tag.objects.only('name')),
+        Prefetch('attributes', queryset=ProductAttribute.objects.only('name', 'value', 'product')),
+        Prefetch('images', queryset=ProductImage.objects.only('image', 'product')),
+    )
+
+    for product in queryset.iterator(chunk_size=chunk_size):
+        images = [product_image.image.url for product_image in product.images.all()]
+
+        yield {
+            'id': product.id,
+            'name': product.name,
+            'description': product.description,
+            'content': product.content,
+            'category': product.category.name,
+            'tags': [tag.name for tag in product.tags.all()],
+            'price': product.price,
+            'user': product.user_id,
+            'receive_type': product.receive_type,
+            'rating': product.rating,
+            'is_published': product.is_published,
+            'attributes': [[attribute.name, attribute.value] for attribute in product.attributes.all()],
+            'images': [build_url(url) for url in images] if build_url else images,
+            'created_at': product.created_at,
+            'updated_at': product.updated_at,
+        }
+
+
+def iter_jsonl(rows):
+    for row in rows:
+        yield dumps(row).decode() + '\n'
+
+
+def iter_json(rows):
+    for chunk in iter_dumps(rows):
+        yield chunk.decode()
+
+
+class Echo:
+    """
+    File-like object which returns written lines instead of buffering them.
+    """
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+
+    for row in rows:
+        row = {
+            **row,
+            'tags': CSV_LIST_SEPARATOR.join(row['tags']),
+            'attributes': CSV_LIST_SEPARATOR.join(
+                f'{name}{CSV_ATTRIBUTE_SEPARATOR}{value}' for name, value in row['attributes']
+            ),
+            'images': CSV_LIST_SEPARATOR.join(row['images']),
+            'created_at': row['created_at'].isoformat(),
+            'updated_at': row['updated_at'].isoformat(),
+        }
+        yield writer.writerow([row[field] for field in EXPORT_FIELDS])
+
+
+EXPORT_FORMATS = {
+    'csv': (iter_csv, 'text/csv'),
+    'jsonl': (iter_jsonl, 'application/x-ndjson'),
+    'json': (iter_json, 'application/json'),
+}
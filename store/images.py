@@ -0,0 +1,150 @@
+import logging
+import os
+from concurrent.futures import as_completed
+
+from django.db import DatabaseError, transaction
+from PIL import Image, ImageOps
+
+from account.models import User
+from store.models import ProductImage
+from utils.choices import ImageStatus
+
+logger = logging.getLogger(__name__)
+
+RESAMPLE = Image.Resampling.LANCZOS
+
+
+def convert_image(source, target, size, crop=False, quality=90, image_format='WEBP'):
+    """
+    Resizes the image and saves it in the given format. Runs in worker processes, so works only with paths.
+
+    :param source: Absolute path of the original image
+    :param target: Absolute path of the converted image
+    :param size: Maximum width and height, the exact size when crop is set
+    :param crop: Crop the middle of the image to the size instead of fitting into it
+    :return: The target path
+    """
+    with Image.open(source) as original:
+        image = ImageOps.exif_transpose(original)
+
+        if crop:
+            image = ImageOps.fit(image, size, RESAMPLE, centering=(0.5, 0.5))
+        else:
+            image.thumbnail(size, RESAMPLE)
+
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+
+        image.save(target, image_format, quality=quality)
+
+    return target
+
+
+class ImageJob:
+    """
+    Conversion of one image field of a row, the original stays until the converted file is stored.
+    """
+    extension = '.webp'
+
+    def __init__(self, instance, field_name, status_field, options):
+        self.instance = instance
+        self.field_name = field_name
+        self.status_field = status_field
+        self.options = options
+
+        field_file = getattr(instance, field_name)
+        self.storage = field_file.storage
+        self.source = self.storage.path(field_file.name)
+        self.target_name = self.storage.get_available_name(os.path.splitext(field_file.name)[0] + self.extension)
+        self.target = self.storage.path(self.target_name)
+
+    def finish(self, error=None):
+        if error is None:
+            setattr(self.instance, self.field_name, self.target_name)
+            setattr(self.instance, self.status_field, ImageStatus.DONE)
+        else:
+            logger.warning('Could not process %s: %s', self.source, error)
+            setattr(self.instance, self.status_field, ImageStatus.FAILED)
+
+        update_fields = [self.field_name, self.status_field]
+        if hasattr(self.instance, 'updated_at'):
+            update_fields.append('updated_at')
+
+        try:
+            # a savepoint keeps a surrounding transaction usable after the failed save
+            with transaction.atomic():
+                self.instance.save(update_fields=update_fields)
+        except DatabaseError:
+            # the row was deleted while its image was converted
+            logger.info('Skipped %s, its row is deleted', self.source)
+            if error is None and os.path.exists(self.target):
+                os.remove(self.target)
+
+
+def claim_pending(queryset, status_field, limit):
+    """
+    Marks up to limit pending rows as processing and returns them.
+    Every row is claimed by a conditional UPDATE, so concurrent runs never get the same row.
+    """
+    pending = {status_field: ImageStatus.PENDING}
+    claimed = [
+        pk for pk in queryset.filter(**pending).values_list('pk', flat=True)[:limit]
+        if queryset.filter(pk=pk, **pending).update(**{status_field: ImageStatus.PROCESSING})
+    ]
+    return queryset.filter(pk__in=claimed) if claimed else []
+
+
+def get_pending_jobs(limit):
+    # sizes are the same as the ResizedImageField options these fields used to have
+    jobs = []
+
+    for product_image in claim_pending(ProductImage.objects.all(), 'processing_status', limit):
+        jobs.append(ImageJob(product_image, 'image', 'processing_status', {'size': (1920, 1080)}))
+
+    users = User.objects.exclude(avatar='')
+    for user in claim_pending(users, 'avatar_status', max(limit - len(jobs), 0)):
+        jobs.append(ImageJob(user, 'avatar', 'avatar_status', {'size': (500, 500), 'crop': True}))
+
+    return jobs
+
+
+def requeue_processing_images():
+    """
+    Returns images claimed by runs which were stopped before finishing them to the pending ones.
+    Call it only when no other run is processing images.
+
+    :return: The number of requeued images
+    """
+    return (
+        ProductImage.objects.filter(processing_status=ImageStatus.PROCESSING)
+        .update(processing_status=ImageStatus.PENDING) +
+        User.objects.filter(avatar_status=ImageStatus.PROCESSING).update(avatar_status=ImageStatus.PENDING)
+    )
+
+
+def process_pending_images(executor=None, limit=100):
+    """
+    Converts pending product images and avatars.
+    Images are converted in parallel by the executor (a ProcessPoolExecutor) or one by one when it is None.
+
+    :return: The number of processed images
+    """
+    jobs = get_pending_jobs(limit)
+
+    if executor is None:
+        for job in jobs:
+            try:
+                convert_image(job.source, job.target, **job.options)
+            except Exception as error:
+                job.finish(error)
+            else:
+                job.finish()
+        return len(jobs)
+
+    futures = {executor.submit(convert_image, job.source, job.target, **job.options): job for job in jobs}
+
+    for future in as_completed(futures):
+        error = future.exception()
+        futures[future].finish(error)
+
+    return len(jobs)
@@ -0,0 +1,319 @@
+import csv
+import json
+import logging
+import os
+import uuid
+from urllib.parse import unquote, urlsplit
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image
+
+from store.bulk import create_products
+from store.exports import CSV_LIST_SEPARATOR, CSV_ATTRIBUTE_SEPARATOR
+from store.models import Category, Tag, Product, ProductImage, ProductAttribute
+from store.stats import deferred_stats_refresh
+from utils.cache import bump_generation
+from utils.main import base64_to_image_file
+
+logger = logging.getLogger(__name__)
+
+IMAGES_DIR = 'product_images'
+
+
+def iter_jsonl_rows(file):
+    for line in file:
+        if line.strip():
+            yield json.loads(line)
+
+
+def split_csv_list(value):
+    return value.split(CSV_LIST_SEPARATOR) if value else []
+
+
+def iter_csv_rows(file):
+    for row in csv.DictReader(file):
+        yield {
+            **row,
+            'tags': split_csv_list(row.get('tags')),
+            'attributes': [
+                attribute.partition(CSV_ATTRIBUTE_SEPARATOR)[::2] for attribute in split_csv_list(row.get('attributes'))
+            ],
+            'images': split_csv_list(row.get('images')),
+        }
+
+
+IMPORT_FORMATS = {
+    'csv': iter_csv_rows,
+    'jsonl': iter_jsonl_rows,
+}
+
+
+def decode_image(source, target):
+    """
+    Writes the image given as a data URI or a file path next to the target path
+    and checks that it is an image. Runs in worker processes, so works only with paths.
+
+    :param source: A "data:image/...;base64," string or an absolute file path
+    :param target: Absolute path of the stored image without an extension
+    :return: The path of the stored image
+    """
+    if source.startswith('data:'):
+        content = base64_to_image_file(source, os.path.basename(target))
+        target = os.path.join(os.path.dirname(target), content.name)
+    else:
+        content = File(open(source, 'rb'))
+        target += os.path.splitext(source)[1].lower()
+
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+
+    with content, open(target, 'wb') as file:
+        for chunk in content.chunks():
+            file.write(chunk)
+
+    try:
+        with Image.open(target) as image:
+            image.verify()
+    except Exception:
+        os.remove(target)
+        raise
+
+    return target
+
+
+class Checkpoint:
+    """
+    The number of input records that are already imported, stored next to the input file.
+    """
+
+    def __init__(self, path, source):
+        self.path = path
+        self.source = os.path.abspath(source)
+
+    def load(self):
+        try:
+            with open(self.path) as file:
+                data = json.load(file)
+        except FileNotFoundError:
+            return 0
+
+        if data.get('source') != self.source:
+            raise ValueError(f'Checkpoint {self.path} belongs to {data.get("source")}')
+
+        return data['records']
+
+    def save(self, records):
+        temporary_path = f'{self.path}.tmp'
+
+        with open(temporary_path, 'w') as file:
+            json.dump({'source': self.source, 'records': records}, file)
+
+        os.replace(temporary_path, self.path)
+
+    def clear(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class CatalogueImporter:
+    """
+    Creates products from rows in the export format, see store.exports.iter_products.
+    Categories and tags are matched by name and missing ones are created,
+    images are decoded by the executor (a ProcessPoolExecutor) or one by one when it is None
+    and wait for manage.py process_images like uploaded ones.
+    """
+
+    def __init__(self, user, images_dir, executor=None, batch_size=1000):
+        self.user = user
+        self.images_dir = images_dir
+        self.executor = executor
+        self.batch_size = batch_size
+        self.categories = dict(Category.objects.values_list('name', 'id'))
+        self.tags = {}
+
+        for tag_id, name in Tag.objects.order_by('id').values_list('id', 'name'):
+            self.tags.setdefault(name, tag_id)
+
+    def get_image_source(self, value):
+        if value.startswith('data:'):
+            return value
+
+        url = urlsplit(value)
+        path = unquote(url.path)
+        media_url = '/' + settings.MEDIA_URL.lstrip('/')
+
+        if url.scheme not in ('', 'http', 'https') or (url.scheme and not path.startswith(media_url)):
+            raise ValidationError(f'Only urls of media files are supported: {value}')
+
+        if path.startswith(media_url):
+            path = path[len(media_url):]
+
+        # paths are relative to the images directory and can not leave it
+        images_dir = os.path.realpath(self.images_dir)
+        source = os.path.realpath(os.path.join(images_dir, path))
+
+        if os.path.isabs(path) or os.path.commonpath([images_dir, source]) != images_dir:
+            raise ValidationError(f'Only paths inside of the images directory are supported: {value}')
+
+        return source
+
+    def parse_row(self, row):
+        product = Product(
+            name=row.get('name') or '',
+            description=row.get('description') or '',
+            content=row.get('content') or '',
+            price=row.get('price') or 0,
+            receive_type=row.get('receive_type') or Product.ORDER,
+            rating=row.get('rating'),
+            is_published=row.get('is_published', True),
+            user=self.user,
+        )
+        product.clean_fields(exclude=['category', 'user', 'cover_image'])
+
+        category = row.get('category')
+        if not category:
+            raise ValidationError({'category': ['Обязательное поле.']})
+        if category not in self.categories:
+            Category(name=category).clean_fields()
+
+        tags = list(dict.fromkeys(row.get('tags') or []))
+        for tag in tags:
+            if tag not in self.tags:
+                Tag(name=tag).clean_fields()
+
+        attributes = []
+        for name, value in row.get('attributes') or []:
+            attribute = ProductAttribute(name=name, value=value)
+            attribute.clean_fields(exclude=['product'])
+            attributes.append(attribute)
+
+        images = [self.get_image_source(value) for value in row.get('images') or []]
+
+        return product, category, tags, attributes, images
+
+    def store_images(self, items):
+        """
+        Decodes images of the batch, items with broken images are left out.
+        """
+        sources, targets = [], []
+
+        for _, (*_, images) in items:
+            for source in images:
+                sources.append(source)
+                targets.append(default_storage.path(f'{IMAGES_DIR}/{uuid.uuid4().hex}'))
+
+        if self.executor is None:
+            results = []
+            for source, target in zip(sources, targets):
+                try:
+                    results.append(decode_image(source, target))
+                except Exception as error:
+                    results.append(error)
+        else:
+            futures = [self.executor.submit(decode_image, source, target) for source, target in zip(sources, targets)]
+            results = [future.exception() or future.result() for future in futures]
+
+        stored_items = []
+        results = iter(results)
+
+        for record, (*fields, images) in items:
+            paths = [next(results) for _ in images]
+            errors = [path for path in paths if isinstance(path, Exception)]
+
+            if errors:
+                logger.warning('Skipped record %s: %s', record, errors[0])
+                for path in paths:
+                    if not isinstance(path, Exception):
+                        os.remove(path)
+                continue
+
+            names = [f'{IMAGES_DIR}/{os.path.basename(path)}' for path in paths]
+            stored_items.append((record, (*fields, names)))
+
+        return stored_items
+
+    def create_missing(self, items):
+        category_names = {category for _, (_, category, *_) in items} - self.categories.keys()
+        tag_names = {tag for _, (_, _, tags, *_) in items for tag in tags} - self.tags.keys()
+
+        if category_names:
+            Category.objects.bulk_create([Category(name=name) for name in category_names], ignore_conflicts=True)
+            self.categories.update(Category.objects.filter(name__in=category_names).values_list('name', 'id'))
+
+        if tag_names:
+            for tag in Tag.objects.bulk_create([Tag(name=name) for name in tag_names]):
+                self.tags[tag.name] = tag.id
+
+    def create_batch(self, items):
+        for _, (product, category, *_) in items:
+            product.category_id = self.categories[category]
+
+        return create_products([
+            (product, [self.tags[tag] for tag in product_tags], product_attributes, image_names)
+            for _, (product, _, product_tags, product_attributes, image_names) in items
+        ])
+
+    def import_batch(self, rows):
+        """
+        :param rows: Pairs of the record number and the row
+        :return: The number of created products
+        """
+        items = []
+
+        for record, row in rows:
+            try:
+                items.append((record, self.parse_row(row)))
+            except (ValidationError, TypeError, ValueError) as error:
+                logger.warning('Skipped record %s: %s', record, error)
+
+        items = self.store_images(items)
+
+        try:
+            with transaction.atomic():
+                self.create_missing(items)
+                products = self.create_batch(items)
+        except BaseException:
+            for _, (*_, image_names) in items:
+                for name in image_names:
+                    default_storage.delete(name)
+            raise
+
+        bump_generation(Product, ProductAttribute, ProductImage, Category, Tag)
+        return len(products)
+
+    def import_rows(self, rows, skip=0, on_batch=None):
+        """
+        Imports rows in batches, every batch is committed in its own transaction.
+
+        :param skip: The number of rows imported before
+        :param on_batch: Called with the number of processed rows and created products after every batch
+        :return: The number of created products
+        """
+        batch = []
+        created = 0
+
+        # statistics of the touched categories and tags are calculated once, not after every batch
+        with deferred_stats_refresh():
+            for record, row in enumerate(rows, 1):
+                if record <= skip:
+                    continue
+
+                batch.append((record, row))
+
+                if len(batch) == self.batch_size:
+                    created += self.import_batch(batch)
+                    if on_batch:
+                        on_batch(record, created)
+                    batch = []
+
+            if batch:
+                created += self.import_batch(batch)
+                if on_batch:
+                    on_batch(batch[-1][0], created)
+
+        return created
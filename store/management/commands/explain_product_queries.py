@@ -0,0 +1,82 @@
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.http import QueryDict
+
+from api.filters import ProductFilter
+from api.views import ProductViewSet
+from store.models import Product, Category, Tag
+
+FULL_SCAN_PATTERNS = {
+    'sqlite': re.compile(r'^[\d\s|`-]*SCAN store_product$', re.MULTILINE),
+    'postgresql': re.compile(r'Seq Scan on store_product\b(?!_)'),
+}
+
+
+class Command(BaseCommand):
+    help = 'Prints the query plan of every supported product filter and ordering combination'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fail-on-scan', action='store_true',
+                            help='Exit with an error when some query scans the whole product table')
+        parser.add_argument('--verbose-plan', action='store_true', help='Print full query plans')
+
+    def get_filter_values(self):
+        category = Category.objects.values_list('id', flat=True).first() or 1
+        tag = Tag.objects.values_list('id', flat=True).first() or 1
+        user = Product.objects.values_list('user_id', flat=True).first() or 1
+
+        return {
+            None: None,
+            'category': category,
+            'tags': tag,
+            'user': user,
+            'receive_type': Product.ORDER,
+            'rating': '4.0',
+            'is_published': 'true',
+            'min_price': '100',
+            'max_price': '1000',
+        }
+
+    def get_orderings(self):
+        orderings = [None]
+
+        for field in ProductViewSet.ordering_fields:
+            orderings.extend([field, f'-{field}'])
+
+        return orderings
+
+    def is_full_scan(self, plan):
+        pattern = FULL_SCAN_PATTERNS.get(connection.vendor)
+        return bool(pattern and pattern.search(plan))
+
+    def handle(self, *args, **options):
+        full_scans = []
+
+        for field, value in self.get_filter_values().items():
+            for ordering in self.get_orderings():
+                data = QueryDict(mutable=True)
+                if field:
+                    data[field] = value
+
+                queryset = ProductFilter(data, queryset=Product.objects.all()).qs
+                if ordering:
+                    queryset = queryset.order_by(ordering)
+
+                plan = queryset.explain()
+                full_scan = self.is_full_scan(plan)
+                label = f'filter={field or "-"} ordering={ordering or "default"}'
+
+                if full_scan:
+                    full_scans.append(label)
+                    self.stdout.write(self.style.WARNING(f'FULL SCAN  {label}'))
+                else:
+                    self.stdout.write(f'ok         {label}')
+
+                if options['verbose_plan'] or full_scan:
+                    for line in plan.splitlines():
+                        self.stdout.write(f'    {line}')
+
+        if full_scans and options['fail_on_scan']:
+            raise CommandError(f'{len(full_scans)} queries scan the whole product table')
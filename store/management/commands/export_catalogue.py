@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from store.exports import EXPORT_FORMATS, iter_products
+from store.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Exports all products with categories, tags, attributes and images as CSV or JSONL'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=EXPORT_FORMATS, default='jsonl', dest='export_format')
+        parser.add_argument('--output', help='File path, standard output by default')
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--base-url', default='', help='Prefix of image urls, e.g. https://example.com')
+
+    def handle(self, *args, **options):
+        iter_format, _ = EXPORT_FORMATS[options['export_format']]
+        base_url = options['base_url'].rstrip('/')
+        rows = iter_products(
+            Product.objects.all(),
+            chunk_size=options['chunk_size'],
+            build_url=(lambda url: f'{base_url}{url}') if base_url else None,
+        )
+
+        output = open(options['output'], 'w', encoding='utf-8', newline='') if options['output'] else self.stdout
+
+        try:
+            for line in iter_format(rows):
+                output.write(line)
+        finally:
+            if output is not self.stdout:
+                output.close()
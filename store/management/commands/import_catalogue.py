@@ -0,0 +1,69 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+from account.models import User
+from store.imports import IMPORT_FORMATS, CatalogueImporter, Checkpoint
+
+
+class Command(BaseCommand):
+    help = (
+        'Imports products from CSV or JSONL in the export_catalogue format. '
+        'Interrupted imports continue from the last committed batch.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', help='Path of the CSV or JSONL file')
+        parser.add_argument('--user', required=True, help='Email of the owner of imported products')
+        parser.add_argument('--format', choices=IMPORT_FORMATS, dest='import_format',
+                            help='Format of the input, taken from the file extension by default')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Number of processes decoding images, CPU count by default, 0 to decode inline')
+        parser.add_argument('--images-dir', help='Directory of image paths and media urls, the input directory by default')
+        parser.add_argument('--checkpoint', help='Path of the checkpoint file, <input>.checkpoint by default')
+        parser.add_argument('--restart', action='store_true', help='Ignore the checkpoint and import from the start')
+
+    def handle(self, *args, **options):
+        path = options['input']
+        import_format = options['import_format'] or os.path.splitext(path)[1].lstrip('.').lower()
+
+        if import_format not in IMPORT_FORMATS:
+            raise CommandError(f'Unknown format "{import_format}", use --format')
+
+        try:
+            user = User.objects.get(email=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f'There is no user {options["user"]}')
+
+        checkpoint = Checkpoint(options['checkpoint'] or f'{path}.checkpoint', path)
+
+        if options['restart']:
+            checkpoint.clear()
+
+        try:
+            skip = checkpoint.load()
+        except ValueError as error:
+            raise CommandError(f'{error}, use --checkpoint or --restart')
+
+        if skip:
+            self.stdout.write(f'Skipping {skip} records imported before')
+
+        def on_batch(records, created):
+            checkpoint.save(records)
+            self.stdout.write(f'Processed {records} records, created {created} products')
+
+        images_dir = options['images_dir'] or os.path.dirname(os.path.abspath(path))
+        executor = ProcessPoolExecutor(options['workers']) if options['workers'] != 0 else None
+
+        try:
+            with open(path, encoding='utf-8', newline='') as file:
+                importer = CatalogueImporter(user, images_dir, executor=executor, batch_size=options['batch_size'])
+                created = importer.import_rows(IMPORT_FORMATS[import_format](file), skip=skip, on_batch=on_batch)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        checkpoint.clear()
+        self.stdout.write(self.style.SUCCESS(f'Created {created} products'))
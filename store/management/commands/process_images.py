@@ -0,0 +1,33 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from store.images import process_pending_images, requeue_processing_images
+
+
+class Command(BaseCommand):
+    help = 'Converts uploaded product images and avatars to resized WEBP in a pool of processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None, help='Number of processes, CPU count by default')
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--interval', type=float, default=5, help='Seconds to wait when nothing is pending')
+        parser.add_argument('--once', action='store_true', help='Process pending images and exit')
+        parser.add_argument('--requeue', action='store_true',
+                            help='Process again images left by stopped runs, only when no other run is active')
+
+    def handle(self, *args, **options):
+        if options['requeue']:
+            self.stdout.write(f'Requeued {requeue_processing_images()} images')
+
+        with ProcessPoolExecutor(max_workers=options['workers']) as executor:
+            while True:
+                processed = process_pending_images(executor, limit=options['batch_size'])
+
+                if processed:
+                    self.stdout.write(f'Processed {processed} images')
+                elif options['once']:
+                    break
+                else:
+                    time.sleep(options['interval'])
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from store.stats import rebuild_stats
+
+
+class Command(BaseCommand):
+    help = 'Recalculates product statistics of all categories and tags'
+
+    def handle(self, *args, **options):
+        categories, tags = rebuild_stats()
+        self.stdout.write(self.style.SUCCESS(f'Statistics rebuilt for {categories} categories and {tags} tags'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from store.search import create_search_index, rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = 'Recreates the full-text search index of products'
+
+    def handle(self, *args, **options):
+        if not create_search_index() or not rebuild_search_index():
+            self.stdout.write(self.style.WARNING('Full-text search is not supported by the database'))
+            return
+
+        self.stdout.write(self.style.SUCCESS('Search index rebuilt'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from store.covers import update_cover_images
+
+
+class Command(BaseCommand):
+    help = 'Fills Product.cover_image from the first image of every product'
+
+    def handle(self, *args, **options):
+        updated = update_cover_images()
+        self.stdout.write(self.style.SUCCESS(f'Updated {updated} products'))
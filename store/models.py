@@ -3,7 +3,9 @@ from django.core.exceptions import ValidationError
 
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.db import models
-from django_resized import ResizedImageField
+from django_cleanup import cleanup
+
+from utils.choices import ImageStatus
 
 User = get_user_model()
 
@@ -45,6 +47,8 @@ def example_validation(value):
     return value
 
 
+# cover_image points to a file owned by ProductImage, so it must not be removed together with the product
+@cleanup.ignore
 class Product(TimeStampAbstractModel):
     ORDER = 'order'
     IN_STOCK = 'in_stock'
@@ -60,6 +64,19 @@ class Product(TimeStampAbstractModel):
         verbose_name = 'товар'
         verbose_name_plural = 'товары'
         ordering = ('-created_at',)
+        indexes = [
+            # ordering fields with id as the keyset pagination tie-breaker
+            models.Index(fields=['-created_at', '-id'], name='product_created_idx'),
+            models.Index(fields=['price', 'id'], name='product_price_idx'),
+            models.Index(fields=['name', 'id'], name='product_name_idx'),
+            models.Index(fields=['rating', 'id'], name='product_rating_idx'),
+            # catalogue of published products in the default ordering
+            models.Index(fields=['-created_at', '-id'], name='product_published_created_idx',
+                         condition=models.Q(is_published=True)),
+            models.Index(fields=['category', 'price'], name='product_category_price_idx'),
+            models.Index(fields=['user', '-created_at'], name='product_user_created_idx'),
+            models.Index(fields=['receive_type', 'price'], name='product_receive_type_price_idx'),
+        ]
 
     name = models.CharField('название', max_length=100)
     description = models.CharField('описание', max_length=255, help_text='Просто описание')
@@ -73,12 +90,23 @@ class Product(TimeStampAbstractModel):
     rating = models.DecimalField('рейтинг', max_digits=2, decimal_places=1,
                                  validators=[MinValueValidator(1), MaxValueValidator(5), example_validation])
     is_published = models.BooleanField('публичность', default=True)
+    cover_image = models.ImageField('обложка', upload_to='product_images/', null=True, blank=True, editable=False)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # store.stats applies the difference between the loaded and the saved values, it reads the row when saved
+        instance._loaded_row = (field_names, values)
+        return instance
 
     @property
     def image(self):
-        if self.images.first():
-            return self.images.first().image
-        return None
+        images = getattr(self, '_prefetched_objects_cache', {}).get('images')
+
+        if images is not None:
+            return images[0].image if images else None
+
+        return self.cover_image or None
 
     def __str__(self):
         return f'{self.name}'
@@ -91,7 +119,9 @@ class ProductImage(TimeStampAbstractModel):
         ordering = ('-created_at',)
 
     product = models.ForeignKey('store.Product', models.CASCADE, related_name='images', verbose_name='товар')
-    image = ResizedImageField('изображение', upload_to='product_images/', quality=90, force_format='WEBP')
+    image = models.ImageField('изображение', upload_to='product_images/')
+    processing_status = models.CharField('статус обработки', choices=ImageStatus.choices,
+                                         default=ImageStatus.PENDING, max_length=15, editable=False)
 
     def __str__(self):
         return f'{self.product.name}'
@@ -109,3 +139,42 @@ class ProductAttribute(TimeStampAbstractModel):
 
     def __str__(self):
         return f'{self.name} - {self.value}'
+
+
+class CatalogueStatsAbstractModel(models.Model):
+    """
+    Product statistics maintained by store.stats, prices and ratings are of published products.
+    Rows of categories and tags without products are not stored.
+    """
+
+    class Meta:
+        abstract = True
+
+    product_count = models.PositiveIntegerField('количество товаров', default=0)
+    published_count = models.PositiveIntegerField('количество опубликованных товаров', default=0)
+    min_price = models.DecimalField('минимальная цена', max_digits=10, decimal_places=2, null=True)
+    max_price = models.DecimalField('максимальная цена', max_digits=10, decimal_places=2, null=True)
+    avg_price = models.DecimalField('средняя цена', max_digits=10, decimal_places=2, null=True)
+    avg_rating = models.DecimalField('средний рейтинг', max_digits=3, decimal_places=2, null=True)
+    # sums the averages are updated from without recalculation
+    price_sum = models.DecimalField('сумма цен', max_digits=16, decimal_places=2, default=0)
+    rating_sum = models.DecimalField('сумма рейтингов', max_digits=12, decimal_places=1, default=0)
+    updated_at = models.DateTimeField('дата изменения', auto_now=True)
+
+
+class CategoryStats(CatalogueStatsAbstractModel):
+    class Meta:
+        verbose_name = 'статистика категории'
+        verbose_name_plural = 'статистика категорий'
+
+    category = models.OneToOneField('store.Category', models.CASCADE, primary_key=True, related_name='stats',
+                                    verbose_name='категория')
+
+
+class TagStats(CatalogueStatsAbstractModel):
+    class Meta:
+        verbose_name = 'статистика тега'
+        verbose_name_plural = 'статистика тегов'
+
+    tag = models.OneToOneField('store.Tag', models.CASCADE, primary_key=True, related_name='stats',
+                               verbose_name='тег')
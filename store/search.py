@@ -0,0 +1,207 @@
+import re
+
+from django.db import connection, DatabaseError
+from django.db.models.expressions import RawSQL
+
+
+class BaseSearchBackend:
+    """
+    Full-text index of products kept in a separate table next to store_product.
+    """
+    table = 'store_product_search'
+    vendor = None
+
+    def create_index(self, cursor):
+        raise NotImplementedError
+
+    def index(self, cursor, products):
+        raise NotImplementedError
+
+    def remove(self, cursor, ids):
+        raise NotImplementedError
+
+    def rebuild(self, cursor):
+        raise NotImplementedError
+
+    def search(self, queryset, query):
+        """
+        Filters the queryset by the index and orders it by relevance annotated as search_rank.
+        """
+        raise NotImplementedError
+
+
+class SqliteSearchBackend(BaseSearchBackend):
+    vendor = 'sqlite'
+    table = 'store_product_fts'
+
+    # bm25 weights of name, description and content columns
+    weights = (10.0, 5.0, 1.0)
+    batch_size = 500
+
+    def create_index(self, cursor):
+        cursor.execute(
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} '
+            f'USING fts5(name, description, content, tokenize="unicode61 remove_diacritics 2")'
+        )
+
+    def index(self, cursor, products):
+        self.remove(cursor, [product.pk for product in products])
+        cursor.executemany(
+            f'INSERT INTO {self.table} (rowid, name, description, content) VALUES (%s, %s, %s, %s)',
+            [(product.pk, product.name, product.description, product.content) for product in products]
+        )
+
+    def remove(self, cursor, ids):
+        ids = list(ids)
+
+        # sqlite limits the number of parameters of a statement
+        for start in range(0, len(ids), self.batch_size):
+            batch = ids[start:start + self.batch_size]
+            cursor.execute(f'DELETE FROM {self.table} WHERE rowid IN ({", ".join(["%s"] * len(batch))})', batch)
+
+    def rebuild(self, cursor):
+        cursor.execute(f'DELETE FROM {self.table}')
+        cursor.execute(
+            f'INSERT INTO {self.table} (rowid, name, description, content) '
+            f'SELECT id, name, description, content FROM store_product'
+        )
+
+    def search(self, queryset, query):
+        # terms without word characters are empty phrases to fts5, which are a syntax error
+        terms = [term for term in query.split() if re.search(r'\w', term)]
+
+        if not terms:
+            return queryset.none()
+
+        # every term is quoted to escape fts5 syntax and matched as a prefix
+        match = ' '.join('"{}"*'.format(term.replace('"', '""')) for term in terms)
+        rank = 'bm25({}, {}, {}, {})'.format(self.table, *self.weights)
+        table = queryset.model._meta.db_table
+
+        # the index is matched once, ranks are looked up by rowid for the matched rows only
+        return queryset.filter(
+            pk__in=RawSQL(f'SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s', [match]),
+        ).annotate(
+            search_rank=RawSQL(
+                f'SELECT {rank} FROM {self.table} WHERE {self.table} MATCH %s AND rowid = {table}.id', [match]
+            ),
+        ).order_by('search_rank')
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    vendor = 'postgresql'
+    config = 'simple'
+
+    def create_index(self, cursor):
+        cursor.execute(
+            f'CREATE TABLE IF NOT EXISTS {self.table} ('
+            f'product_id bigint PRIMARY KEY REFERENCES store_product (id) ON DELETE CASCADE, '
+            f'document tsvector NOT NULL)'
+        )
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS {self.table}_document ON {self.table} USING GIN (document)')
+
+    def document(self, name='%s', description='%s', content='%s'):
+        return (
+            f"setweight(to_tsvector('{self.config}', {name}), 'A') || "
+            f"setweight(to_tsvector('{self.config}', {description}), 'B') || "
+            f"setweight(to_tsvector('{self.config}', {content}), 'C')"
+        )
+
+    def index(self, cursor, products):
+        cursor.executemany(
+            f'INSERT INTO {self.table} (product_id, document) VALUES (%s, {self.document()}) '
+            f'ON CONFLICT (product_id) DO UPDATE SET document = EXCLUDED.document',
+            [(product.pk, product.name, product.description, product.content) for product in products]
+        )
+
+    def remove(self, cursor, ids):
+        cursor.execute(f'DELETE FROM {self.table} WHERE product_id = ANY(%s)', [list(ids)])
+
+    def rebuild(self, cursor):
+        cursor.execute(f'TRUNCATE {self.table}')
+        cursor.execute(
+            f"INSERT INTO {self.table} (product_id, document) "
+            f"SELECT id, {self.document('name', 'description', 'content')} "
+            f"FROM store_product"
+        )
+
+    def search(self, queryset, query):
+        tsquery = f"plainto_tsquery('{self.config}', %s)"
+        table = queryset.model._meta.db_table
+
+        return queryset.filter(
+            pk__in=RawSQL(f'SELECT product_id FROM {self.table} WHERE document @@ {tsquery}', [query]),
+        ).annotate(
+            search_rank=RawSQL(
+                f'SELECT ts_rank(document, {tsquery}) FROM {self.table} WHERE product_id = {table}.id', [query]
+            ),
+        ).order_by('-search_rank')
+
+
+SEARCH_BACKENDS = {
+    backend.vendor: backend for backend in (SqliteSearchBackend(), PostgresSearchBackend())
+}
+
+_available = {}
+
+
+def get_search_backend():
+    """
+    Returns the search backend of the default database or None when full-text search is not available.
+    """
+    backend = SEARCH_BACKENDS.get(connection.vendor)
+
+    if backend is None:
+        return None
+
+    if connection.alias not in _available:
+        _available[connection.alias] = backend.table in connection.introspection.table_names()
+
+    return backend if _available[connection.alias] else None
+
+
+def create_search_index():
+    """
+    Creates the index table, called after migrations. Databases without full-text support fall back to LIKE search.
+    """
+    backend = SEARCH_BACKENDS.get(connection.vendor)
+    _available.pop(connection.alias, None)
+
+    if backend is None:
+        return False
+
+    try:
+        with connection.cursor() as cursor:
+            backend.create_index(cursor)
+    except DatabaseError:
+        return False
+
+    return True
+
+
+def index_products(products):
+    backend = get_search_backend()
+
+    if backend and products:
+        with connection.cursor() as cursor:
+            backend.index(cursor, products)
+
+
+def remove_products(ids):
+    backend = get_search_backend()
+
+    if backend and ids:
+        with connection.cursor() as cursor:
+            backend.remove(cursor, ids)
+
+
+def rebuild_search_index():
+    backend = get_search_backend()
+
+    if backend is None:
+        return False
+
+    with connection.cursor() as cursor:
+        backend.rebuild(cursor)
+
+    return True
@@ -0,0 +1,157 @@
+import threading
+from contextlib import contextmanager
+
+from django.db.models.signals import post_save, post_delete, m2m_changed, pre_save, pre_delete
+from django.dispatch import receiver
+
+from store.covers import update_cover_images
+from store.models import Product, ProductImage, Category, Tag, ProductAttribute, User, CategoryStats, TagStats
+from store.search import create_search_index, index_products, remove_products
+from store.stats import PRODUCT_STATS_FIELDS, apply_stats_difference, get_product_stats_values, load_stats_values, \
+    refresh_stats, update_product_stats
+from utils.cache import bump_generation
+from utils.choices import ImageStatus
+
+# user fields which are not shown in the catalogue
+USER_PRIVATE_FIELDS = {'last_login', 'password'}
+
+_bulk = threading.local()
+
+
+@contextmanager
+def bulk_product_deletion():
+    """
+    Skips the index and statistics handlers of every deleted product, the caller updates both for all of them at once.
+    """
+    _bulk.deleting, previous = True, getattr(_bulk, 'deleting', False)
+
+    try:
+        yield
+    finally:
+        _bulk.deleting = previous
+
+
+def is_bulk_product_deletion():
+    return getattr(_bulk, 'deleting', False)
+
+
+@receiver(pre_save, sender=ProductImage)
+def mark_product_image_for_processing(sender, instance, **kwargs):
+    # a new file assigned to the field is not stored yet
+    if instance.image and not instance.image._committed:
+        instance.processing_status = ImageStatus.PENDING
+
+
+@receiver(pre_save, sender=User)
+def mark_avatar_for_processing(sender, instance, **kwargs):
+    if instance.avatar and not instance.avatar._committed:
+        instance.avatar_status = ImageStatus.PENDING
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def update_product_cover_image(sender, instance, origin=None, **kwargs):
+    # images deleted together with their product
+    if isinstance(origin, Product) or getattr(origin, 'model', None) is Product:
+        return
+
+    update_cover_images([instance.product_id])
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or {'name', 'description', 'content'} & set(update_fields):
+        index_products([instance])
+
+
+@receiver(post_delete, sender=Product)
+def remove_product_from_index(sender, instance, **kwargs):
+    if is_bulk_product_deletion():
+        return
+
+    remove_products([instance.pk])
+
+
+@receiver(pre_save, sender=Product)
+def remember_stats_values(sender, instance, update_fields=None, **kwargs):
+    # products loaded from the database have the values already
+    if not instance._state.adding and (update_fields is None or PRODUCT_STATS_FIELDS & set(update_fields)):
+        load_stats_values(instance)
+
+
+@receiver(post_save, sender=Product)
+def refresh_product_stats(sender, instance, created, update_fields=None, **kwargs):
+    if update_fields is not None and not PRODUCT_STATS_FIELDS & set(update_fields):
+        return
+
+    update_product_stats(instance, created, update_fields)
+
+
+@receiver(pre_delete, sender=Product)
+def remember_stats_tags(sender, instance, **kwargs):
+    if is_bulk_product_deletion():
+        return
+
+    # tags are unlinked before post_delete
+    instance._stats_tag_ids = set(instance.tags.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Product)
+def refresh_deleted_product_stats(sender, instance, **kwargs):
+    if is_bulk_product_deletion():
+        return
+
+    values = get_product_stats_values(instance)
+    apply_stats_difference(CategoryStats, [values['category_id']], removed=values)
+    apply_stats_difference(TagStats, getattr(instance, '_stats_tag_ids', ()), removed={**values, 'category_id': None})
+
+
+@receiver(m2m_changed, sender=Product.tags.through)
+def update_product_tags_stats(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse:
+        # products added to a tag are not loaded
+        if action.startswith('post_'):
+            refresh_stats(tag_ids=[instance.pk])
+        return
+
+    values = {**get_product_stats_values(instance), 'category_id': None}
+
+    if action == 'pre_clear':
+        instance._stats_tag_ids = set(instance.tags.values_list('pk', flat=True))
+    elif action == 'post_clear':
+        apply_stats_difference(TagStats, getattr(instance, '_stats_tag_ids', ()), removed=values)
+    elif action == 'post_add':
+        apply_stats_difference(TagStats, pk_set, added=values)
+    elif action == 'post_remove':
+        apply_stats_difference(TagStats, pk_set, removed=values)
+
+
+def create_product_search_index(sender, **kwargs):
+    create_search_index()
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+@receiver(post_save, sender=ProductAttribute)
+@receiver(post_delete, sender=ProductAttribute)
+def bump_catalogue_generation(sender, **kwargs):
+    bump_generation(sender)
+
+
+@receiver(m2m_changed, sender=Product.tags.through)
+def bump_product_tags_generation(sender, action, **kwargs):
+    if action.startswith('post_'):
+        bump_generation(Product)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def bump_user_generation(sender, update_fields=None, **kwargs):
+    if update_fields is None or not set(update_fields) <= USER_PRIVATE_FIELDS:
+        bump_generation(User)
@@ -0,0 +1,308 @@
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Avg, Count, F, FloatField, Max, Min, Q, Sum, Value
+from django.db.models.functions import Cast, Coalesce, Greatest, Least, NullIf
+from django.utils import timezone
+
+from store.models import Product, CategoryStats, TagStats
+from utils.cache import bump_generation
+from utils.deferred import Deferred
+
+# product fields the statistics are calculated from
+PRODUCT_STATS_FIELDS = {'category', 'category_id', 'price', 'rating', 'is_published'}
+# their attribute names, the values a product adds to statistics
+PRODUCT_STATS_VALUES = ('category_id', 'is_published', 'price', 'rating')
+
+STATS_FIELDS = [
+    'product_count', 'published_count', 'min_price', 'max_price', 'avg_price', 'avg_rating', 'price_sum', 'rating_sum',
+    'updated_at',
+]
+
+
+def get_stats_source(stats_model):
+    """
+    :return: tuple of (queryset of product rows, field grouped by, prefix of product fields)
+    """
+    if stats_model is CategoryStats:
+        return Product.objects.all(), 'category_id', ''
+    return Product.tags.through.objects.all(), 'tag_id', 'product__'
+
+
+def aggregate_stats(stats_model, ids=None):
+    """
+    Calculates unsaved statistics rows of the given categories or tags, of all of them when ids is None.
+    Categories and tags without products get no row.
+    """
+    queryset, group_field, prefix = get_stats_source(stats_model)
+
+    if ids is not None:
+        queryset = queryset.filter(**{f'{group_field}__in': ids})
+
+    published = Q(**{f'{prefix}is_published': True})
+    rows = queryset.order_by().values(group_field).annotate(
+        product_count=Count(f'{prefix}id'),
+        published_count=Count(f'{prefix}id', filter=published),
+        min_price=Min(f'{prefix}price', filter=published),
+        max_price=Max(f'{prefix}price', filter=published),
+        avg_price=Avg(f'{prefix}price', filter=published),
+        avg_rating=Avg(f'{prefix}rating', filter=published),
+        price_sum=Coalesce(Sum(f'{prefix}price', filter=published), Value(Decimal(0))),
+        rating_sum=Coalesce(Sum(f'{prefix}rating', filter=published), Value(Decimal(0))),
+    )
+
+    return [stats_model(pk=row.pop(group_field), **row) for row in rows]
+
+
+def refresh_stats_rows(stats_model, ids):
+    rows = aggregate_stats(stats_model, ids)
+    empty_ids = set(ids) - {row.pk for row in rows}
+
+    with transaction.atomic():
+        if empty_ids:
+            stats_model.objects.filter(pk__in=empty_ids).delete()
+        stats_model.objects.bulk_create(
+            rows, update_conflicts=True, unique_fields=[stats_model._meta.pk.name], update_fields=STATS_FIELDS
+        )
+
+
+def refresh_stats(category_ids=(), tag_ids=()):
+    """
+    Recalculates statistics of the given categories and tags, once on exit of deferred_stats_refresh inside it.
+    """
+    deferred = deferred_stats_refresh.collected
+
+    if deferred is not None:
+        deferred[CategoryStats].update(category_ids)
+        deferred[TagStats].update(tag_ids)
+        return
+
+    changed = []
+
+    for stats_model, ids in ((CategoryStats, set(category_ids)), (TagStats, set(tag_ids))):
+        if ids:
+            refresh_stats_rows(stats_model, ids)
+            changed.append(stats_model)
+
+    if changed:
+        bump_generation(*changed)
+
+
+# categories and tags of all changed products are recalculated once
+deferred_stats_refresh = Deferred(
+    lambda: {CategoryStats: set(), TagStats: set()},
+    lambda ids: refresh_stats(ids[CategoryStats], ids[TagStats]),
+)
+
+
+def get_average(sum_field, sum_delta, count_delta):
+    # SQLite divides integers without the remainder, so the sum is a float
+    return Cast(F(sum_field) + Value(sum_delta), FloatField()) / NullIf(F('published_count') + count_delta, 0)
+
+
+def update_stats_rows(stats_model, ids, removed=None, added=None):
+    """
+    Applies the difference between the removed and the added values of a product to statistics rows
+    with one UPDATE. Minimum and maximum prices are recalculated only in rows the removed price was one of.
+
+    :param removed: PRODUCT_STATS_VALUES the product took away from the rows or None
+    :param added: PRODUCT_STATS_VALUES the product added to the rows or None
+    """
+    product_delta, published_delta, price_delta, rating_delta = 0, 0, Decimal(0), Decimal(0)
+
+    for values, sign in ((removed, -1), (added, 1)):
+        if values is None:
+            continue
+        product_delta += sign
+        if values['is_published']:
+            published_delta += sign
+            price_delta += sign * values['price']
+            rating_delta += sign * values['rating']
+
+    queryset = stats_model.objects.filter(pk__in=ids)
+    changes = {
+        'product_count': F('product_count') + product_delta,
+        'published_count': F('published_count') + published_delta,
+        'price_sum': F('price_sum') + Value(price_delta),
+        'rating_sum': F('rating_sum') + Value(rating_delta),
+        'avg_price': get_average('price_sum', price_delta, published_delta),
+        'avg_rating': get_average('rating_sum', rating_delta, published_delta),
+        'updated_at': timezone.now(),
+    }
+
+    if added is not None and added['is_published']:
+        price = Value(added['price'])
+        changes['min_price'] = Least(Coalesce(F('min_price'), price), price)
+        changes['max_price'] = Greatest(Coalesce(F('max_price'), price), price)
+
+    removed_price = removed['price'] if removed is not None and removed['is_published'] else None
+
+    if added is not None and added['is_published'] and added['price'] == removed_price:
+        removed_price = None
+
+    with transaction.atomic():
+        if product_delta > 0:
+            # the first product of a category or a tag
+            stats_model.objects.bulk_create([stats_model(pk=pk) for pk in ids], ignore_conflicts=True)
+
+        queryset.update(**changes)
+
+        if product_delta < 0:
+            queryset.filter(product_count__lte=0).delete()
+
+        if removed_price is not None:
+            stale_ids = list(
+                queryset.filter(Q(min_price=removed_price) | Q(max_price=removed_price)).values_list('pk', flat=True)
+            )
+            if stale_ids:
+                refresh_stats_rows(stats_model, stale_ids)
+
+
+def apply_stats_difference(stats_model, ids, removed=None, added=None):
+    """
+    Updates statistics of the given categories or tags by the values of one product,
+    inside deferred_stats_refresh they are recalculated on its exit instead.
+    """
+    ids = set(ids) - {None}
+
+    if not ids or removed == added:
+        return
+
+    deferred = deferred_stats_refresh.collected
+
+    if deferred is not None:
+        deferred[stats_model].update(ids)
+        return
+
+    update_stats_rows(stats_model, ids, removed, added)
+    bump_generation(stats_model)
+
+
+def get_stats_values(values):
+    """
+    :param values: mapping with PRODUCT_STATS_VALUES
+    :return: the values as they are stored, values assigned in code are not converted by the fields
+    """
+    return {
+        'category_id': values['category_id'],
+        'is_published': bool(values['is_published']),
+        'price': Decimal(str(values['price'] or 0)),
+        'rating': Decimal(str(values['rating'] or 0)),
+    }
+
+
+def get_loaded_values(product):
+    """
+    :return: dict of PRODUCT_STATS_VALUES the product was loaded with, taken from its row on the first call
+    """
+    if '_loaded_values' not in product.__dict__:
+        field_names, values = getattr(product, '_loaded_row', ((), ()))
+        product._loaded_values = {
+            name: value for name, value in zip(field_names, values) if name in PRODUCT_STATS_VALUES
+        }
+
+    return product._loaded_values
+
+
+def get_loaded_stats_values(product):
+    """
+    :return: PRODUCT_STATS_VALUES of the product in the database or None when they were not loaded
+    """
+    loaded = get_loaded_values(product)
+
+    if not all(name in loaded for name in PRODUCT_STATS_VALUES):
+        return None
+
+    return get_stats_values(loaded)
+
+
+def load_stats_values(product):
+    """
+    Loads PRODUCT_STATS_VALUES of a changed product before it is saved, when they were deferred or it was not loaded.
+    """
+    if get_loaded_stats_values(product) is not None:
+        return
+
+    values = Product.objects.filter(pk=product.pk).values(*PRODUCT_STATS_VALUES).first()
+
+    if values is not None:
+        get_loaded_values(product).update(values)
+
+
+def get_product_tag_ids(product):
+    tags = getattr(product, '_prefetched_objects_cache', {}).get('tags')
+
+    if tags is not None:
+        return {tag.pk for tag in tags}
+
+    return set(product.tags.values_list('pk', flat=True))
+
+
+def update_product_stats(product, created=False, update_fields=None):
+    """
+    Applies the difference a saved product makes to statistics of its category and tags.
+    Tags of a new product are added after it is saved, see update_product_tags_stats.
+    """
+    values = get_stats_values({name: getattr(product, name) for name in PRODUCT_STATS_VALUES})
+    loaded = None if created else get_loaded_stats_values(product)
+
+    if loaded is not None and update_fields is not None:
+        # fields which were not saved keep their values in the database
+        saved = {Product._meta.get_field(name).attname for name in update_fields}
+        values = {name: values[name] if name in saved else loaded[name] for name in PRODUCT_STATS_VALUES}
+
+    get_loaded_values(product).update(values)
+
+    if loaded == values:
+        return
+
+    if loaded is None or loaded['category_id'] == values['category_id']:
+        apply_stats_difference(CategoryStats, [values['category_id']], loaded, values)
+    else:
+        apply_stats_difference(CategoryStats, [loaded['category_id']], removed=loaded)
+        apply_stats_difference(CategoryStats, [values['category_id']], added=values)
+
+    if loaded is not None:
+        # the category is not a part of tag statistics
+        apply_stats_difference(TagStats, get_product_tag_ids(product), {**loaded, 'category_id': None},
+                               {**values, 'category_id': None})
+
+
+def get_product_stats_values(product):
+    """
+    :return: PRODUCT_STATS_VALUES of the product in the database, the current ones when they were not loaded
+    """
+    return get_loaded_stats_values(product) or get_stats_values(
+        {name: getattr(product, name) for name in PRODUCT_STATS_VALUES}
+    )
+
+
+def get_stats_scope(queryset):
+    """
+    :return: tuple of (category ids, tag ids) of the products
+    """
+    category_ids, tag_ids = set(), set()
+
+    for category_id, tag_id in queryset.order_by().values_list('category_id', 'tags').distinct():
+        category_ids.add(category_id)
+        if tag_id is not None:
+            tag_ids.add(tag_id)
+
+    return category_ids, tag_ids
+
+
+def rebuild_stats():
+    """
+    Recalculates statistics of all categories and tags.
+
+    :return: tuple of (the number of category rows, the number of tag rows)
+    """
+    counts = []
+
+    with transaction.atomic():
+        for stats_model in (CategoryStats, TagStats):
+            stats_model.objects.all().delete()
+            counts.append(len(stats_model.objects.bulk_create(aggregate_stats(stats_model), batch_size=1000)))
+
+    bump_generation(CategoryStats, TagStats)
+    return tuple(counts)
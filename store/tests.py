@@ -1,3 +1,1454 @@
-from django.test import TestCase
+import base64
+import csv
+import datetime
+import io
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+import shutil
+import tempfile
+import time
+import uuid
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import AsyncClient, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from phonenumber_field.phonenumber import PhoneNumber
+from PIL import Image
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from account.models import User
+from api.filters import PRODUCT_FACETS
+from api.parsers import FastJSONParser
+from api.renderers import FastJSONRenderer
+from api.urls import router
+from store.images import convert_image, get_pending_jobs, process_pending_images, requeue_processing_images
+from store.models import Category, Tag, Product, ProductImage, ProductAttribute, CategoryStats, TagStats
+from store.stats import STATS_FIELDS, aggregate_stats
+from store.thumbnails import VARIANTS, get_thumbnail_path
+from utils.cache import get_generations, get_process_caches
+from utils.choices import ImageStatus
+from utils.profiling import QueryRecorder, clear_records, get_report
+
+# caches of the test process, so runs do not share state with each other and the site
+TEST_CACHES = get_process_caches('test')
+
+
+def create_catalogue(size):
+    user = User.objects.create_user(email=f'seller{size}@example.com', password='password', phone=f'+99655500{size:04d}')
+    category = Category.objects.create(name=f'Категория {size}')
+    tags = [Tag.objects.create(name=f'Тег {size}-{i}') for i in range(3)]
+
+    for i in range(size):
+        product = Product.objects.create(
+            name=f'Товар {i}',
+            description='Описание',
+            content='Контент',
+            category=category,
+            price=100 + i,
+            user=user,
+            rating=4,
+        )
+        product.tags.add(*tags)
+        ProductImage.objects.create(product=product, image=f'product_images/{i}.webp')
+        ProductAttribute.objects.create(product=product, name='Цвет', value='Красный')
+
+
+@override_settings(CACHES=TEST_CACHES)
+class CatalogueTestCase(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        # generations are bumped on commit, which never happens inside a test
+        for alias in settings.CACHES:
+            caches[alias].clear()
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+
+class ProductQueryCountTest(CatalogueTestCase):
+
+    def test_list_query_count_does_not_depend_on_page_size(self):
+        create_catalogue(20)
+
+        small_page = self.count_queries('/api/v1/products/?page_size=2')
+        big_page = self.count_queries('/api/v1/products/?page_size=20')
+
+        self.assertEqual(small_page, big_page)
+
+    def test_retrieve_query_count(self):
+        create_catalogue(3)
+        product = Product.objects.first()
+
+        # validators for conditional get, product with category and user, tags, images, attributes
+        self.assertEqual(self.count_queries(f'/api/v1/products/{product.id}/'), 5)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ProductCoverImageTest(TestCase):
+
+    def test_cover_image_follows_product_images(self):
+        create_catalogue(1)
+        product = Product.objects.get()
+        self.assertEqual(product.cover_image.name, 'product_images/0.webp')
+
+        ProductImage.objects.create(product=product, image='product_images/new.webp')
+        product.refresh_from_db()
+        self.assertEqual(product.cover_image.name, 'product_images/new.webp')
+
+        product.images.filter(image='product_images/new.webp').delete()
+        product.refresh_from_db()
+        self.assertEqual(product.cover_image.name, 'product_images/0.webp')
+
+        product.images.all().delete()
+        product.refresh_from_db()
+        self.assertIsNone(product.image)
+
+    def test_image_does_not_query(self):
+        create_catalogue(1)
+        product = Product.objects.get()
+
+        with self.assertNumQueries(0):
+            self.assertEqual(product.image.name, 'product_images/0.webp')
+
+
+class ProductSearchTest(CatalogueTestCase):
+
+    def setUp(self):
+        super().setUp()
+        create_catalogue(1)
+        product = Product.objects.get()
+        self.in_content = Product.objects.create(
+            name='Чехол', description='Описание', content='Подходит для телефона', category=product.category,
+            user=product.user, rating=4,
+        )
+        self.in_name = Product.objects.create(
+            name='Телефон', description='Описание', content='Контент', category=product.category,
+            user=product.user, rating=4,
+        )
+
+    def search(self, query):
+        response = self.client.get('/api/v1/products/', {'search': query})
+        return [item['id'] for item in response.data['results']]
+
+    def test_search_ranks_name_matches_first(self):
+        self.assertEqual(self.search('телефон'), [self.in_name.id, self.in_content.id])
+
+    def test_search_by_prefix(self):
+        self.assertEqual(self.search('Чех'), [self.in_content.id])
+
+    def test_index_follows_changes(self):
+        self.in_name.name = 'Ноутбук'
+        self.in_name.save()
+        self.in_content.delete()
+
+        self.assertEqual(self.search('телефон'), [])
+        self.assertEqual(self.search('ноутбук'), [self.in_name.id])
+
+    def test_query_without_words(self):
+        for query in ("'", '""', '- ""'):
+            response = self.client.get('/api/v1/products/', {'search': query})
+            self.assertEqual(response.status_code, 200, query)
+            self.assertEqual(response.data['results'], [])
+
+    def test_relevance_is_not_paginated_by_cursor(self):
+        response = self.client.get('/api/v1/products/', {'search': 'телефон', 'pagination': 'cursor'})
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.get(
+            '/api/v1/products/', {'search': 'телефон', 'pagination': 'cursor', 'ordering': 'price'}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual({item['id'] for item in response.data['results']}, {self.in_name.id, self.in_content.id})
+
+
+@override_settings(CACHES=TEST_CACHES)
+class KeysetPaginationTest(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        create_catalogue(7)
+        # duplicated values are ordered by id
+        ids = Product.objects.order_by('id').values_list('id', flat=True)[1:4]
+        Product.objects.filter(id__in=list(ids)).update(price=50)
+
+    def walk(self, url, key='next'):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids.extend(item['id'] for item in response.data['results'])
+            url = response.data[key]
+        return ids
+
+    def test_pages_cover_every_product_once(self):
+        expected = list(Product.objects.order_by('price', 'id').values_list('id', flat=True))
+        ids = self.walk('/api/v1/products/?pagination=cursor&ordering=price&page_size=2')
+        self.assertEqual(ids, expected)
+
+    def test_previous_page(self):
+        first = self.client.get('/api/v1/products/?pagination=cursor&page_size=3').data
+        second = self.client.get(first['next']).data
+        self.assertNotIn('count', first)
+
+        previous = self.client.get(second['previous']).data
+        self.assertEqual(previous['results'], first['results'])
+        self.assertIsNone(previous['previous'])
+
+    def test_cursor_with_invalid_value(self):
+        for ordering in ('', 'price'):
+            for value in ('abc', None, [1]):
+                cursor = base64.urlsafe_b64encode(json.dumps({'v': value, 'i': 1}).encode()).decode()
+                response = self.client.get('/api/v1/products/', {
+                    'pagination': 'cursor', 'ordering': ordering, 'cursor': cursor,
+                })
+                self.assertEqual(response.status_code, 404, f'{ordering} {value}')
+
+    def test_count_is_optional(self):
+        response = self.client.get('/api/v1/products/?pagination=cursor&count=exact')
+        self.assertEqual(response.data['count'], 7)
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/v1/products/?cursor=invalid')
+        self.assertEqual(response.status_code, 404)
+
+
+class ResponseCacheTest(CatalogueTestCase):
+
+    def setUp(self):
+        super().setUp()
+        create_catalogue(2)
+        self.product = Product.objects.first()
+
+    def test_repeated_request_is_served_from_cache(self):
+        url = f'/api/v1/products/{self.product.id}/'
+
+        self.assertGreater(self.count_queries(url), 1)
+        # only validators for conditional get
+        self.assertEqual(self.count_queries(url), 1)
+
+    def test_generations_survive_clearing_of_cached_data(self):
+        generations = get_generations([Product, Category])
+        cache.clear()
+        self.assertEqual(get_generations([Product, Category]), generations)
+
+    def test_generations_are_bumped_on_commit(self):
+        generations = get_generations([Category])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.create(name='Новая')
+            self.assertEqual(get_generations([Category]), generations)
+
+        self.assertNotEqual(get_generations([Category]), generations)
+
+    def test_cache_is_invalidated_by_changes(self):
+        url = '/api/v1/products/?ordering=price'
+        self.client.get(url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.tags.clear()
+        tags = {item['id']: item['tags'] for item in self.client.get(url).data['results']}
+        self.assertEqual(tags[self.product.id], [])
+
+        self.product.category.name = 'Новая'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.category.save()
+        self.assertEqual(self.client.get(url).data['results'][0]['category']['name'], 'Новая')
+
+
+class ConditionalGetTest(CatalogueTestCase):
+
+    def setUp(self):
+        super().setUp()
+        create_catalogue(2)
+        self.product = Product.objects.first()
+
+    def test_not_modified(self):
+        for url in ['/api/v1/products/', f'/api/v1/products/{self.product.id}/', '/api/v1/categories/']:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+
+            with self.assertNumQueries(1):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.content, b'')
+
+    def test_etag_changes_with_related_objects(self):
+        url = f'/api/v1/products/{self.product.id}/'
+        etag = self.client.get(url)['ETag']
+
+        self.product.category.name = 'Новая'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.category.save()
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_last_modified_follows_deletions(self):
+        url = '/api/v1/products/'
+        last_modified = self.client.get(url)['Last-Modified']
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+        # Last-Modified has a precision of seconds
+        with mock.patch('utils.cache.time.time', return_value=time.time() + 60), \
+                self.captureOnCommitCallbacks(execute=True):
+            Product.objects.last().delete()
+
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 1)
+
+    def test_missing_product(self):
+        self.assertEqual(self.client.get('/api/v1/products/0/').status_code, 404)
+
+
+def create_image_bytes(size=(20, 20), image_format='PNG'):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, 'red').save(buffer, image_format)
+    return buffer.getvalue()
+
+
+class TemporaryMediaMixin:
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media_override = override_settings(MEDIA_ROOT=media_root)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+
+
+class CreateProductTest(TemporaryMediaMixin, CatalogueTestCase):
+
+    def setUp(self):
+        super().setUp()
+        create_catalogue(1)
+        self.product = Product.objects.get()
+        self.client.force_authenticate(self.product.user)
+
+    def get_data(self, images):
+        return {
+            'name': 'Новый',
+            'description': 'Описание',
+            'content': 'Контент',
+            'category': self.product.category_id,
+            'tags': [tag.id for tag in self.product.tags.all()],
+            'price': '10.00',
+            'rating': '5',
+            'images': images,
+        }
+
+    def test_create_with_base64_images(self):
+        image = 'data:image/png;base64,' + base64.b64encode(create_image_bytes()).decode()
+        data = {**self.get_data([image, image]), 'attributes': [{'name': 'Цвет', 'value': 'Синий'}]}
+
+        response = self.client.post('/api/v1/products/', data, format='json')
+
+        self.assertEqual(response.status_code, 201, response.data)
+        product = Product.objects.get(name='Новый')
+        self.assertEqual(product.images.count(), 2)
+        self.assertTrue(product.cover_image.name.endswith('.png'))
+
+    def test_create_with_uploaded_images(self):
+        image = SimpleUploadedFile('image.png', create_image_bytes(), 'image/png')
+        data = {**self.get_data([image]), 'attributes[0]name': 'Цвет', 'attributes[0]value': 'Синий'}
+
+        response = self.client.post('/api/v1/products/', data, format='multipart')
+
+        self.assertEqual(response.status_code, 201, response.data)
+        product = Product.objects.get(name='Новый')
+        self.assertEqual(product.images.count(), 1)
+        self.assertEqual(product.attributes.get().value, 'Синий')
+
+    def test_invalid_image(self):
+        data = {**self.get_data(['bm90IGFuIGltYWdl']), 'attributes': []}
+
+        response = self.client.post('/api/v1/products/', data, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('images', response.data)
+
+
+class ImageProcessingTest(TemporaryMediaMixin, CatalogueTestCase):
+
+    def setUp(self):
+        super().setUp()
+        create_catalogue(1)
+        self.product = Product.objects.get()
+        self.product.images.all().delete()
+
+    def add_image(self, size):
+        product_image = ProductImage(product=self.product)
+        product_image.image.save('image.png', SimpleUploadedFile('image.png', create_image_bytes(size)))
+        return product_image
+
+    def test_images_are_converted_in_process_pool(self):
+        images = [self.add_image((3000, 1500)) for _ in range(3)]
+        self.assertEqual({image.processing_status for image in images}, {ImageStatus.PENDING})
+
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            self.assertEqual(process_pending_images(executor), 3)
+
+        for image in ProductImage.objects.all():
+            self.assertEqual(image.processing_status, ImageStatus.DONE)
+            self.assertTrue(image.image.name.endswith('.webp'))
+            self.assertEqual((image.image.width, image.image.height), (1920, 960))
+
+        self.product.refresh_from_db()
+        self.assertTrue(self.product.cover_image.name.endswith('.webp'))
+
+    def test_avatar_is_cropped(self):
+        user = self.product.user
+        user.avatar = SimpleUploadedFile('avatar.png', create_image_bytes((800, 600)))
+        user.save()
+        self.assertEqual(user.avatar_status, ImageStatus.PENDING)
+
+        process_pending_images()
+
+        user.refresh_from_db()
+        self.assertEqual(user.avatar_status, ImageStatus.DONE)
+        self.assertEqual((user.avatar.width, user.avatar.height), (500, 500))
+
+    def test_broken_image(self):
+        product_image = ProductImage.objects.create(product=self.product, image='product_images/missing.png')
+
+        process_pending_images()
+
+        product_image.refresh_from_db()
+        self.assertEqual(product_image.processing_status, ImageStatus.FAILED)
+        self.assertEqual(product_image.image.name, 'product_images/missing.png')
+
+    def test_claimed_images_are_not_processed_twice(self):
+        images = [self.add_image((40, 40)) for _ in range(2)]
+
+        jobs = get_pending_jobs(limit=10)
+        self.assertEqual({job.instance.pk for job in jobs}, {image.pk for image in images})
+        self.assertEqual(get_pending_jobs(limit=10), [])
+        self.assertEqual(process_pending_images(), 0)
+
+        self.assertEqual(requeue_processing_images(), 2)
+        self.assertEqual(process_pending_images(), 2)
+
+    def test_image_deleted_while_processed(self):
+        self.add_image((40, 40))
+        kept = self.add_image((40, 40))
+        jobs = get_pending_jobs(limit=10)
+        ProductImage.objects.exclude(pk=kept.pk).delete()
+
+        for job in jobs:
+            convert_image(job.source, job.target, **job.options)
+            job.finish()
+
+        kept.refresh_from_db()
+        self.assertEqual(kept.processing_status, ImageStatus.DONE)
+        self.assertEqual(ProductImage.objects.count(), 1)
+
+
+class ThumbnailTest(TemporaryMediaMixin, CatalogueTestCase):
+
+    def setUp(self):
+        super().setUp()
+        create_catalogue(1)
+        self.product = Product.objects.get()
+        self.product.images.all().delete()
+        self.images = []
+        for i in range(3):
+            product_image = ProductImage(product=self.product)
+            product_image.image.save(f'image{i}.png', SimpleUploadedFile('image.png', create_image_bytes((900, 900))))
+            self.images.append(product_image)
+
+    def test_srcset_variants(self):
+        product = self.client.get('/api/v1/products/').data['results'][0]
+        candidates = [candidate.split() for candidate in product['image_srcset'].split(', ')]
+        self.assertEqual([width for _, width in candidates], ['150w', '600w', '1200w'])
+
+        response = self.client.get(candidates[0][0])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Image.open(io.BytesIO(b''.join(response.streaming_content))).size, (150, 150))
+        response.close()
+
+    def test_unknown_image(self):
+        self.assertEqual(self.client.get('/api/v1/thumbnails/thumb/product_images/missing.png').status_code, 404)
+        self.assertEqual(self.client.get('/api/v1/thumbnails/thumb/../project/settings.py').status_code, 404)
+        self.assertEqual(self.client.get('/api/v1/thumbnails/huge/' + self.images[0].image.name).status_code, 404)
+
+    def test_broken_image(self):
+        name = default_storage.save('product_images/broken.png', ContentFile(b'not an image'))
+        url = f'/api/v1/thumbnails/thumb/{name}'
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+        with mock.patch('store.thumbnails.convert_image') as convert:
+            self.assertEqual(self.client.get(url).status_code, 404)
+        convert.assert_not_called()
+
+    def test_replaced_image_gets_new_variants(self):
+        name = self.images[0].image.name
+        path = get_thumbnail_path(name, 'thumb')
+
+        with open(default_storage.path(name), 'wb') as file:
+            file.write(create_image_bytes((300, 100)))
+
+        replaced_path = get_thumbnail_path(name, 'thumb')
+        self.assertNotEqual(replaced_path, path)
+        with Image.open(replaced_path) as image:
+            self.assertEqual(image.size, (150, 50))
+
+    def test_least_recently_used_are_evicted(self):
+        paths = [get_thumbnail_path(image.image.name, 'medium') for image in self.images[:2]]
+        get_thumbnail_path(self.images[0].image.name, 'medium')
+        size = os.path.getsize(paths[0])
+
+        with override_settings(THUMBNAIL_CACHE_MAX_BYTES=size * 2.5):
+            get_thumbnail_path(self.images[2].image.name, 'medium')
+
+        self.assertTrue(os.path.exists(paths[0]))
+        self.assertFalse(os.path.exists(paths[1]))
+
+
+class BulkCreateProductTest(TemporaryMediaMixin, CatalogueTestCase):
+
+    def setUp(self):
+        super().setUp()
+        create_catalogue(1)
+        self.product = Product.objects.get()
+        self.client.force_authenticate(self.product.user)
+        self.image = 'data:image/png;base64,' + base64.b64encode(create_image_bytes()).decode()
+
+    def get_data(self, count):
+        tags = list(self.product.tags.values_list('id', flat=True))
+        return [
+            {
+                'name': f'Импорт {i}',
+                'description': 'Описание',
+                'content': 'Контент',
+                'category': self.product.category_id,
+                'tags': tags,
+                'price': '10.00',
+                'rating': '5',
+                'images': [self.image],
+                'attributes': [{'name': 'Цвет', 'value': 'Синий'}, {'name': 'Размер', 'value': 'L'}],
+            }
+            for i in range(count)
+        ]
+
+    def bulk_create(self, count):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post('/api/v1/products/bulk/', self.get_data(count), format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        return response, len(context.captured_queries)
+
+    def test_bulk_create(self):
+        response, _ = self.bulk_create(3)
+
+        products = Product.objects.filter(id__in=response.data['ids'])
+        self.assertEqual(products.count(), 3)
+        for product in products:
+            self.assertEqual(product.tags.count(), 3)
+            self.assertEqual(product.attributes.count(), 2)
+            self.assertEqual(product.cover_image.name, product.images.get().image.name)
+
+        search = self.client.get('/api/v1/products/', {'search': 'импорт'}).data
+        self.assertEqual(search['count'], 3)
+
+    def test_query_count_does_not_depend_on_size(self):
+        self.assertEqual(self.bulk_create(2)[1], self.bulk_create(6)[1])
+
+    def test_invalid_item(self):
+        data = self.get_data(2)
+        data[1]['category'] = 0
+
+        response = self.client.post('/api/v1/products/bulk/', data, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('category', response.data[1])
+        self.assertEqual(Product.objects.count(), 1)
+
+    def test_booleans_and_floats_are_not_primary_keys(self):
+        data = self.get_data(2)
+        data[0]['category'] = True
+        data[1]['category'] = float(self.product.category_id)
+
+        response = self.client.post('/api/v1/products/bulk/', data, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('category', response.data[0])
+        self.assertIn('category', response.data[1])
+
+    def test_size_is_limited(self):
+        with override_settings(BULK_CREATE_MAX_ITEMS=2):
+            response = self.client.post('/api/v1/products/bulk/', self.get_data(3), format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Product.objects.count(), 1)
+
+    def test_stored_images_are_removed_on_failure(self):
+        with mock.patch.object(ProductImage.objects, 'bulk_create', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.client.post('/api/v1/products/bulk/', self.get_data(2), format='json')
+
+        self.assertEqual(Product.objects.count(), 1)
+        self.assertEqual(os.listdir(default_storage.path('product_images')), [])
+
+
+class BulkUpdateDestroyTest(CatalogueTestCase):
+
+    def setUp(self):
+        super().setUp()
+        create_catalogue(4)
+        create_catalogue(1)
+        self.owner = User.objects.get(email='seller4@example.com')
+        self.products = list(Product.objects.filter(user=self.owner).order_by('id'))
+        self.foreign = Product.objects.exclude(user=self.owner).get()
+        self.client.force_authenticate(self.owner)
+
+    def test_update_items(self):
+        tag = Tag.objects.create(name='Скидка')
+        data = [
+            {'id': self.products[0].id, 'price': '1.00', 'name': 'Уценка'},
+            {'id': self.products[1].id, 'is_published': False, 'tags': [tag.id]},
+        ]
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.patch('/api/v1/products/bulk/', data, format='json')
+
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.data, {'updated': 2})
+        # includes a fixed number of queries refreshing category and tag statistics
+        self.assertLess(len(context.captured_queries), 25)
+
+        first, second = Product.objects.filter(id__in=[item['id'] for item in data]).order_by('id')
+        self.assertEqual((first.price, first.name), (1, 'Уценка'))
+        self.assertFalse(second.is_published)
+        self.assertEqual(list(second.tags.all()), [tag])
+        self.assertEqual(self.client.get('/api/v1/products/', {'search': 'уценка'}).data['count'], 1)
+
+    def test_update_same_data(self):
+        ids = [product.id for product in self.products]
+
+        response = self.client.patch('/api/v1/products/bulk/', {'ids': ids, 'data': {'is_published': False}},
+                                     format='json')
+
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertFalse(Product.objects.filter(id__in=ids, is_published=True).exists())
+
+    def test_invalid_patch(self):
+        data = [{'id': self.products[0].id, 'price': '1.00'}, {'id': self.products[1].id, 'price': '-1'}]
+
+        response = self.client.patch('/api/v1/products/bulk/', data, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data[0], {})
+        self.assertIn('price', response.data[1])
+
+    def test_foreign_products(self):
+        ids = [self.products[0].id, self.foreign.id]
+
+        response = self.client.delete('/api/v1/products/bulk/', {'ids': ids}, format='json')
+
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(Product.objects.filter(id__in=ids).count(), 2)
+
+    def test_destroy(self):
+        ids = [product.id for product in self.products[:3]]
+
+        response = self.client.delete('/api/v1/products/bulk/', {'ids': ids}, format='json')
+
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(Product.objects.filter(id__in=ids).exists())
+        self.assertEqual(self.client.get('/api/v1/products/', {'search': 'товар'}).data['count'], 2)
+
+    def test_destroy_query_count_is_constant(self):
+        def destroy(products):
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.delete('/api/v1/products/bulk/', {'ids': [p.id for p in products]}, format='json')
+            self.assertEqual(response.status_code, 204)
+            return len(context.captured_queries)
+
+        self.assertEqual(destroy(self.products[:1]), destroy(self.products[1:]))
+        self.assertEqual(self.client.get('/api/v1/products/', {'search': 'товар'}).data['count'], 1)
+        self.assertEqual(list(CategoryStats.objects.values_list('product_count', flat=True)), [1])
+
+    def test_attributes_and_images(self):
+        attributes = ProductAttribute.objects.filter(product__user=self.owner)
+        data = [{'id': attribute.id, 'value': 'Зелёный'} for attribute in attributes]
+
+        response = self.client.patch('/api/v1/attributes/bulk/', data, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(set(attributes.values_list('value', flat=True)), {'Зелёный'})
+
+        images = list(ProductImage.objects.filter(product__user=self.owner).values_list('id', flat=True))
+        response = self.client.delete('/api/v1/images/bulk/', {'ids': images}, format='json')
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(Product.objects.filter(user=self.owner).exclude(cover_image=None).exists())
+
+        response = self.client.delete('/api/v1/attributes/bulk/', {'ids': [self.foreign.attributes.get().id]},
+                                      format='json')
+        self.assertEqual(response.status_code, 403)
+
+    def test_destroy_images_updates_covers_once(self):
+        product = self.products[0]
+        for index in range(3):
+            ProductImage.objects.create(product=product, image=f'product_images/extra-{index}.jpg')
+        kept = ProductImage.objects.create(product=product, image='product_images/kept.jpg')
+
+        def destroy(ids):
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.delete('/api/v1/images/bulk/', {'ids': ids}, format='json')
+            self.assertEqual(response.status_code, 204)
+            return len(context.captured_queries)
+
+        single = destroy([product.images.exclude(pk=kept.pk).first().pk])
+        many = destroy(list(ProductImage.objects.filter(product__user=self.owner).exclude(pk=kept.pk)
+                            .values_list('id', flat=True)))
+
+        self.assertEqual(single, many)
+        product.refresh_from_db()
+        self.assertEqual(product.cover_image, kept.image.name)
+        self.assertFalse(Product.objects.filter(user=self.owner).exclude(pk=product.pk)
+                         .exclude(cover_image=None).exists())
+
+    def test_duplicate_ids(self):
+        product_id = self.products[0].id
+
+        response = self.client.delete('/api/v1/products/bulk/', {'ids': [product_id, product_id]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('ids', response.data)
+
+        data = [{'id': product_id, 'price': '1.00'}, {'id': product_id, 'price': '2.00'}]
+        response = self.client.patch('/api/v1/products/bulk/', data, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('items', response.data)
+        self.assertTrue(Product.objects.filter(pk=product_id).exists())
+
+
+class ExportTest(CatalogueTestCase):
+
+    def setUp(self):
+        super().setUp()
+        create_catalogue(3)
+        self.client.force_authenticate(User.objects.get())
+
+    def test_export_jsonl(self):
+        response = self.client.get('/api/v1/products/export/', {'type': 'jsonl', 'ordering': 'price'})
+
+        self.assertEqual(response.status_code, 200)
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([row['id'] for row in rows], sorted(Product.objects.values_list('id', flat=True)))
+        self.assertEqual(rows[0]['tags'], ['Тег 3-0', 'Тег 3-1', 'Тег 3-2'])
+        self.assertEqual(rows[0]['attributes'], [['Цвет', 'Красный']])
+        self.assertTrue(rows[0]['images'][0].startswith('http://testserver/media/'))
+
+    def test_export_csv_with_filters(self):
+        product = Product.objects.first()
+        response = self.client.get('/api/v1/products/export/', {'type': 'csv', 'min_price': product.price})
+
+        rows = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(len(rows), Product.objects.filter(price__gte=product.price).count())
+        self.assertEqual(rows[0]['tags'], 'Тег 3-0|Тег 3-1|Тег 3-2')
+        self.assertEqual(rows[0]['attributes'], 'Цвет=Красный')
+
+    def test_query_count_does_not_depend_on_size(self):
+        queries = self.count_queries('/api/v1/products/export/')
+        create_catalogue(10)
+        self.assertEqual(self.count_queries('/api/v1/products/export/'), queries)
+
+    def test_export_json(self):
+        response = self.client.get('/api/v1/products/export/', {'type': 'json'})
+
+        rows = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[0]['price'], '100.00')
+
+    def test_unknown_type(self):
+        self.assertEqual(self.client.get('/api/v1/products/export/', {'type': 'xml'}).status_code, 400)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ExplainProductQueriesTest(TestCase):
+
+    def test_plans_use_indexes(self):
+        create_catalogue(5)
+        stdout = io.StringIO()
+
+        call_command('explain_product_queries', '--verbose-plan', '--fail-on-scan', stdout=stdout)
+
+        output = stdout.getvalue()
+        self.assertNotIn('FULL SCAN', output)
+        for index in ('product_created_idx', 'product_price_idx', 'product_rating_idx', 'product_category_price_idx'):
+            self.assertIn(index, output)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ImportCatalogueTest(TemporaryMediaMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(email='importer@example.com', password='password', phone='+996555000999')
+        self.category = Category.objects.create(name='Одежда')
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+        with open(os.path.join(self.directory, 'photo.png'), 'wb') as file:
+            file.write(create_image_bytes())
+
+    def get_row(self, name, **fields):
+        return {
+            'name': name,
+            'description': 'Описание',
+            'content': 'Контент',
+            'category': 'Одежда',
+            'tags': ['Новинка'],
+            'price': '100.00',
+            'rating': '4.0',
+            'attributes': [['Цвет', 'Красный']],
+            'images': [],
+            **fields,
+        }
+
+    def write_jsonl(self, rows):
+        path = os.path.join(self.directory, 'products.jsonl')
+        with open(path, 'w') as file:
+            file.writelines(json.dumps(row) + '\n' for row in rows)
+        return path
+
+    def import_catalogue(self, path, *args):
+        call_command('import_catalogue', path, '--user', self.user.email, *args, stdout=io.StringIO())
+
+    def test_import_jsonl(self):
+        data_uri = 'data:image/png;base64,' + base64.b64encode(create_image_bytes()).decode()
+        path = self.write_jsonl([
+            self.get_row('Футболка', images=[data_uri, 'photo.png']),
+            self.get_row('Куртка', category='Верхняя одежда', tags=['Новинка', 'Зима']),
+        ])
+
+        self.import_catalogue(path, '--workers', '2')
+
+        shirt = Product.objects.get(name='Футболка')
+        self.assertEqual(shirt.category, self.category)
+        self.assertEqual(shirt.user, self.user)
+        self.assertEqual(shirt.images.count(), 2)
+        self.assertEqual(shirt.cover_image.name, shirt.images.first().image.name)
+        self.assertTrue(all(image.processing_status == ImageStatus.PENDING for image in shirt.images.all()))
+        self.assertEqual(list(shirt.attributes.values_list('name', 'value')), [('Цвет', 'Красный')])
+
+        jacket = Product.objects.get(name='Куртка')
+        self.assertEqual(jacket.category.name, 'Верхняя одежда')
+        self.assertEqual(sorted(jacket.tags.values_list('name', flat=True)), ['Зима', 'Новинка'])
+        self.assertEqual(Tag.objects.filter(name='Новинка').count(), 1)
+        self.assertFalse(os.path.exists(f'{path}.checkpoint'))
+
+    def test_import_csv_export(self):
+        create_catalogue(3)
+        for product_image in ProductImage.objects.all():
+            default_storage.save(product_image.image.name, ContentFile(create_image_bytes()))
+        output = io.StringIO()
+        call_command('export_catalogue', '--format', 'csv', stdout=output)
+        path = os.path.join(self.directory, 'products.csv')
+        with open(path, 'w') as file:
+            file.write(output.getvalue())
+
+        self.import_catalogue(path, '--workers', '0', '--images-dir', settings.MEDIA_ROOT)
+
+        self.assertEqual(Product.objects.filter(user=self.user).count(), 3)
+        self.assertEqual(Category.objects.count(), 2)
+        self.assertEqual(Tag.objects.count(), 3)
+        product = Product.objects.filter(user=self.user).first()
+        self.assertEqual(product.tags.count(), 3)
+        self.assertEqual(product.attributes.get().value, 'Красный')
+        self.assertEqual(product.images.count(), 1)
+        self.assertTrue(default_storage.exists(product.images.get().image.name))
+
+    def test_skips_image_paths_outside_of_images_dir(self):
+        outside = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, outside, ignore_errors=True)
+        shutil.copy(os.path.join(self.directory, 'photo.png'), outside)
+        path = self.write_jsonl([
+            self.get_row('Абсолютный путь', images=[os.path.join(outside, 'photo.png')]),
+            self.get_row('Родительская папка', images=[os.path.relpath(os.path.join(outside, 'photo.png'), self.directory)]),
+            self.get_row('Футболка', images=[settings.MEDIA_URL + 'photo.png']),
+        ])
+
+        with self.assertLogs('store.imports', 'WARNING'):
+            self.import_catalogue(path, '--workers', '0')
+
+        self.assertEqual(list(Product.objects.values_list('name', flat=True)), ['Футболка'])
+        self.assertEqual(Product.objects.get().images.count(), 1)
+
+    def test_skips_invalid_records(self):
+        path = self.write_jsonl([
+            self.get_row('Без рейтинга', rating=''),
+            self.get_row('Сломанное изображение', images=['missing.png']),
+            self.get_row('Футболка'),
+        ])
+
+        with self.assertLogs('store.imports', 'WARNING'):
+            self.import_catalogue(path, '--workers', '0')
+
+        self.assertEqual(list(Product.objects.values_list('name', flat=True)), ['Футболка'])
+
+    def test_resume_from_checkpoint(self):
+        path = self.write_jsonl([self.get_row(f'Товар {i}') for i in range(5)])
+        with open(f'{path}.checkpoint', 'w') as file:
+            json.dump({'source': path, 'records': 3}, file)
+
+        self.import_catalogue(path, '--workers', '0', '--batch-size', '1')
+
+        self.assertEqual(sorted(Product.objects.values_list('name', flat=True)), ['Товар 3', 'Товар 4'])
+        self.assertFalse(os.path.exists(f'{path}.checkpoint'))
+
+    def test_checkpoint_is_saved_after_every_batch(self):
+        path = self.write_jsonl([self.get_row(f'Товар {i}') for i in range(5)])
+        saved = []
+
+        with mock.patch('store.imports.Checkpoint.clear'), \
+                mock.patch('store.imports.Checkpoint.save', autospec=True,
+                           side_effect=lambda checkpoint, records: saved.append(records)):
+            self.import_catalogue(path, '--workers', '0', '--batch-size', '2')
+
+        self.assertEqual(saved, [2, 4, 5])
+
+
+class AsyncCatalogueTest(CatalogueTestCase):
+
+    def setUp(self):
+        super().setUp()
+        create_catalogue(15)
+        self.product = Product.objects.first()
+
+    def assertSameResponse(self, path):
+        response = self.client.get(f'/api/v1/async/{path}')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.content.decode().replace('/api/v1/async/', '/api/v1/'))
+        self.assertEqual(data, self.client.get(f'/api/v1/{path}').json())
+        return data
+
+    def test_list(self):
+        self.assertSameResponse('products/')
+        self.assertSameResponse('products/?page=2&ordering=price')
+        self.assertSameResponse(f'products/?min_price=105&category={self.product.category_id}')
+        self.assertSameResponse('categories/')
+        self.assertSameResponse('tags/?page_size=2')
+
+    def test_keyset_pagination(self):
+        page = self.assertSameResponse('products/?pagination=cursor&page_size=5&ordering=-price&count=exact')
+        self.assertSameResponse(page['next'].split('/api/v1/')[1])
+
+    def test_retrieve(self):
+        self.assertSameResponse(f'products/{self.product.pk}/')
+        self.assertSameResponse(f'categories/{self.product.category_id}/')
+        self.assertSameResponse(f'tags/{self.product.tags.first().pk}/')
+
+    def test_not_found(self):
+        self.assertEqual(self.client.get('/api/v1/async/products/0/').status_code, 404)
+        self.assertEqual(self.client.get('/api/v1/async/products/?page=100').status_code, 404)
+        self.assertEqual(self.client.get('/api/v1/async/products/?category=0').status_code, 400)
+
+    def test_method_not_allowed(self):
+        self.assertEqual(self.client.post('/api/v1/async/products/').status_code, 405)
+
+
+class CompiledSerializerTest(CatalogueTestCase):
+
+    def setUp(self):
+        super().setUp()
+        create_catalogue(5)
+        ProductImage.objects.filter(product=Product.objects.last()).delete()
+        Product.objects.filter(pk=Product.objects.first().pk).update(description='', rating='1.5')
+
+    def assertSameContent(self, url):
+        compiled = self.client.get(url)
+        cache.clear()
+
+        with override_settings(COMPILED_SERIALIZERS=False):
+            plain = self.client.get(url)
+
+        self.assertEqual(compiled.status_code, 200)
+        self.assertEqual(compiled.content, plain.content)
+
+    def test_list_is_byte_identical(self):
+        self.assertSameContent('/api/v1/products/')
+
+    def test_detail_is_byte_identical(self):
+        for product in Product.objects.all():
+            self.assertSameContent(f'/api/v1/products/{product.pk}/')
+
+    def test_srcset_of_names_with_special_characters(self):
+        name = 'product_images/фото 1+2&3#.webp'
+        product_image = ProductImage.objects.first()
+        ProductImage.objects.filter(pk=product_image.pk).update(image=name)
+
+        response = self.client.get(f'/api/v1/products/{product_image.product_id}/')
+
+        srcset = response.json()['images'][0]['srcset']
+        urls = [
+            'http://testserver' + reverse('thumbnail', kwargs={'variant': variant, 'name': name})
+            for variant in VARIANTS
+        ]
+        self.assertEqual(srcset, ', '.join(f'{url} {width}w' for url, (width, _) in zip(urls, VARIANTS.values())))
+
+
+class FastJSONTest(CatalogueTestCase):
+    data = {
+        'name': 'Товар\u2028"1"',
+        'price': Decimal('10.50'),
+        'created_at': datetime.datetime(2024, 1, 2, 3, 4, 5, 678901, tzinfo=datetime.timezone.utc),
+        'date': datetime.date(2024, 1, 2),
+        'phone': PhoneNumber.from_string('+996555000111'),
+        'items': [1, 2.5, None, True, {'id': uuid.UUID(int=1)}],
+        1: 'non-string key',
+    }
+
+    def assertSameAsJSONRenderer(self, data):
+        expected = JSONRenderer().render(data)
+        self.assertEqual(FastJSONRenderer().render(data), expected)
+
+        with mock.patch('utils.json.orjson', None):
+            self.assertEqual(FastJSONRenderer().render(data), expected)
+
+    def test_renderer_output_is_the_same(self):
+        # JSONRenderer does not know phone numbers and encodes decimals as floats
+        self.assertSameAsJSONRenderer({**self.data, 'phone': str(self.data['phone']), 'price': '10.50'})
+
+    def test_phone_numbers_and_decimals(self):
+        content = json.loads(FastJSONRenderer().render(self.data))
+        self.assertEqual(content['phone'], '+996555000111')
+        self.assertEqual(content['price'], '10.50')
+
+    def test_product_list(self):
+        create_catalogue(3)
+        response = self.client.get('/api/v1/products/')
+        self.assertEqual(response.content, JSONRenderer().render(response.data))
+
+    def test_parser(self):
+        parser = FastJSONParser()
+        self.assertEqual(parser.parse(io.BytesIO('{"name": "Товар"}'.encode())), {'name': 'Товар'})
+
+        for content in (b'{', b'{"price": NaN}'):
+            with self.assertRaises(ParseError):
+                parser.parse(io.BytesIO(content))
+
+
+class SparseFieldsTest(CatalogueTestCase):
+
+    def setUp(self):
+        super().setUp()
+        create_catalogue(5)
+        self.product = Product.objects.first()
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.json(), [query['sql'] for query in context.captured_queries]
+
+    def test_fields(self):
+        full, _ = self.get('/api/v1/products/')
+        data, queries = self.get('/api/v1/products/?fields=id,name,price,image')
+
+        self.assertEqual(
+            data['results'],
+            [{key: product[key] for key in ('id', 'name', 'price', 'image')} for product in full['results']],
+        )
+        page_query = queries[-1]
+        self.assertNotIn('JOIN', page_query)
+        self.assertNotIn('"content"', page_query)
+        self.assertFalse([query for query in queries if 'store_productimage' in query])
+
+    def test_nested_objects_are_collapsed_unless_expanded(self):
+        data, queries = self.get(f'/api/v1/products/{self.product.pk}/?fields=id,category,tags,images')
+
+        self.assertEqual(data, {
+            'id': self.product.pk,
+            'category': self.product.category_id,
+            'tags': list(self.product.tags.values_list('pk', flat=True)),
+            'images': list(self.product.images.values_list('pk', flat=True)),
+        })
+        self.assertFalse([query for query in queries if 'store_category' in query])
+        self.assertEqual(len([query for query in queries if 'store_productimage' in query]), 1)
+
+        data, _ = self.get(f'/api/v1/products/{self.product.pk}/?fields=id,category&expand=category')
+        self.assertEqual(data['category'], {'id': self.product.category_id, 'name': self.product.category.name})
+
+    def test_expand_without_fields(self):
+        data, _ = self.get('/api/v1/products/?expand=user')
+
+        product = data['results'][0]
+        self.assertEqual(product['user']['email'], 'seller5@example.com')
+        self.assertIsInstance(product['category'], int)
+        self.assertIn('image_srcset', product)
+
+    def test_keyset_pagination_with_fields(self):
+        data, _ = self.get('/api/v1/products/?fields=id&pagination=cursor&page_size=2&ordering=price')
+        next_page, queries = self.get(data['next'])
+
+        self.assertEqual(len(next_page['results']), 2)
+        self.assertEqual(len(queries), 2)
+
+    def test_unknown_fields(self):
+        response = self.client.get('/api/v1/products/?fields=id,password&expand=name')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()), {'fields', 'expand'})
+
+
+class FacetsTest(CatalogueTestCase):
+
+    def setUp(self):
+        super().setUp()
+        create_catalogue(3)
+        create_catalogue(5)
+        self.category = Category.objects.get(name='Категория 5')
+        Product.objects.filter(category=self.category, price__gte=103).update(
+            receive_type=Product.IN_STOCK, price=2000, rating=2
+        )
+
+    def get_facets(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.json(), len(context.captured_queries)
+
+    def test_counts(self):
+        facets, queries = self.get_facets('/api/v1/products/facets/')
+
+        self.assertEqual(queries, len(PRODUCT_FACETS))
+        self.assertEqual([(item['label'], item['count']) for item in facets['category']],
+                         [('Категория 5', 5), ('Категория 3', 3)])
+        self.assertEqual(len(facets['tags']), 6)
+        self.assertEqual({item['value']: item['count'] for item in facets['receive_type']},
+                         {Product.ORDER: 6, Product.IN_STOCK: 2})
+        self.assertEqual([item['count'] for item in facets['rating']], [0, 2, 0, 6, 0])
+        self.assertEqual([item['count'] for item in facets['price']], [6, 2, 0, 0, 0])
+
+    def test_own_filter_is_not_applied(self):
+        facets, _ = self.get_facets(
+            f'/api/v1/products/facets/?category={self.category.pk}&receive_type={Product.IN_STOCK}'
+        )
+
+        # each facet is narrowed by the filters of the other facets only
+        self.assertEqual([(item['label'], item['count']) for item in facets['category']], [('Категория 5', 2)])
+        self.assertEqual({item['value']: item['count'] for item in facets['receive_type']},
+                         {Product.ORDER: 3, Product.IN_STOCK: 2})
+        self.assertEqual([item['count'] for item in facets['price']], [0, 2, 0, 0, 0])
+
+        facets, _ = self.get_facets('/api/v1/products/facets/?min_price=1000')
+        self.assertEqual([item['count'] for item in facets['price']], [6, 2, 0, 0, 0])
+        self.assertEqual([item['count'] for item in facets['rating']], [0, 2, 0, 0, 0])
+
+    def test_invalid_filter(self):
+        response = self.client.get('/api/v1/products/facets/?category=0')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('category', response.json())
+
+
+class CatalogueStatsTest(CatalogueTestCase):
+
+    def setUp(self):
+        super().setUp()
+        create_catalogue(3)
+        create_catalogue(4)
+        self.category = Category.objects.get(name='Категория 4')
+        self.other_category = Category.objects.get(name='Категория 3')
+
+    def get_values(self, stats):
+        values = (getattr(stats, field) for field in STATS_FIELDS if field != 'updated_at')
+        # averages are stored rounded
+        return [None if value is None else round(value, 2) for value in values]
+
+    def assertStatsAreCurrent(self):
+        for stats_model in (CategoryStats, TagStats):
+            stored = {stats.pk: self.get_values(stats) for stats in stats_model.objects.all()}
+            calculated = {stats.pk: self.get_values(stats) for stats in aggregate_stats(stats_model)}
+            self.assertEqual(stored, calculated)
+
+    def test_product_changes(self):
+        self.assertEqual(CategoryStats.objects.get(pk=self.category.pk).product_count, 4)
+        product = Product.objects.filter(category=self.category).first()
+
+        product.price = 500
+        product.save()
+        self.assertEqual(CategoryStats.objects.get(pk=self.category.pk).max_price, 500)
+
+        product.category = self.other_category
+        product.is_published = False
+        product.save()
+        self.assertStatsAreCurrent()
+
+        tag = product.tags.first()
+        product.tags.remove(tag)
+        self.assertStatsAreCurrent()
+        tag.product_set.add(product)
+        product.tags.clear()
+        self.assertStatsAreCurrent()
+
+        Product.objects.filter(category=self.category).first().delete()
+        self.assertStatsAreCurrent()
+
+    def test_product_changes_are_applied_without_aggregation(self):
+        product = Product.objects.filter(category=self.category).order_by('price').last()
+        product.price += 1
+
+        with CaptureQueriesContext(connection) as context:
+            product.save()
+
+        sql = [query['sql'] for query in context.captured_queries]
+        self.assertFalse([query for query in sql if 'GROUP BY' in query or 'FROM "store_product" ' in query], sql)
+        self.assertStatsAreCurrent()
+
+        with CaptureQueriesContext(connection) as context:
+            product.save(update_fields=['name'])
+        self.assertFalse([query for query in context.captured_queries if 'stats' in query['sql']])
+
+        # the price is not saved
+        product.price, product.rating = 1, 1
+        product.save(update_fields=['rating'])
+        self.assertStatsAreCurrent()
+
+        Product.objects.get(pk=product.pk).delete()
+        self.assertStatsAreCurrent()
+
+        product = Product.objects.filter(category=self.category).first()
+        product.is_published = False
+        product.save()
+        self.assertStatsAreCurrent()
+
+    def test_empty_categories_have_no_rows(self):
+        Product.objects.filter(category=self.other_category).delete()
+
+        self.assertFalse(CategoryStats.objects.filter(pk=self.other_category.pk).exists())
+        data = self.client.get(f'/api/v1/categories/{self.other_category.pk}/?stats=true').json()
+        self.assertEqual(data['stats']['product_count'], 0)
+        self.assertIsNone(data['stats']['min_price'])
+
+    def test_bulk_update(self):
+        owner = User.objects.get(email='seller4@example.com')
+        self.client.force_authenticate(owner)
+        ids = list(Product.objects.filter(user=owner).values_list('pk', flat=True)[:2])
+
+        response = self.client.patch('/api/v1/products/bulk/', {'ids': ids, 'data': {'category': self.other_category.pk}},
+                                     format='json')
+
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(CategoryStats.objects.get(pk=self.category.pk).product_count, 2)
+        self.assertEqual(CategoryStats.objects.get(pk=self.other_category.pk).product_count, 5)
+        self.assertStatsAreCurrent()
+
+    def test_rebuild(self):
+        CategoryStats.objects.all().delete()
+        TagStats.objects.update(product_count=0)
+
+        out = io.StringIO()
+        call_command('rebuild_catalogue_stats', stdout=out)
+
+        self.assertIn('2 categories and 6 tags', out.getvalue())
+        self.assertStatsAreCurrent()
+
+    def test_api(self):
+        self.assertNotIn('stats', self.client.get('/api/v1/categories/').json()['results'][0])
+
+        queries = self.count_queries('/api/v1/categories/?stats=true')
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.create(name='Пустая')
+        self.assertEqual(self.count_queries('/api/v1/categories/?stats=true'), queries)
+
+        tags = self.client.get('/api/v1/tags/?stats=true').json()['results']
+        self.assertEqual(sorted(tag['stats']['product_count'] for tag in tags), [3, 3, 3, 4, 4, 4])
+
+
+@override_settings(PROFILING_SAMPLE_RATE=1)
+class ProfilingTest(CatalogueTestCase):
+
+    def setUp(self):
+        super().setUp()
+        clear_records()
+        create_catalogue(3)
+
+    def test_records_requests(self):
+        response = self.client.get('/api/v1/products/')
+
+        self.assertRegex(response['Server-Timing'],
+                         r'^total;dur=[\d.]+, db;dur=[\d.]+;desc="\d+ queries", serialize;dur=[\d.]+, render')
+        self.client.get(f'/api/v1/products/{Product.objects.first().pk}/')
+
+        report = {item['view']: item for item in get_report()}
+        self.assertEqual(set(report), {'ProductViewSet.list', 'ProductViewSet.retrieve'})
+        self.assertEqual(report['ProductViewSet.list']['requests'], 1)
+        self.assertGreater(report['ProductViewSet.list']['queries']['max'], 0)
+        self.assertEqual(report['ProductViewSet.list']['duplicate_queries']['max'], 0)
+        self.assertGreater(report['ProductViewSet.list']['serialize_time']['max'], 0)
+
+    async def test_records_async_requests(self):
+        response = await AsyncClient().get('/api/v1/async/products/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('serialize;dur=', response['Server-Timing'])
+        [item] = get_report()
+        self.assertEqual(item['view'], 'AsyncProductApiView')
+        self.assertGreater(item['queries']['max'], 0)
+        self.assertGreater(item['serialize_time']['max'], 0)
+
+    def test_duplicate_queries(self):
+        recorder = QueryRecorder()
+
+        with connection.execute_wrapper(recorder):
+            for product in Product.objects.all():
+                product.category.name
+
+        self.assertEqual(recorder.count, 4)
+        [(sql, count)] = recorder.get_duplicates()
+        self.assertIn('store_category', sql)
+        self.assertEqual(count, 3)
+
+    @override_settings(PROFILING_SAMPLE_RATE=0)
+    def test_disabled(self):
+        self.assertNotIn('Server-Timing', self.client.get('/api/v1/products/'))
+        self.assertEqual(get_report(), [])
+
+    def test_report_is_for_superusers(self):
+        self.assertEqual(self.client.get('/api/v1/profiling/').status_code, 401)
+
+        self.client.force_authenticate(User.objects.get(email='seller3@example.com'))
+        self.assertEqual(self.client.get('/api/v1/profiling/').status_code, 403)
+
+        self.client.force_authenticate(User.objects.create_superuser(
+            email='admin@example.com', password='password', phone='+996555999999'
+        ))
+        views = [item['view'] for item in self.client.get('/api/v1/profiling/').json()]
+        self.assertIn('ProfilingReportApiView', views)
+
+        self.assertEqual(self.client.delete('/api/v1/profiling/').status_code, 204)
+        # only the clearing request itself is left
+        self.assertEqual([(item['view'], item['requests']) for item in get_report()], [('ProfilingReportApiView', 1)])
+
+
+def get_read_routes():
+    """
+    Yields (url name, url) of every GET route of the API router, detail routes are taken for the first object.
+    """
+    for prefix, viewset, basename in router.registry:
+        for route in router.get_routes(viewset):
+            # extra action mappings are MethodMapper objects, their get attribute is a decorator
+            action = route.mapping['get'] if 'get' in route.mapping else None
+
+            if action is None or not hasattr(viewset, action):
+                continue
+
+            name = route.name.format(basename=basename)
+
+            if route.detail:
+                instance = viewset.queryset.model._default_manager.order_by('pk').first()
+                yield name, reverse(name, kwargs={viewset.lookup_url_kwarg or viewset.lookup_field: instance.pk})
+            else:
+                yield name, reverse(name)
+
+
+class RouterQueryCountTest(CatalogueTestCase):
+    """
+    Fails when the number of queries of a GET route of the API router grows with the number of rows
+    or exceeds the budget of the route. Anonymous requests are measured on a cache miss, a cache hit
+    and with If-None-Match of the first response.
+    """
+    sizes = (2, 8)
+    variants = [
+        {},
+        {'stats': 'true'},
+        {'fields': 'id,name,category,tags', 'expand': 'tags'},
+        {'pagination': 'cursor'},
+    ]
+    passes = ('authenticated', 'anonymous', 'anonymous cached', 'anonymous conditional')
+    # the most queries of a route in any variant, by pass
+    budgets = {
+        'product-list': (5, 5, 1, 1),
+        'product-detail': (5, 5, 1, 1),
+        'product-facets': (5, 5, 0, 0),
+        'product-export': (4, 0, 0, 0),
+        'category-list': (3, 3, 1, 1),
+        'category-detail': (2, 2, 1, 1),
+        'tag-list': (3, 3, 1, 1),
+        'tag-detail': (2, 2, 1, 1),
+    }
+    anonymous_statuses = {'product-export': 401}
+
+    def get(self, url, params, **headers):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, {'page_size': 100, **params}, **headers)
+            # streamed responses query the database while they are consumed
+            if response.streaming:
+                b''.join(response.streaming_content)
+
+        return response, len(context.captured_queries)
+
+    def measure(self, admin):
+        counts = {}
+
+        for name, url in get_read_routes():
+            for params in self.variants:
+                key = '&'.join(f'{key}={value}' for key, value in params.items())
+                cache.clear()
+
+                self.client.force_authenticate(admin)
+                response, counts[name, key, 'authenticated'] = self.get(url, params)
+                self.assertEqual(response.status_code, 200, f'{url} {params}')
+
+                self.client.force_authenticate(None)
+                status = self.anonymous_statuses.get(name, 200)
+                response, counts[name, key, 'anonymous'] = self.get(url, params)
+                self.assertEqual(response.status_code, status, f'{url} {params}')
+                cached, counts[name, key, 'anonymous cached'] = self.get(url, params)
+                self.assertEqual(cached.status_code, status, f'{url} {params}')
+
+                if response.has_header('ETag'):
+                    conditional, counts[name, key, 'anonymous conditional'] = \
+                        self.get(url, params, HTTP_IF_NONE_MATCH=response['ETag'])
+                    self.assertEqual(conditional.status_code, 304, f'{url} {params}')
+                else:
+                    counts[name, key, 'anonymous conditional'] = counts[name, key, 'anonymous cached']
+
+        return counts
+
+    def format_table(self, results):
+        header = ['route', 'params', 'pass', *(f'{size} rows' for size in self.sizes)]
+        rows = [[*key, *(str(counts[key]) for counts in results)] for key in results[0]]
+        widths = [max(len(row[index]) for row in [header, *rows]) for index in range(len(header))]
+        return '\n'.join('  '.join(cell.ljust(width) for cell, width in zip(row, widths)) for row in [header, *rows])
+
+    def test_query_count_does_not_depend_on_rows(self):
+        admin = User.objects.create_superuser(email='admin@example.com', password='password', phone='+996555999999')
+        results = []
+        total = 0
+
+        for size in self.sizes:
+            create_catalogue(size)
+            total += size
+            self.assertEqual(Product.objects.count(), total)
+            results.append(self.measure(admin))
+
+        self.assertIn(('product-list', '', 'anonymous cached'), results[0])
+        table = self.format_table(results)
+        grown = [key for key, count in results[0].items() if results[-1][key] != count]
+        self.assertFalse(grown, f'Query count depends on the number of rows:\n{table}')
+
+        self.assertEqual({name for name, _, _ in results[-1]}, set(self.budgets), 'Add budgets of new routes')
+        over = [
+            (*key, count) for key, count in results[-1].items()
+            if count > self.budgets[key[0]][self.passes.index(key[2])]
+        ]
+        self.assertFalse(over, f'Routes exceed their query budgets:\n{table}')
@@ -0,0 +1,143 @@
+import hashlib
+import os
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from PIL import Image
+
+from store.images import convert_image
+
+VARIANTS = {
+    'thumb': (150, 150),
+    'medium': (600, 600),
+    'large': (1200, 1200),
+}
+
+SOURCE_PREFIXES = ('product_images/', 'avatars/')
+DERIVATIVES_DIR = 'derivatives'
+TOTAL_BYTES_KEY = 'thumbnails:total-bytes'
+# sources which could not be converted are not tried again for this long
+BROKEN_SOURCE_TIMEOUT = 60 * 60
+# errors of PIL on files which are not images or are damaged
+IMAGE_ERRORS = (OSError, ValueError, SyntaxError, Image.DecompressionBombError)
+
+
+class BrokenImageError(Exception):
+    """
+    The source file is not an image which can be converted.
+    """
+
+
+def touch(path):
+    # the clock of file timestamps is coarse, derivatives made one after another would get the same time
+    now = time.time_ns()
+    os.utime(path, ns=(now, now))
+
+
+def get_max_bytes():
+    return getattr(settings, 'THUMBNAIL_CACHE_MAX_BYTES', 512 * 1024 * 1024)
+
+
+def get_derivative_name(name, variant, version):
+    """
+    The version of the source (its modification time and size) is a part of the name,
+    so an image replaced under the same name gets new derivatives.
+    """
+    digest = hashlib.sha1(f'{name}:{version}:{variant}:{VARIANTS[variant]}'.encode()).hexdigest()
+    return f'{DERIVATIVES_DIR}/{variant}/{digest[:2]}/{digest}.webp'
+
+
+def get_thumbnail_path(name, variant):
+    """
+    Returns the path of the variant of the stored image, generating it on the first request.
+
+    :raise FileNotFoundError: when the variant is unknown or there is no such image
+    :raise BrokenImageError: when the image can not be converted
+    """
+    if variant not in VARIANTS or not name.startswith(SOURCE_PREFIXES):
+        raise FileNotFoundError(name)
+
+    source = default_storage.path(name)
+    stat = os.stat(source)
+    derivative_name = get_derivative_name(name, variant, f'{stat.st_mtime_ns}-{stat.st_size}')
+    path = default_storage.path(derivative_name)
+
+    try:
+        # modification time is the last access time for LRU eviction
+        touch(path)
+        return path
+    except FileNotFoundError:
+        pass
+
+    broken_key = f'thumbnails:broken:{derivative_name}'
+
+    if cache.get(broken_key):
+        raise BrokenImageError(name)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    descriptor, temporary_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    os.close(descriptor)
+
+    try:
+        convert_image(source, temporary_path, VARIANTS[variant], quality=80)
+        os.replace(temporary_path, path)
+    except IMAGE_ERRORS as error:
+        os.remove(temporary_path)
+        cache.set(broken_key, True, BROKEN_SOURCE_TIMEOUT)
+        raise BrokenImageError(name) from error
+    except BaseException:
+        os.remove(temporary_path)
+        raise
+
+    touch(path)
+    add_cached_bytes(os.path.getsize(path))
+    return path
+
+
+def iter_derivatives():
+    root = default_storage.path(DERIVATIVES_DIR)
+
+    for directory, _, files in os.walk(root):
+        for file in files:
+            if file.endswith('.webp'):
+                path = os.path.join(directory, file)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield path, stat.st_size, stat.st_mtime_ns
+
+
+def add_cached_bytes(size):
+    try:
+        total = cache.incr(TOTAL_BYTES_KEY, size)
+    except ValueError:
+        total = sum(size for _, size, _ in iter_derivatives())
+        cache.set(TOTAL_BYTES_KEY, total, timeout=None)
+
+    if total > get_max_bytes():
+        evict()
+
+
+def evict():
+    """
+    Removes least recently used derivatives until they take less than 90% of THUMBNAIL_CACHE_MAX_BYTES.
+    """
+    derivatives = sorted(iter_derivatives(), key=lambda derivative: derivative[2])
+    total = sum(size for _, size, _ in derivatives)
+    limit = get_max_bytes() * 0.9
+
+    for path, size, _ in derivatives:
+        if total <= limit:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+    cache.set(TOTAL_BYTES_KEY, total, timeout=None)
+    return total
@@ -0,0 +1,82 @@
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from utils.deferred import Deferred
+
+
+def get_process_caches(name):
+    """
+    Returns CACHES with every cache replaced by one in the memory of this process,
+    so tests and benchmarks neither read nor invalidate the cache of the site.
+    """
+    return {
+        alias: {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': f'{name}-{alias}',
+            'TIMEOUT': options.get('TIMEOUT', 300),
+            'OPTIONS': {'MAX_ENTRIES': 100000},
+        }
+        for alias, options in settings.CACHES.items()
+    }
+
+
+def get_generation_cache():
+    # generations are kept apart from cached data, so culling of the data cache does not drop them
+    return caches[getattr(settings, 'GENERATION_CACHE_ALIAS', 'default')]
+
+
+def get_generation_key(model):
+    return f'generation:{model._meta.label_lower}'
+
+
+def get_generation_entries(models):
+    """
+    :return: list of (generation, timestamp of its change) of every model
+    """
+    cache = get_generation_cache()
+    keys = [get_generation_key(model) for model in models]
+    entries = cache.get_many(keys)
+    # a lost generation is a new one, changed now
+    missing = {key: new_generation() for key in keys if key not in entries}
+
+    if missing:
+        cache.set_many(missing, timeout=None)
+        entries.update(missing)
+
+    return [entries[key] for key in keys]
+
+
+def get_generations(models):
+    """
+    Returns the current generation of every model. A generation changes each time rows of the model change,
+    so it can be used as a part of a cache key to invalidate everything built from the model.
+    """
+    return [generation for generation, _ in get_generation_entries(models)]
+
+
+def new_generation():
+    # random tokens instead of counters so generations never repeat after the cache is cleared
+    return uuid.uuid4().hex, time.time()
+
+
+def bump_generation(*models):
+    deferred = deferred_generation_bumps.collected
+
+    if deferred is not None:
+        deferred.update(models)
+        return
+
+    # readers of the old rows could cache them under a generation bumped before the commit
+    transaction.on_commit(
+        lambda: get_generation_cache().set_many(
+            {get_generation_key(model): new_generation() for model in models}, timeout=None
+        )
+    )
+
+
+# every changed model is bumped once
+deferred_generation_bumps = Deferred(set, lambda models: bump_generation(*models))
@@ -0,0 +1,11 @@
+from django.db import models
+
+
+class ImageStatus(models.TextChoices):
+    """
+    Processing status of uploaded images, see store.images.
+    """
+    PENDING = 'pending', 'Ожидает обработки'
+    PROCESSING = 'processing', 'Обрабатывается'
+    DONE = 'done', 'Обработано'
+    FAILED = 'failed', 'Ошибка обработки'
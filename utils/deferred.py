@@ -0,0 +1,40 @@
+import threading
+from contextlib import contextmanager
+
+
+class Deferred:
+    """
+    Work deferred to the exit of a block, for operations which would repeat it for every changed row.
+    Calling the instance returns the context manager of the block, nested blocks of a thread are flushed
+    once on exit of the outermost one.
+
+    :param collect: returns a new empty collection of the deferred work
+    :param flush: called with the collection on exit, unless nothing was collected
+    """
+
+    def __init__(self, collect, flush):
+        self.collect = collect
+        self.flush = flush
+        self._local = threading.local()
+
+    @property
+    def collected(self):
+        """
+        The collection of the current block of this thread, None outside of blocks.
+        """
+        return getattr(self._local, 'collected', None)
+
+    @contextmanager
+    def __call__(self):
+        if self.collected is not None:
+            yield
+            return
+
+        self._local.collected = self.collect()
+
+        try:
+            yield
+        finally:
+            collected, self._local.collected = self._local.collected, None
+            if collected:
+                self.flush(collected)
@@ -0,0 +1,79 @@
+import decimal
+import json
+
+from phonenumber_field.phonenumber import PhoneNumber
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder as BaseJSONEncoder
+from rest_framework.utils.json import strict_constant
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class JSONEncoder(BaseJSONEncoder):
+    """
+    DRF encoder which also encodes phone numbers and keeps decimals exact when serializers do so.
+    """
+
+    def default(self, obj):
+        if isinstance(obj, PhoneNumber):
+            return str(obj)
+        if isinstance(obj, decimal.Decimal) and api_settings.COERCE_DECIMAL_TO_STRING:
+            return str(obj)
+        return super().default(obj)
+
+
+_encoder = JSONEncoder()
+
+if orjson is not None:
+    # datetimes are passed to the encoder to be formatted the same way as by DRF
+    ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+
+def escape_line_separators(content):
+    # the output stays a strict javascript subset, the same as of JSONRenderer
+    return content.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+
+
+def dumps(data):
+    """
+    Encodes data to compact UTF-8 JSON with orjson when it is installed and with the standard library otherwise.
+    The output is the same as of JSONRenderer with the default settings.
+    """
+    if orjson is not None:
+        content = orjson.dumps(data, default=_encoder.default, option=ORJSON_OPTIONS)
+    else:
+        content = json.dumps(data, cls=JSONEncoder, ensure_ascii=False, allow_nan=False,
+                             separators=(',', ':')).encode()
+
+    return escape_line_separators(content)
+
+
+def iter_dumps(items, chunk_size=100):
+    """
+    Encodes an iterable as a JSON array chunk by chunk, so large lists are never held in memory as a whole.
+    """
+    yield b'['
+    chunk = []
+    separator = b''
+
+    for item in items:
+        chunk.append(dumps(item))
+
+        if len(chunk) == chunk_size:
+            yield separator + b','.join(chunk)
+            chunk = []
+            separator = b','
+
+    if chunk:
+        yield separator + b','.join(chunk)
+
+    yield b']'
+
+
+def loads(content):
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content, parse_constant=strict_constant)
@@ -1,6 +1,8 @@
 import base64
+import binascii
 
 from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import TemporaryUploadedFile
 
 
 def base64_to_image_file(base64_string, filename='image'):
@@ -27,4 +29,47 @@ def base64_to_image_file(base64_string, filename='image'):
     # Create a ContentFile
     image_file = ContentFile(decoded_file, name=f'{filename}.{_format}')
 
-    return image_file
\ No newline at end of file
+    return image_file
+
+
+def base64_to_temporary_file(base64_string, filename='image', chunk_size=64 * 1024):
+    """
+    Decodes a base64 string chunk by chunk into a temporary file on disk,
+    so the decoded image is never held in memory as a whole.
+
+    :param base64_string: The base64-encoded string of the image
+    :param filename: The name to assign to the file without extension
+    :param chunk_size: The number of base64 characters decoded at once
+    :return: A TemporaryUploadedFile positioned at the start
+    """
+    _format = 'jpg'
+    start = 0
+
+    header_end = base64_string.find('base64,', 0, 256)
+
+    if header_end != -1:
+        header = base64_string[:header_end]
+        if header.startswith('data:'):
+            _format = header.split(';')[0].split(':')[1].split('/')[1]
+        start = header_end + len('base64,')
+
+    temporary_file = TemporaryUploadedFile(f'{filename}.{_format}', f'image/{_format}', 0, None)
+    leftover = ''
+
+    try:
+        for offset in range(start, len(base64_string), chunk_size):
+            chunk = leftover + ''.join(base64_string[offset:offset + chunk_size].split())
+            aligned = len(chunk) - len(chunk) % 4
+            temporary_file.write(base64.b64decode(chunk[:aligned], validate=True))
+            leftover = chunk[aligned:]
+
+        if leftover:
+            raise ValueError('Incorrect base64 padding')
+    except (ValueError, binascii.Error):
+        temporary_file.close()
+        raise
+
+    temporary_file.size = temporary_file.tell()
+    temporary_file.seek(0)
+
+    return temporary_file
@@ -0,0 +1,264 @@
+import random
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+# the number of repeated statements kept per request
+DUPLICATES_LIMIT = 3
+SQL_LENGTH_LIMIT = 300
+
+_records = None
+_lock = threading.Lock()
+
+
+def get_buffer():
+    global _records
+
+    if _records is None:
+        with _lock:
+            if _records is None:
+                _records = deque(maxlen=getattr(settings, 'PROFILING_BUFFER_SIZE', 1000))
+
+    return _records
+
+
+def add_record(record):
+    buffer = get_buffer()
+
+    with _lock:
+        buffer.append(record)
+
+
+def get_records():
+    buffer = get_buffer()
+
+    with _lock:
+        return list(buffer)
+
+
+def clear_records():
+    buffer = get_buffer()
+
+    with _lock:
+        buffer.clear()
+
+
+def get_view_name(view_func, method):
+    # DRF viewsets are reported by action, other class based views by class
+    view_class = getattr(view_func, 'cls', None) or getattr(view_func, 'view_class', None)
+
+    if view_class is None:
+        return f'{view_func.__module__}.{view_func.__qualname__}'
+
+    actions = getattr(view_func, 'actions', None)
+
+    if actions:
+        return f'{view_class.__name__}.{actions.get(method.lower(), method.lower())}'
+
+    return view_class.__name__
+
+
+class QueryRecorder:
+    """
+    Database execute wrapper counting statements and their time.
+    """
+
+    def __init__(self):
+        self.time = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.time += time.perf_counter() - start
+            self.statements[sql] += 1
+
+    @property
+    def count(self):
+        return sum(self.statements.values())
+
+    def get_duplicates(self):
+        """
+        :return: list of (statement, count) of statements executed more than once, the same SQL with any parameters
+        """
+        return [(sql[:SQL_LENGTH_LIMIT], count) for sql, count in self.statements.most_common() if count > 1]
+
+
+def time_serializer(request, serializer):
+    """
+    Adds the time serializer.data takes to the serialize time of the request when it is profiled.
+    """
+    profile = getattr(request, 'profiling', None)
+
+    if profile is None:
+        return serializer
+
+    to_representation = serializer.to_representation
+
+    def timed_to_representation(instance):
+        start = time.perf_counter()
+
+        try:
+            return to_representation(instance)
+        finally:
+            profile['serialize_time'] += time.perf_counter() - start
+
+    # .data calls the method of the instance, nested serializers are timed as a part of it
+    serializer.to_representation = timed_to_representation
+    return serializer
+
+
+class ProfilingMiddleware:
+    """
+    Records wall time, SQL statements, serialize and render time of a PROFILING_SAMPLE_RATE share of requests
+    into a ring buffer of PROFILING_BUFFER_SIZE records, reported by get_report().
+    Profiled responses get a Server-Timing header. The middleware is not loaded with the sample rate of 0.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.sample_rate = getattr(settings, 'PROFILING_SAMPLE_RATE', 0)
+
+        if not self.sample_rate:
+            raise MiddlewareNotUsed
+
+        self.get_response = get_response
+
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        if random.random() >= self.sample_rate:
+            return self.get_response(request)
+
+        recorder = self.start(request)
+
+        with ExitStack() as stack:
+            self.record_queries(stack, recorder)
+            response = self.get_response(request)
+
+        return self.finish(request, response, recorder)
+
+    async def __acall__(self, request):
+        if random.random() >= self.sample_rate:
+            return await self.get_response(request)
+
+        recorder = self.start(request)
+
+        stack = ExitStack()
+        # connections are local to the thread sync_to_async runs the queries of the request in
+        await sync_to_async(self.record_queries)(stack, recorder)
+
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+
+        return self.finish(request, response, recorder)
+
+    def start(self, request):
+        request.profiling = {'view': None, 'render_start': None, 'serialize_time': 0.0, 'start': time.perf_counter()}
+        return QueryRecorder()
+
+    def record_queries(self, stack, recorder):
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(recorder))
+
+    def finish(self, request, response, recorder):
+        profile = request.profiling
+        end = time.perf_counter()
+        # template responses, including the ones of DRF, are rendered after the view returns
+        render_time = end - profile['render_start'] if profile['render_start'] is not None else 0.0
+        duplicates = recorder.get_duplicates()
+
+        record = {
+            'view': profile['view'] or request.path,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'time': (end - profile['start']) * 1000,
+            'db_time': recorder.time * 1000,
+            'queries': recorder.count,
+            'duplicate_queries': sum(count - 1 for _, count in duplicates),
+            'duplicates': duplicates[:DUPLICATES_LIMIT],
+            'serialize_time': profile['serialize_time'] * 1000,
+            'render_time': render_time * 1000,
+            'timestamp': time.time(),
+        }
+        add_record(record)
+
+        response['Server-Timing'] = (
+            f'total;dur={record["time"]:.1f}, '
+            f'db;dur={record["db_time"]:.1f};desc="{record["queries"]} queries", '
+            f'serialize;dur={record["serialize_time"]:.1f}, '
+            f'render;dur={record["render_time"]:.1f}'
+        )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        profile = getattr(request, 'profiling', None)
+
+        if profile is not None:
+            profile['view'] = get_view_name(view_func, request.method)
+
+    def process_template_response(self, request, response):
+        profile = getattr(request, 'profiling', None)
+
+        if profile is not None:
+            profile['render_start'] = time.perf_counter()
+
+        return response
+
+
+def percentile(values, share):
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+def summarize(values):
+    values = sorted(values)
+    return {
+        'avg': round(sum(values) / len(values), 2),
+        'p50': round(percentile(values, 0.5), 2),
+        'p95': round(percentile(values, 0.95), 2),
+        'max': round(values[-1], 2),
+    }
+
+
+def get_report():
+    """
+    Summarizes recorded requests per view, the slowest views by the 95th percentile go first.
+    """
+    groups = defaultdict(list)
+
+    for record in get_records():
+        groups[record['view']].append(record)
+
+    report = []
+
+    for view, records in groups.items():
+        worst = max(records, key=lambda record: record['duplicate_queries'])
+        report.append({
+            'view': view,
+            'requests': len(records),
+            'errors': sum(record['status'] >= 500 for record in records),
+            **{
+                field: summarize([record[field] for record in records])
+                for field in ('time', 'db_time', 'queries', 'duplicate_queries', 'serialize_time', 'render_time')
+            },
+            'duplicates': [{'sql': sql, 'count': count} for sql, count in worst['duplicates']],
+        })
+
+    return sorted(report, key=lambda item: item['time']['p95'], reverse=True)
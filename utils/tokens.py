@@ -0,0 +1,70 @@
+import hashlib
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models.fields.files import FieldFile
+from rest_framework.authtoken.models import Token
+
+# the password hash is never put into the cache, it is loaded on access like any deferred field
+EXCLUDED_USER_FIELDS = {'password'}
+
+# kept in place of forgotten tokens, so requests which loaded a token before it was forgotten do not cache it again
+TOKEN_TOMBSTONE = 'forgotten'
+
+
+def get_token_cache_key(key):
+    # tokens are credentials, so they are not stored in cache keys as is
+    return f'auth:token:{hashlib.sha256(key.encode()).hexdigest()}'
+
+
+def get_token_cache_timeout():
+    return getattr(settings, 'AUTH_TOKEN_CACHE_TIMEOUT', 300)
+
+
+def get_token_tombstone_timeout():
+    return getattr(settings, 'AUTH_TOKEN_TOMBSTONE_TIMEOUT', 30)
+
+
+def get_user_snapshot_fields():
+    return [field.attname for field in get_user_model()._meta.concrete_fields
+            if field.attname not in EXCLUDED_USER_FIELDS]
+
+
+def get_snapshot_value(user, field):
+    value = getattr(user, field)
+    # files refer to their instance, only the name is cached
+    return value.name if isinstance(value, FieldFile) else value
+
+
+def cache_token(user, token):
+    """
+    Keeps the token with the non-secret fields of its user for AUTH_TOKEN_CACHE_TIMEOUT seconds,
+    unless it is cached already or was forgotten in the last AUTH_TOKEN_TOMBSTONE_TIMEOUT seconds.
+    """
+    fields = get_user_snapshot_fields()
+    snapshot = {
+        'user': [get_snapshot_value(user, field) for field in fields],
+        'token': [token.key, token.created],
+    }
+    cache.add(get_token_cache_key(token.key), snapshot, get_token_cache_timeout())
+
+
+def get_cached_token(key):
+    """
+    :return: (user, token) restored from the cache or None when the token is not cached
+    """
+    snapshot = cache.get(get_token_cache_key(key))
+
+    if snapshot is None or snapshot == TOKEN_TOMBSTONE:
+        return None
+
+    user = get_user_model().from_db(None, get_user_snapshot_fields(), snapshot['user'])
+    token = Token.from_db(None, ['key', 'user_id', 'created'], [snapshot['token'][0], user.pk, snapshot['token'][1]])
+    token.user = user
+
+    return user, token
+
+
+def forget_tokens(keys):
+    cache.set_many({get_token_cache_key(key): TOKEN_TOMBSTONE for key in keys}, get_token_tombstone_timeout())